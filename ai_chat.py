@@ -0,0 +1,521 @@
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from tasks import current_token
+
+# -----------------------------------------------------
+# ------------- CONFIGURACIÓN DEL CHAT WEB ------------
+# -----------------------------------------------------
+
+# Backend de la IA: "web" (chat web a través del navegador) u "openai" (API compatible con OpenAI).
+AI_BACKEND = os.environ.get("VA_AI_BACKEND", "web")
+
+AI_CHAT_URL = "https://www.aichatting.net/"     # Página web de la IA.
+AI_INSTRUCTIONS = "Answer in less than 50 words."
+
+OPENAI_BASE_URL = os.environ.get("VA_OPENAI_BASE_URL", "https://api.openai.com/v1")
+OPENAI_API_KEY = os.environ.get("VA_OPENAI_API_KEY", os.environ.get("OPENAI_API_KEY", ""))
+OPENAI_MODEL = os.environ.get("VA_OPENAI_MODEL", "gpt-3.5-turbo")
+OPENAI_MAX_MESSAGES = 20    # Mensajes de la conversación que se reenvían como contexto.
+INPUT_PLACEHOLDER = "Enter text here..."        # Campo donde se escribe la pregunta.
+ANSWER_QUIET_MS = 500       # Sin cambios en la página durante este tiempo, la respuesta ha terminado.
+ANSWER_TIMEOUT_MS = 60000   # Tiempo máximo de espera de una respuesta.
+BROWSER_CALL_TIMEOUT = ANSWER_TIMEOUT_MS / 1000 + 30    # Segundos que se espera al hilo del navegador.
+SENTENCE_END = re.compile(r'[.!?]+["\')]*\s+')     # Final de frase mientras la respuesta se escribe.
+
+# Observa el DOM del chat (MutationObserver) desde que se envía la pregunta. La respuesta es
+# el último <li> añadido tras la pregunta; termina cuando el campo de texto se vuelve a habilitar
+# (señal de la propia web) o, si la web no lo bloquea, tras ANSWER_QUIET_MS sin cambios.
+# next(version) espera al siguiente cambio del texto para poder mostrarlo mientras se escribe.
+ANSWER_OBSERVER_JS = """
+({question, placeholder, quietMs, timeoutMs}) => {
+    const state = {sentAt: performance.now(), firstTokenAt: null, lastChangeAt: null,
+                   text: "", version: 0, result: null, error: null, waiters: []};
+    const before = document.querySelectorAll("li").length;
+    const input = document.querySelector(`[placeholder="${placeholder}"]`);
+    const locked = () => input && (input.disabled || input.readOnly);
+    const isQuestion = (text) => question.trim().startsWith(text) || text.startsWith(question.trim());
+    let wasLocked = false;
+
+    const notify = () => {
+        const waiters = state.waiters;
+        state.waiters = [];
+        waiters.forEach((waiter) => waiter());
+    };
+
+    state.finished = new Promise((resolve, reject) => {
+        let quietTimer = null;
+        let answer = null;
+
+        const finish = () => {
+            observer.disconnect();
+            clearTimeout(quietTimer);
+            clearTimeout(timeoutTimer);
+            state.result = {
+                text: answer.innerText.trim(),
+                firstToken: state.firstTokenAt - state.sentAt,
+                completed: state.lastChangeAt - state.sentAt,
+            };
+            resolve(state.result);
+            notify();
+        };
+
+        const check = () => {
+            const now = performance.now();
+            const items = document.querySelectorAll("li");
+            const last = items.length > before ? items[items.length - 1] : null;
+            const text = last ? last.innerText.trim() : "";
+
+            wasLocked = wasLocked || locked();
+            if (last && text && !isQuestion(text)) {
+                if (answer !== last || text !== state.text) {
+                    state.lastChangeAt = now;
+                    state.text = text;
+                    state.version += 1;
+                    notify();
+                }
+                answer = last;
+                if (state.firstTokenAt === null) state.firstTokenAt = now;
+            }
+            if (!answer || locked()) return;
+
+            clearTimeout(quietTimer);
+            if (wasLocked) finish();
+            else quietTimer = setTimeout(finish, quietMs);
+        };
+
+        const observer = new MutationObserver(check);
+        observer.observe(document.body, {childList: true, subtree: true, characterData: true,
+                                         attributes: true, attributeFilter: ["disabled", "readonly"]});
+        const timeoutTimer = setTimeout(() => {
+            observer.disconnect();
+            state.error = new Error("AI Chat answer timed out.");
+            reject(state.error);
+            notify();
+        }, timeoutMs);
+    });
+    state.finished.catch(() => {});
+
+    state.next = (seen) => new Promise((resolve, reject) => {
+        const answer = () => {
+            if (state.error) reject(state.error);
+            else if (state.result) resolve({...state.result, done: true, version: state.version});
+            else if (state.version > seen) resolve({text: state.text, done: false, version: state.version});
+            else return false;
+            return true;
+        };
+        if (!answer()) state.waiters.push(answer);
+    });
+
+    window.__vaChat = state;
+}
+"""
+
+
+# -----------------------------------------------------
+# ---------------- PÁGINA DEL CHAT WEB ----------------
+# -----------------------------------------------------
+
+class ChatPage:
+    """ Página del chat ya cargada, prestada por el BrowserPool a una funcionalidad.
+
+    Playwright (API síncrona) solo puede usarse desde el hilo que lo arrancó, así que
+    cada método se ejecuta en el hilo del navegador y espera su resultado.
+
+        Args:
+            pool (BrowserPool): Servicio de navegador al que pertenece la página.
+            context: Contexto de Playwright de la página.
+            page: Página de Playwright ya navegada al chat.
+    """
+
+    def __init__(self, pool, context, page):
+        self.pool = pool
+        self.context = context
+        self.page = page
+        self.turns = 0      # Preguntas hechas desde que se creó la página.
+
+    def send(self, text):
+        """ Empieza a observar la página y envía la pregunta al chat. """
+
+        def run(page):
+            page.get_by_placeholder(INPUT_PLACEHOLDER).fill(text, timeout=10000)
+            page.evaluate(ANSWER_OBSERVER_JS, {"question": text,
+                                               "placeholder": INPUT_PLACEHOLDER,
+                                               "quietMs": ANSWER_QUIET_MS,
+                                               "timeoutMs": ANSWER_TIMEOUT_MS})
+            page.get_by_placeholder(INPUT_PLACEHOLDER).press("Enter")
+
+        self.pool.call(run, self.page)
+        self.turns += 1
+
+    def wait_answer(self):
+        """ Espera a que la IA termine de escribir y devuelve su respuesta.
+        Registra en el log el tiempo hasta la primera palabra y hasta el final. """
+
+        result = self.pool.call(lambda page: page.evaluate("() => window.__vaChat.finished"), self.page)
+        self.log_latency(result)
+        return result['text']
+
+    def stream_answer(self):
+        """ Generador que devuelve el texto de la respuesta cada vez que cambia,
+        mientras la IA lo escribe. El último valor es la respuesta completa. """
+
+        version = 0
+        while True:
+            update = self.pool.call(lambda page: page.evaluate("(seen) => window.__vaChat.next(seen)", version),
+                                    self.page)
+            version = update['version']
+
+            if update['done']:
+                self.log_latency(update)
+                yield update['text']
+                return
+            yield update['text']
+
+    def log_latency(self, result):
+        """ Registra en el log la latencia de la pregunta. """
+        logging.info(f"AI Chat turn {self.turns}: first token in {result['firstToken']:.0f} ms, "
+                     f"completed in {result['completed']:.0f} ms.")
+
+
+# -----------------------------------------------------
+# --------------- FRASES DE UNA RESPUESTA -------------
+# -----------------------------------------------------
+
+class SentenceSplitter:
+    """ Separa en frases completas un texto que va creciendo (una respuesta que
+    todavía se está escribiendo), para poder leer cada frase en cuanto termina. """
+
+    def __init__(self):
+        self.spoken = 0     # Caracteres ya entregados como frases.
+
+    def feed(self, text):
+        """ Recibe el texto acumulado y devuelve las frases nuevas ya terminadas.
+        Una frase termina en . ! o ? seguido de un espacio. """
+
+        sentences = []
+        for match in SENTENCE_END.finditer(text, self.spoken):
+            sentence = text[self.spoken:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            self.spoken = match.end()
+        return sentences
+
+    def flush(self, text):
+        """ Devuelve lo que quede del texto final como última frase. """
+
+        rest = text[self.spoken:].strip()
+        self.spoken = len(text)
+        return [rest] if rest else []
+
+
+# -----------------------------------------------------
+# --------------- NAVEGADOR EN SEGUNDO PLANO ----------
+# -----------------------------------------------------
+
+class BrowserCallCancelled(Exception):
+    """ La tarea se ha cancelado mientras esperaba al hilo del navegador. """
+
+
+class BrowserPool:
+    """ Servicio de navegador en segundo plano. Arranca Chromium una sola vez y
+    mantiene una o varias páginas ya navegadas al chat, listas para prestarlas a
+    ai_func. Al devolverlas se recargan para la siguiente conversación, y se
+    recrean tras max_turns preguntas o si han fallado.
+
+        Args:
+            url (str, optional): Página del chat que se precarga.
+            size (int, optional): Número de páginas precargadas.
+            max_turns (int, optional): Preguntas tras las que se recrea una página.
+            headless (bool, optional): Si el navegador es invisible para el usuario.
+    """
+
+    def __init__(self, url=AI_CHAT_URL, size=1, max_turns=20, headless=True):
+        self.url = url
+        self.size = size
+        self.max_turns = max_turns
+        self.headless = headless
+        self.commands = queue.Queue()   # Órdenes para el hilo del navegador.
+        self.idle = queue.Queue()       # Páginas listas para usarse.
+        self.lock = threading.Lock()
+        self.thread = None
+        self.browser = None
+
+    def start(self):
+        """ Arranca el hilo del navegador y precarga las páginas (solo la primera vez). """
+
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="BrowserPool", daemon=True)
+                self.thread.start()
+                for _ in range(self.size):
+                    self.submit(self.open_page)
+
+    def submit(self, func, *args):
+        """ Encola una orden para el hilo del navegador y devuelve su Future. """
+
+        future = Future()
+        self.commands.put((func, args, future))
+        return future
+
+    def call(self, func, *args, timeout=BROWSER_CALL_TIMEOUT):
+        """ Ejecuta func en el hilo del navegador y espera su resultado. Si la página se
+        queda colgada, deja de esperar tras timeout segundos (TimeoutError) o en cuanto
+        se cancela la tarea actual (BrowserCallCancelled), para no bloquear su hilo. """
+
+        if threading.current_thread() is self.thread:
+            return func(*args)
+
+        future = self.submit(func, *args)
+        token = current_token()
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return future.result(timeout=max(0, min(0.1, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                if token.cancelled():
+                    raise BrowserCallCancelled("The browser call has been cancelled.")
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"The browser did not answer in {timeout:g} s.")
+
+    def acquire(self, timeout=60):
+        """ Presta una página del chat ya cargada. """
+
+        self.start()
+        chat_page = self.idle.get(timeout=timeout)
+        if isinstance(chat_page, Exception):    # No se pudo precargar la página.
+            self.submit(self.open_page)
+            raise chat_page
+        return chat_page
+
+    def release(self, chat_page, failed=False):
+        """ Devuelve una página al pool. Se recarga (conversación nueva) o se
+        recrea si ha fallado o ya ha superado max_turns preguntas. """
+
+        if failed or chat_page.turns >= self.max_turns:
+            self.submit(self.recycle_page, chat_page)
+        else:
+            self.submit(self.reload_page, chat_page)
+
+    def stop(self):
+        """ Cierra el navegador y detiene el hilo. """
+
+        if self.thread is not None and self.thread.is_alive():
+            self.commands.put((None, (), None))
+            self.thread.join(timeout=10)
+
+    # --- Métodos que se ejecutan en el hilo del navegador ---
+
+    def run(self):
+        """ Bucle del hilo del navegador: ejecuta las órdenes encoladas. """
+
+        from playwright.sync_api import sync_playwright
+
+        with sync_playwright() as playwright:
+            try:
+                self.browser = playwright.chromium.launch(headless=self.headless)
+                logging.info("AI Chat browser has been launched.")
+            except Exception as e:
+                logging.error(f"Failed to launch AI Chat browser: {str(e)}")
+
+            while True:
+                func, args, future = self.commands.get()
+
+                if func is None:    # Señal de parada.
+                    break
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                try:
+                    future.set_result(func(*args))
+                except Exception as e:
+                    future.set_exception(e)
+
+            if self.browser is not None:
+                self.browser.close()
+
+    def open_page(self):
+        """ Crea un contexto nuevo con una página navegada al chat y la deja lista. """
+
+        try:
+            if self.browser is None:
+                raise RuntimeError("AI Chat browser is not available.")
+
+            context = self.browser.new_context()
+            page = context.new_page()
+            page.goto(self.url)
+            self.idle.put(ChatPage(self, context, page))
+
+        except Exception as e:
+            logging.error(f"Failed to prepare AI Chat page: {str(e)}")
+            self.idle.put(e)
+
+    def reload_page(self, chat_page):
+        """ Vuelve a cargar el chat para empezar una conversación nueva. """
+
+        try:
+            chat_page.page.goto(self.url)
+            self.idle.put(chat_page)
+        except Exception as e:
+            logging.warning(f"Failed to reload AI Chat page: {str(e)}")
+            self.recycle_page(chat_page)
+
+    def recycle_page(self, chat_page):
+        """ Descarta el contexto de la página y prepara uno nuevo. """
+
+        try:
+            chat_page.context.close()
+        except Exception as e:
+            logging.warning(f"Failed to close AI Chat page: {str(e)}")
+        self.open_page()
+
+
+browser_pool = BrowserPool()    # Navegador compartido por la funcionalidad AI Chat.
+
+
+# -----------------------------------------------------
+# ------------------- BACKENDS DE LA IA ---------------
+# -----------------------------------------------------
+
+class WebChatBackend:
+    """ Backend que usa el chat web a través del navegador en segundo plano. """
+
+    def __init__(self, pool=browser_pool):
+        self.pool = pool
+
+    def start(self):
+        """ Arranca el navegador y precarga el chat. """
+        self.pool.start()
+
+    def new_conversation(self):
+        return WebConversation(self.pool)
+
+
+class WebConversation:
+    """ Conversación en una página del chat web prestada por el BrowserPool. """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.chat_page = pool.acquire()
+
+    def stream(self, question):
+        """ Envía la pregunta y devuelve el texto de la respuesta cada vez que cambia. """
+
+        self.chat_page.send(f"{question}. {AI_INSTRUCTIONS}")
+        yield from self.chat_page.stream_answer()
+
+    def close(self, failed=False):
+        """ Devuelve la página al navegador (se recrea si ha fallado). """
+        self.pool.release(self.chat_page, failed)
+
+
+class OpenAIBackend:
+    """ Backend que habla directamente con cualquier API compatible con OpenAI
+    (/chat/completions), incluida una local. Todas las conversaciones comparten
+    una sesión HTTP que mantiene las conexiones abiertas.
+
+        Args:
+            base_url (str, optional): URL base de la API (por ejemplo, http://localhost:8000/v1).
+            api_key (str, optional): Clave de la API.
+            model (str, optional): Modelo que responde.
+    """
+
+    def __init__(self, base_url=OPENAI_BASE_URL, api_key=OPENAI_API_KEY, model=OPENAI_MODEL):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.session = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """ Prepara la sesión HTTP compartida. """
+
+        with self.lock:
+            if self.session is None:
+                import requests
+
+                self.session = requests.Session()
+                self.session.mount(self.base_url, requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4))
+                if self.api_key:
+                    self.session.headers["Authorization"] = f"Bearer {self.api_key}"
+        return self.session
+
+    def new_conversation(self):
+        return OpenAIConversation(self)
+
+
+class OpenAIConversation:
+    """ Conversación con una API compatible con OpenAI. Guarda los mensajes
+    anteriores para que la IA mantenga el contexto entre preguntas. """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.messages = [{"role": "system", "content": AI_INSTRUCTIONS}]
+        self.turns = 0
+
+    def stream(self, question):
+        """ Envía la pregunta y devuelve el texto de la respuesta a medida que llegan los tokens. """
+
+        import requests
+
+        session = self.backend.start()
+        asked = {"role": "user", "content": question}
+        self.turns += 1
+
+        # Instrucciones y últimos mensajes de la conversación. La pregunta solo pasa al
+        # historial junto con su respuesta: si la petición falla, no queda una pregunta suelta.
+        messages = self.messages[:1] + (self.messages[1:] + [asked])[-OPENAI_MAX_MESSAGES:]
+        start = time.perf_counter()
+        first_token = None
+        text = ""
+
+        try:
+            with session.post(f"{self.backend.base_url}/chat/completions",
+                              json={"model": self.backend.model, "messages": messages, "stream": True},
+                              stream=True, timeout=(5, 60)) as response:
+                response.raise_for_status()
+
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                        text += delta
+                        yield text
+
+        except requests.ConnectionError as e:
+            raise ConnectionError(str(e)) from e
+
+        logging.info(f"AI Chat turn {self.turns}: first token in {((first_token or start) - start) * 1e3:.0f} ms, "
+                     f"completed in {(time.perf_counter() - start) * 1e3:.0f} ms.")
+
+        if not text:
+            raise RuntimeError("AI Chat returned an empty answer.")
+        self.messages += [asked, {"role": "assistant", "content": text}]
+
+    def close(self, failed=False):
+        """ La sesión HTTP se mantiene abierta para la siguiente conversación. """
+
+
+def get_ai_backend(name=AI_BACKEND):
+    """ Devuelve el backend de la IA configurado. """
+
+    if name == "openai":
+        return OpenAIBackend()
+    return WebChatBackend()
+
+
+ai_backend = get_ai_backend()   # Backend de la IA que usa la funcionalidad AI Chat.
+
@@ -0,0 +1,1279 @@
+import audioop
+import datetime
+import glob
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ai_chat
+import dates
+import google_services
+import gui
+import intents
+import journal
+import recognition
+import voice
+
+# -----------------------------------------------------
+# ------------------- MICROBENCHMARKS -----------------
+# -----------------------------------------------------
+# Uso: python benchmarks.py [nombre]   (sin nombre ejecuta todos)
+
+def timeit(func, repeat):
+    """ Ejecuta func repeat veces y devuelve el tiempo medio en microsegundos. """
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+# -----------------------------------------------------
+# ----------------- COLISIONES (HOVER) ----------------
+# -----------------------------------------------------
+
+def bench_hit_test(width=1920, height=1080):
+    """ Compara el índice de colisiones con el método de áreas de is_inside_polygon
+    y comprueba que ambos dan la misma respuesta en todos los píxeles del asistente. """
+
+    # Misma disposición que el tamaño "large" de main.py, sin necesidad de ventana.
+    size = {"menu": [width - 300, height - 400, 270], "off": [width - 380, height - 235, 120],
+            "corner": [width - 200, height - 200, 200], "bg_log": [width - 170, height - 450, 200]}
+
+    coor_off = gui.Diamond(None, *size["off"], gui.COLOR1).get_screen_coordinates()
+    coor_corner = gui.Triangle(None, *size["corner"], gui.COLOR1).get_screen_coordinates()
+    coor_log = gui.Diamond(None, *size["bg_log"], gui.COLOR1).get_screen_coordinates()
+    polygons = (coor_off, coor_corner, coor_log, *gui.coor_submenu(size["menu"]))
+
+    start = time.perf_counter()
+    index = gui.HitTestIndex(polygons)
+    build_ms = (time.perf_counter() - start) * 1e3
+
+    # Rejilla densa: cada píxel del área del índice y un margen alrededor.
+    points = [(x, y) for x in range(index.x0 - 10, index.x0 + index.width + 10)
+              for y in range(index.y0 - 10, index.y0 + index.height + 10)]
+
+    mismatches = 0
+    for point in points:
+        expected = 0
+        for bit, polygon in enumerate(polygons):
+            if gui.is_inside_polygon(point, polygon):
+                expected |= 1 << bit
+        if index.lookup(point) != expected:
+            mismatches += 1
+
+    mouse_pos = (width - 165, height - 265)
+
+    def area_method():
+        for polygon in polygons:
+            gui.is_inside_polygon(mouse_pos, polygon)
+
+    area_us = timeit(area_method, 20000)
+    index_us = timeit(lambda: index.lookup(mouse_pos), 20000)
+
+    print(f"hit_test: {len(points)} points checked, {mismatches} mismatches")
+    print(f"hit_test: index build {build_ms:.1f} ms")
+    print(f"hit_test: area method {area_us:.2f} us/frame, index {index_us:.2f} us/frame")
+
+    return mismatches == 0
+
+
+# -----------------------------------------------------
+# ------------ MENSAJES A LA BARRA DE DIÁLOGO ---------
+# -----------------------------------------------------
+
+def bench_dialogue_bus(workers=4, updates=300, fps=20):
+    """ Varios hilos publican textos en la barra de diálogo tan rápido como pueden mientras
+    un bucle a fps frames por segundo los dibuja: mide el coste de publicar, cuántas
+    actualizaciones se llegan a dibujar y comprueba que el último estado es el que se ve. """
+    import pygame
+
+    pygame.font.init()
+    screen = pygame.Surface((1920, 1080))
+    bus = gui.DialogueBus()
+
+    post = timeit(lambda: bus.add_text(["Benchmark", "post"]), 10000)
+    bus.drain()
+
+    def worker(n):
+        for i in range(updates):
+            bus.add_text([f"Worker {n}", f"Update {i}"])
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    def frame():    # Lo que hace el bucle principal en cada frame.
+        message = bus.drain()
+        if message is not None:
+            bar = gui.Bar(screen, 1020, 800, 600)
+            if message[0] == "show":
+                bar.add_text(message[1])
+            else:
+                bar.undo()
+        time.sleep(1 / fps)
+        return message
+
+    frames = drawn = 0
+    start = time.perf_counter()
+    while any(thread.is_alive() for thread in threads):
+        drawn += frame() is not None
+        frames += 1
+
+    bus.undo()      # Al terminar, la barra se vacía: es lo último que se debe ver.
+    last = frame()
+    elapsed = time.perf_counter() - start
+
+    posted = workers * updates
+    print(f"dialogue_bus: post {post:.2f} us, {posted} updates from {workers} threads drawn "
+          f"in {drawn} of {frames} frames ({elapsed:.1f} s)")
+
+    return drawn <= frames and last == ("clear", None)
+
+
+# -----------------------------------------------------
+# ----------------- COLA DE LOCUCIONES ----------------
+# -----------------------------------------------------
+
+def bench_tts_queue(utterances=200):
+    """ Mide la latencia de la cola del hilo de voz con un motor silencioso:
+    tiempo desde que se encola una locución hasta que empieza y termina. """
+
+    worker = voice.SpeechWorker(backend=voice.SilentBackend)
+    worker.speak("warm up").result()    # El motor se inicializa una sola vez.
+
+    futures = [worker.speak(f"utterance number {i}") for i in range(utterances)]
+    for future in futures:
+        future.result()
+
+    # Una locución urgente adelanta a las pendientes.
+    worker.backend.seconds_per_word = 0.001
+    pending = [worker.speak(f"normal {i}") for i in range(20)]
+    urgent = worker.speak("urgent", voice.PRIORITY_HIGH)
+    urgent.result()
+    overtaken = sum(1 for future in pending if not future.done())
+
+    # Cancelar descarta todo lo pendiente.
+    pending = [worker.speak(f"flushed {i}") for i in range(20)]
+    worker.cancel()
+    cancelled = sum(1 for future in pending if future.cancelled())
+
+    # Cancelar corta la locución en curso, que no cuenta como dicha.
+    worker.backend.seconds_per_word = 0.05
+    playing = worker.speak("a long sentence that is still playing when it gets cancelled")
+    while not playing.running():
+        time.sleep(0.001)
+    worker.cancel()
+    interrupted = isinstance(playing.exception(timeout=1), voice.SpeechInterrupted)
+    after = worker.speak("after cancel")    # Lo que se pide después suena entero.
+    worker.backend.seconds_per_word = 0
+    after.result(timeout=1)
+    worker.stop()
+
+    waits = [(future.started_at - future.queued_at) * 1e3 for future in futures]
+    print(f"tts_queue: {utterances} utterances, mean queue wait {sum(waits) / len(waits):.3f} ms, "
+          f"max {max(waits):.3f} ms")
+    print(f"tts_queue: urgent utterance overtook {overtaken} pending, cancel flushed {cancelled}, "
+          f"playing utterance interrupted: {interrupted}")
+
+    return overtaken > 0 and cancelled > 0 and interrupted
+
+
+# -----------------------------------------------------
+# ------------ SERVICIOS DE GOOGLE (LOCAL) ------------
+# -----------------------------------------------------
+
+class LocalServer:
+    """ Servidor HTTP local que sustituye a un servicio remoto en los benchmarks.
+    handler recibe (método, ruta, cuerpo) y devuelve (estado, cabeceras, cuerpo). """
+
+    def __init__(self, handler):
+        self.requests = []
+        self.connections = set()    # Conexiones distintas (puerto del cliente).
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # Permite reutilizar la conexión (keep-alive).
+
+            def do_GET(self):
+                self.respond("GET")
+
+            def do_POST(self):
+                self.respond("POST")
+
+            def respond(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                server.requests.append((method, self.path))
+                server.connections.add(self.client_address[1])
+                status, headers, content = handler(method, self.path, body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+def bench_discovery():
+    """ Comprueba que cada servicio de Google se construye una sola vez y que los
+    documentos de descubrimiento se descargan solo si no hay copia vigente en disco. """
+
+    from google.oauth2.credentials import Credentials
+    from googleapiclient import discovery_cache
+
+    def handler(method, path, body):    # /calendar/v3 -> documento incluido en googleapiclient.
+        api, version = path.strip("/").split("/")
+        return 200, {"Content-Type": "application/json"}, discovery_cache.get_static_doc(api, version).encode()
+
+    server = LocalServer(handler)
+    credentials = Credentials(token="fake-token")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        def registry(ttl=google_services.DISCOVERY_TTL):
+            return google_services.GoogleServices(lambda: credentials, cache_dir=cache_dir, ttl=ttl,
+                                                  discovery_url=server.url + "/{api}/{version}")
+
+        services = registry()
+        start = time.perf_counter()
+        for _ in range(10):
+            services.get("calendar", "v3")
+            services.get("gmail", "v1")
+        first_ms = (time.perf_counter() - start) * 1e3
+        first_fetches = len(server.requests)
+
+        restarted = registry()      # Nuevo proceso: usa la copia en disco.
+        start = time.perf_counter()
+        restarted.get("calendar", "v3")
+        restarted.get("gmail", "v1")
+        disk_ms = (time.perf_counter() - start) * 1e3
+        disk_fetches = len(server.requests) - first_fetches
+
+        expired = registry(ttl=0)   # Copia caducada: se vuelve a descargar.
+        expired.get("calendar", "v3")
+        expired_fetches = len(server.requests) - first_fetches - disk_fetches
+
+    server.close()
+
+    print(f"discovery: 20 get() calls -> {first_fetches} fetches, {first_ms:.1f} ms")
+    print(f"discovery: restart with disk cache -> {disk_fetches} fetches, {disk_ms:.1f} ms")
+    print(f"discovery: expired TTL -> {expired_fetches} fetches")
+
+    return first_fetches == 2 and disk_fetches == 0 and expired_fetches == 1
+
+
+def bench_mail_batch(messages=60):
+    """ Obtiene las cabeceras de varios correos con la petición por lotes de Gmail
+    contra un servidor local y comprueba que se resuelven en un único intercambio HTTP. """
+
+    from google.oauth2.credentials import Credentials
+    from googleapiclient import discovery_cache
+    from googleapiclient.discovery import build_from_document
+
+    def handler(method, path, body):    # Responde a cada parte del lote multipart/mixed.
+        boundary = re.search(rb"--(=+\d+==)", body).group(1)
+        parts = []
+
+        for part in body.split(b"--" + boundary)[1:-1]:
+            content_id = re.search(rb"Content-ID: <(.+?)>", part).group(1).decode()
+            msg_id = re.search(rb"GET /gmail/v1/users/me/messages/(\w+)", part).group(1).decode()
+            message = {"id": msg_id, "payload": {"headers": [
+                {"name": "From", "value": f"sender{msg_id}@example.com"},
+                {"name": "Date", "value": "Mon, 1 May 2023 10:00:00 +0200"},
+                {"name": "Subject", "value": f"Subject {msg_id}"}]}}
+            content = json.dumps(message)
+            parts.append(f"--batch_reply\r\nContent-Type: application/http\r\n"
+                         f"Content-ID: <response-{content_id}>\r\n\r\n"
+                         f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(content)}\r\n\r\n{content}\r\n")
+
+        content = ("".join(parts) + "--batch_reply--\r\n").encode()
+        return 200, {"Content-Type": "multipart/mixed; boundary=batch_reply"}, content
+
+    server = LocalServer(handler)
+    document = json.loads(discovery_cache.get_static_doc("gmail", "v1"))
+    document["rootUrl"] = server.url + "/"
+    service = build_from_document(document, credentials=Credentials(token="fake-token"))
+
+    ids = [f"m{i}" for i in range(messages)]
+    start = time.perf_counter()
+    summaries = google_services.fetch_email_summaries(service, ids)
+    elapsed_ms = (time.perf_counter() - start) * 1e3
+    server.close()
+
+    correct = all(src == f"sender{msg_id}@example.com" and subject == f"Subject {msg_id}"
+                  for msg_id, (src, date, subject) in zip(ids, summaries))
+
+    print(f"mail_batch: {messages} summaries in {len(server.requests)} HTTP request(s), {elapsed_ms:.1f} ms")
+
+    return correct and len(summaries) == messages and len(server.requests) == 1
+
+
+class FakeCalendar:
+    """ Imitación de la API de Google Calendar (events().list) con sincronización
+    incremental: cada token devuelve solo los cambios posteriores a él. """
+
+    def __init__(self):
+        self.changes = []       # Historial de cambios (evento completo o borrado).
+        self.calls = []
+        self.expired = set()    # Tokens que el servidor considera caducados (410).
+
+    def put(self, event_id, start, hours=1, status="confirmed"):
+        end = start + datetime.timedelta(hours=hours)
+        self.changes.append({"id": event_id, "status": status, "summary": f"Event {event_id}",
+                             "start": {"dateTime": start.isoformat()}, "end": {"dateTime": end.isoformat()}})
+
+    def events(self):
+        return self
+
+    def list(self, calendarId, singleEvents=None, syncToken=None, pageToken=None):
+        self.calls.append(syncToken)
+        fake = self
+
+        class Request:
+            def execute(self, http=None):
+                if syncToken in fake.expired:
+                    import httplib2
+                    from googleapiclient.errors import HttpError
+                    raise HttpError(httplib2.Response({"status": 410}), b"Sync token is no longer valid")
+
+                if syncToken is None:   # Sincronización completa: estado final sin borrados.
+                    latest = {event["id"]: event for event in fake.changes}
+                    items = [event for event in latest.values() if event["status"] != "cancelled"]
+                else:
+                    items = fake.changes[int(syncToken):]
+
+                offset = int(pageToken or 0)
+                response = {"items": items[offset:offset + 100]}
+                if offset + 100 < len(items):
+                    response["nextPageToken"] = str(offset + 100)
+                else:
+                    response["nextSyncToken"] = str(len(fake.changes))
+                return response
+
+        return Request()
+
+
+def bench_calendar_sync(events=2000):
+    """ Sincroniza una copia local del calendario contra una API imitada y mide
+    cuánto tarda en responder "show my next events" desde la copia local. """
+
+    fake = FakeCalendar()
+    now = datetime.datetime.now().astimezone()
+    for i in range(events):
+        fake.put(f"e{i}", now + datetime.timedelta(hours=i - events // 2))
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = google_services.CalendarStore(path=f"{directory}/calendar.db")
+
+        start = time.perf_counter()
+        full = store.sync(fake)
+        full_ms = (time.perf_counter() - start) * 1e3
+
+        # Cambios en el servidor: un evento nuevo, uno movido y uno borrado.
+        fake.put("new", now + datetime.timedelta(minutes=30))
+        fake.put(f"e{events // 2 + 1}", now + datetime.timedelta(days=400))
+        fake.put(f"e{events // 2 + 2}", now, status="cancelled")
+        incremental = store.sync(fake)
+
+        start = time.perf_counter()
+        for _ in range(100):
+            upcoming = store.events(limit=5)
+        query_ms = (time.perf_counter() - start) * 1e3 / 100
+
+        window = store.events(time_max=now + datetime.timedelta(days=2))
+
+        fake.expired.add(store.sync_token())    # El servidor invalida el token: 410.
+        resync = store.sync(fake)
+        store.db.close()
+
+    ids = [event["id"] for event in upcoming]
+    print(f"calendar_sync: full sync of {full} events {full_ms:.1f} ms, incremental sync {incremental} changes")
+    print(f"calendar_sync: next 5 events from the store in {query_ms:.3f} ms -> {ids}")
+    print(f"calendar_sync: {len(window)} events in the next 2 days, 410 resync -> {resync} events")
+
+    return (incremental == 3 and ids[0] == f"e{events // 2}" and "new" in ids
+            and f"e{events // 2 + 2}" not in ids and resync == events)
+
+
+# -----------------------------------------------------
+# ------------------ ARRANQUE DE LA APP ---------------
+# -----------------------------------------------------
+
+# Reproduce el arranque de main.py (sin las llamadas a win32) hasta el primer frame.
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import pygame
+import gui
+import journal
+import ui_functions
+imported = time.perf_counter()
+pygame.init()
+screen = pygame.display.set_mode((1920, 1080))
+scene = gui.Scene(screen)
+size = {"menu": [1695, 780, 202], "off": [1635, 904, 90], "corner": [1770, 930, 150],
+        "bg_log": [1793, 743, 150], "bg_dec": [1673, 930, 225], "bar": [1020, 830, 600]}
+scene.update({"small": size}, "small", True)
+scene.draw()
+pygame.display.update(gui.dirty.pop_all())
+print((imported - start) * 1e3, (time.perf_counter() - start) * 1e3)
+"""
+
+
+def bench_startup(slowest=8):
+    """ Mide el tiempo hasta el primer frame del asistente y muestra, al estilo de
+    python -X importtime, los módulos que más tardan en importarse al arrancar. """
+
+    env = dict(os.environ, SDL_VIDEODRIVER=os.environ.get("SDL_VIDEODRIVER", "dummy"))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+                            capture_output=True, text=True, env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        print(result.stderr.strip().splitlines()[-1])
+        return False
+
+    imports_ms, first_frame_ms = map(float, result.stdout.strip().splitlines()[-1].split())
+
+    # Líneas "import time: propio | acumulado | módulo" de los módulos de primer nivel.
+    top_level = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S.*)", line)
+        if match and not match.group(2).startswith(" "):
+            top_level.append((int(match.group(1)) / 1e3, match.group(2)))
+
+    print(f"startup: imports {imports_ms:.1f} ms, time to first frame {first_frame_ms:.1f} ms")
+    for elapsed, module in sorted(top_level, reverse=True)[:slowest]:
+        print(f"startup:   {elapsed:8.1f} ms  {module}")
+
+    return True
+
+
+# -----------------------------------------------------
+# ------------------ NAVEGADOR AI CHAT ----------------
+# -----------------------------------------------------
+
+# Página local que imita el chat web: la respuesta aparece en el siguiente <li>
+# y el campo de texto se bloquea mientras la "IA" escribe.
+CHAT_PAGE_HTML = """<!DOCTYPE html>
+<html><body>
+<ul id="chat"><li><span>Hello! How can I help you?</span></li></ul>
+<input placeholder="Enter text here...">
+<script>
+const input = document.querySelector("input");
+const chat = document.getElementById("chat");
+function add(text) {
+    const li = document.createElement("li");
+    const span = document.createElement("span");
+    span.textContent = text;
+    li.appendChild(span);
+    chat.appendChild(li);
+    return span;
+}
+input.addEventListener("keydown", (event) => {
+    if (event.key !== "Enter") return;
+    const question = input.value;
+    add(question);
+    input.value = "";
+    input.disabled = true;
+    const words = ("You asked: " + question.split(".")[0] + ". This is a local answer.").split(" ");
+    const span = add("");
+    let i = 0;
+    const timer = setInterval(() => {
+        span.textContent += (i ? " " : "") + words[i++];
+        if (i === words.length) { clearInterval(timer); input.disabled = false; }
+    }, 20);
+});
+</script>
+</body></html>"""
+
+
+def bench_browser_pool(turns=3):
+    """ Compara el arranque en frío del navegador con una página precargada por el
+    BrowserPool, usando una página local en lugar del chat web. """
+
+    server = LocalServer(lambda method, path, body: (200, {"Content-Type": "text/html"}, CHAT_PAGE_HTML.encode()))
+    pool = ai_chat.BrowserPool(url=server.url, size=1, max_turns=turns + 1)
+
+    start = time.perf_counter()
+    chat_page = pool.acquire()
+    cold_ms = (time.perf_counter() - start) * 1e3
+
+    answers = []
+    for turn in range(turns):
+        chat_page.send(f"question {turn}. Answer in less than 50 words.")
+        answers.append(chat_page.wait_answer())
+
+    # Respuesta en streaming: primera frase completa frente a la respuesta completa.
+    splitter = ai_chat.SentenceSplitter()
+    first_sentence_ms = None
+    start = time.perf_counter()
+    chat_page.send("streamed question. Answer in less than 50 words.")
+    for partial in chat_page.stream_answer():
+        if first_sentence_ms is None and splitter.feed(partial):
+            first_sentence_ms = (time.perf_counter() - start) * 1e3
+    streamed_ms = (time.perf_counter() - start) * 1e3
+
+    pool.release(chat_page)     # Alcanza max_turns: se recrea el contexto.
+
+    start = time.perf_counter()
+    chat_page = pool.acquire()
+    warm_ms = (time.perf_counter() - start) * 1e3
+    recycled = chat_page.turns == 0
+    pool.release(chat_page)
+
+    pool.stop()
+    server.close()
+
+    print(f"browser_pool: cold start {cold_ms:.0f} ms, prewarmed page {warm_ms:.1f} ms")
+    print(f"browser_pool: answers {answers}")
+    print(f"browser_pool: streaming first sentence after {first_sentence_ms:.0f} ms, "
+          f"whole answer after {streamed_ms:.0f} ms")
+
+    return recycled and all(f"You asked: question {turn}" in answer for turn, answer in enumerate(answers))
+
+
+def bench_ai_http(turns=5):
+    """ Conversa con una API compatible con OpenAI servida en local: comprueba que se
+    mantiene el contexto entre preguntas, que se reutiliza la conexión y mide la
+    latencia de cada pregunta. """
+
+    def handler(method, path, body):    # Responde en streaming (SSE) palabra a palabra.
+        messages = json.loads(body)["messages"]
+        questions = [message["content"] for message in messages if message["role"] == "user"]
+        answer = f"This is answer {len(questions)} to {questions[-1]}. Bye."
+
+        chunks = [json.dumps({"choices": [{"delta": {"content": word + " "}}]}) for word in answer.split()]
+        content = "".join(f"data: {chunk}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+        return 200, {"Content-Type": "text/event-stream"}, content.encode()
+
+    server = LocalServer(handler)
+    backend = ai_chat.OpenAIBackend(base_url=server.url + "/v1", api_key="local", model="local")
+    conversation = backend.new_conversation()
+
+    answers = []
+    latencies = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        for partial in conversation.stream(f"question {turn}"):
+            pass
+        latencies.append((time.perf_counter() - start) * 1e3)
+        answers.append(partial.strip())
+    server.close()
+
+    print(f"ai_http: {turns} turns over {len(server.connections)} connection(s), "
+          f"mean {sum(latencies) / turns:.1f} ms per turn")
+    print(f"ai_http: last answer {answers[-1]!r}")
+
+    return (len(server.connections) == 1
+            and all(answer.startswith(f"This is answer {turn + 1} to question {turn}.")
+                    for turn, answer in enumerate(answers)))
+
+
+# -----------------------------------------------------
+# ------------------ CAPTURA DE AUDIO -----------------
+# -----------------------------------------------------
+
+def write_wav(path, segments, sample_rate=16000):
+    """ Genera un WAV mono de 16 bits. segments es una lista de (segundos, amplitud del
+    tono, amplitud del ruido); el ruido es una onda aleatoria determinista. """
+
+    samples = []
+    seed = 1
+    for seconds, tone, noise in segments:
+        for i in range(int(seconds * sample_rate)):
+            seed = (seed * 1103515245 + 12345) % 2**31
+            value = tone * math.sin(2 * math.pi * 440 * i / sample_rate) + noise * (seed / 2**30 - 1)
+            samples.append(int(value).to_bytes(2, "little", signed=True))
+
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b"".join(samples))
+
+
+class SwitchSource:
+    """ Fuente de audio en tiempo real que entrega un tono mientras loud está activo
+    y un ruido suave el resto del tiempo. """
+
+    sample_rate = 16000
+    sample_width = 2
+    chunk = 320     # 20 ms.
+
+    def __init__(self):
+        self.loud = False
+        tone = [int(3000 * math.sin(2 * math.pi * 440 * i / self.sample_rate)) for i in range(self.chunk)]
+        self.tone = b"".join(value.to_bytes(2, "little", signed=True) for value in tone)
+        self.quiet = b"".join((20 * (i % 3 - 1)).to_bytes(2, "little", signed=True) for i in range(self.chunk))
+
+    def read(self):
+        time.sleep(self.chunk / self.sample_rate)
+        return self.tone if self.loud else self.quiet
+
+    def close(self):
+        pass
+
+
+def bench_audio_capture(utterances=4):
+    """ Reproduce un WAV con varias frases (tonos) sobre un ruido de fondo creciente a
+    través del servicio de captura: comprueba que se detectan todas, que la calibración
+    se hace una sola vez y que el umbral sigue al ruido. Después comprueba que un aviso
+    sonoro que termina en start_at no forma parte de la intervención. """
+
+    path = os.path.join(tempfile.mkdtemp(), "utterances.wav")
+    segments = [(1.0, 0, 40)]
+    for i in range(utterances):
+        noise = 40 + 15 * (i + 1)   # El ruido de fondo sube poco a poco.
+        segments += [(0.6, 3000, noise), (1.5, 0, noise)]
+    write_wav(path, segments)
+
+    capture = voice.AudioCapture(source=lambda: voice.WavSource(path, speed=4, chunk=512))
+    start = time.perf_counter()
+    capture.start()
+    capture.ready.wait()
+    calibration = (time.perf_counter() - start) * 1e3
+
+    detected = []
+    thresholds = []     # Umbral de energía tras cada frase.
+    start_at = 0
+    while True:
+        try:
+            utterance = capture.listen(timeout=2, start_at=start_at)
+        except voice.ListenTimeout:
+            break
+        detected.append(utterance.duration())
+        thresholds.append(capture.energy_threshold)
+        start_at = utterance.ended_at
+
+    # Sin recalibrar: el tiempo hasta empezar a escuchar es solo el de buscar en el buffer.
+    listen_start = timeit(lambda: capture.first_frame_after(time.monotonic()), 1000)
+    capture.stop()
+
+    # Se empieza a escuchar mientras suena el aviso (200 ms); la voz llega 200 ms después.
+    source = SwitchSource()
+    capture = voice.AudioCapture(source=lambda: source)
+    capture.start()
+    capture.ready.wait()
+
+    def speak():
+        time.sleep(0.2)
+        source.loud = False
+        time.sleep(0.2)
+        source.loud = True
+        time.sleep(0.5)
+        source.loud = False
+
+    source.loud = True
+    start_at = time.monotonic() + 0.2
+    threading.Thread(target=speak, daemon=True).start()
+    utterance = capture.listen(timeout=2, start_at=start_at)
+    capture.stop()
+    cue_offset = utterance.started_at - start_at    # Debe ser ~0.2 s, nunca negativo.
+
+    print(f"audio_capture: calibrated once in {calibration:.0f} ms, threshold "
+          f"{' -> '.join(f'{threshold:.0f}' for threshold in thresholds)} as the noise rises")
+    print(f"audio_capture: {len(detected)}/{utterances} utterances "
+          f"({', '.join(f'{seconds:.2f} s' for seconds in detected)}), "
+          f"listen start {listen_start:.1f} us")
+    print(f"audio_capture: speech after the cue detected {cue_offset * 1e3:.0f} ms after start_at, "
+          f"{utterance.duration():.2f} s long")
+
+    return len(detected) == utterances and thresholds[-1] > thresholds[0] and cue_offset > 0.1
+
+
+def bench_speech_latency(paths=None, utterances=3):
+    """ Reproduce en tiempo real intervenciones grabadas en WAV (paths; por defecto, frases
+    generadas) y mide la latencia desde el final de la voz hasta tener el texto, contra una
+    API de voz imitada en local. Compara la captura anterior (0.8 s de silencio y codificación
+    al final) con la segmentación en streaming (END_SILENCE y codificación durante la grabación). """
+
+    if paths is None:
+        folder = tempfile.mkdtemp()
+        paths = []
+        for i in range(utterances):
+            paths.append(os.path.join(folder, f"utterance{i}.wav"))
+            write_wav(paths[-1], [(1.0 if i == 0 else 0.5, 0, 40), (0.4 + 0.3 * i, 3000, 40), (1.5, 0, 40)])
+
+    def handler(method, path, body):    # Responde como la API de voz de Google.
+        if not body.startswith(b"fLaC"):
+            return 400, {}, b""
+        result = {"result": [{"alternative": [{"transcript": f"{len(body)} bytes"}], "final": True}]}
+        return 200, {}, ('{"result":[]}\n' + json.dumps(result) + "\n").encode()
+
+    server = LocalServer(handler)
+    recognizer = recognition.GoogleRecognizer(url=server.url + "/speech")
+
+    def replay(pause_threshold, encoder):
+        capture = voice.AudioCapture(source=lambda: voice.WavSource(list(paths)),
+                                     pause_threshold=pause_threshold)
+        latencies = []
+        processing = []     # Parte de la latencia posterior a la ventana de silencio.
+        start_at = 0
+        for _ in paths:
+            utterance = capture.listen(timeout=3, start_at=start_at, encoder=encoder)
+            recognizer.recognize(utterance)
+            latencies.append((time.monotonic() - utterance.speech_ended_at) * 1e3)
+            processing.append((time.monotonic() - utterance.ended_at) * 1e3)
+            start_at = utterance.ended_at
+        capture.stop()
+        return latencies, processing
+
+    baseline = replay(0.8, None)
+    streaming = replay(voice.END_SILENCE, recognizer.encoder)
+    server.close()
+
+    for name, (latencies, processing) in (("listen + encode", baseline), ("streaming", streaming)):
+        print(f"speech_latency: {name:<15} end of speech to text "
+              f"{', '.join(f'{latency:.0f}' for latency in latencies)} ms "
+              f"(mean {sum(latencies) / len(latencies):.0f} ms, "
+              f"{sum(processing) / len(processing):.1f} ms after the silence window)")
+
+    return (len(server.requests) == 2 * len(paths)
+            and sum(streaming[0]) < sum(baseline[0]))
+
+
+def bench_earcons(plays=200):
+    """ Mide cuánto tarda en empezar a sonar el aviso precargado (llamada a play más el
+    buffer de salida) y lo compara con lo que costaba antes cada aviso sin contar el
+    reproductor externo: decodificar bleep.wav en un hilo nuevo. """
+    import pygame
+
+    try:
+        pygame.mixer.init(buffer=voice.EARCON_BUFFER)
+    except pygame.error:    # Sin tarjeta de sonido: salida de audio imitada.
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+        pygame.mixer.init(buffer=voice.EARCON_BUFFER)
+
+    cues = voice.Earcons()
+    start = time.perf_counter()
+    cues.start()
+    loading = (time.perf_counter() - start) * 1e3
+
+    play = timeit(lambda: cues.play("bleep"), plays) / 1e3
+    starts = play + cues.latency * 1e3
+
+    def decode():
+        with wave.open(voice.EARCONS["bleep"], "rb") as wav:
+            wav.readframes(wav.getnframes())
+
+    def decode_in_thread():
+        thread = threading.Thread(target=decode)
+        thread.start()
+        thread.join()
+
+    before = timeit(decode_in_thread, 50) / 1e3
+    pygame.mixer.quit()
+
+    print(f"earcons: decoded once in {loading:.1f} ms, cue audible for "
+          f"{cues.loaded['bleep'].audible * 1e3:.0f} ms, listening starts right after it")
+    print(f"earcons: cue starts in {starts:.2f} ms (play {play:.3f} ms + output buffer "
+          f"{cues.latency * 1e3:.1f} ms), decoding per prompt took {before:.2f} ms before the player")
+
+    return starts < 10
+
+
+# -----------------------------------------------------
+# --------------- HISTORIAL PERSISTENTE ---------------
+# -----------------------------------------------------
+
+def bench_journal(sessions=500, records=100, retention_days=30):
+    """ Llena el historial persistente con semanas de uso (sessions sesiones de records
+    registros, repartidas en 60 días) y mide cuánto tarda en encolarse un registro, la
+    escritura en lotes, la rotación y la exportación en streaming. """
+
+    path = os.path.join(tempfile.mkdtemp(), "transcripts.db")
+    history = journal.TranscriptJournal(path, retention_days=retention_days)
+    now = time.time()
+
+    start = time.perf_counter()
+    for i in range(sessions):
+        started = now - (sessions - i) * 60 * 86400 / sessions
+        session = history.begin_session(f"FUNCTIONALITY {i}", started)
+        for j in range(records):
+            history.append(session, started + j, "User" if j % 2 else "VA", f"Message {j} of session {i}.")
+    enqueue = (time.perf_counter() - start) * 1e6 / (sessions * (records + 1))
+    history.flush()
+    written = time.perf_counter() - start
+    size = os.path.getsize(path) / 2**20
+
+    # Un segundo arranque rota el historial: borra las sesiones de más de retention_days días.
+    rotated = journal.TranscriptJournal(path, retention_days=retention_days)
+    start = time.perf_counter()
+    rotated.flush()
+    rotation = (time.perf_counter() - start) * 1e3
+    kept = sum(1 for record in rotated.export() if record[3] is None)
+
+    start = time.perf_counter()
+    last = sum(1 for record in rotated.export(last_sessions=5))
+    export_last = (time.perf_counter() - start) * 1e3
+
+    since = datetime.datetime.now() - datetime.timedelta(days=7)
+    start = time.perf_counter()
+    week = sum(1 for record in rotated.export(since=since))
+    export_week = (time.perf_counter() - start) * 1e3
+
+    print(f"journal: {sessions * records} records enqueued in {enqueue:.2f} us each, "
+          f"written in batches in {written:.2f} s ({size:.1f} MB)")
+    print(f"journal: rotation kept {kept}/{sessions} sessions in {rotation:.0f} ms, "
+          f"{os.path.getsize(path) / 2**20:.1f} MB")
+    print(f"journal: exported the last 5 sessions ({last} lines) in {export_last:.1f} ms "
+          f"and the last week ({week} lines) in {export_week:.1f} ms")
+
+    expected = sum(1 for i in range(sessions) if (sessions - i) * 60 / sessions < retention_days)
+    return last == 5 * (records + 1) and kept == expected
+
+
+SPEECH_CORPUS = os.environ.get("VA_SPEECH_CORPUS", "assets/corpus")
+
+
+def bench_command_corpus(folder=SPEECH_CORPUS):
+    """ Reconoce sin red un corpus de órdenes grabadas (folder/<orden>.wav, por ejemplo
+    cancel_operation.wav, volume_up-2.wav u open_notepad.wav) con la gramática de órdenes.
+    El reconocedor local debe entenderlas todas, también las que llevan palabras fuera de
+    la gramática (el nombre de una aplicación). Con el híbrido, la nube se sustituye por un
+    servidor local que cuenta las peticiones: solo deben llegar a ella las órdenes con
+    palabras fuera de la gramática. Requiere Vosk y su modelo (VA_VOSK_MODEL). """
+
+    paths = sorted(glob.glob(os.path.join(folder, "*.wav")))
+    if not paths:
+        raise FileNotFoundError(f"No WAV files in {folder}")
+
+    server = LocalServer(lambda method, path, body: (200, {}, b'{"result":[]}\n'))
+    local = recognition.VoskRecognizer()
+    recognizer = recognition.HybridRecognizer(local, recognition.GoogleRecognizer(url=server.url))
+
+    start = time.perf_counter()
+    local.load()
+    loading = time.perf_counter() - start
+
+    vocabulary = {word for phrase in recognition.COMMAND_GRAMMAR for word in phrase.split()}
+    correct = 0
+    latencies = []
+    outside = 0     # Órdenes con palabras fuera de la gramática (las únicas que van a la nube).
+    for path in paths:
+        expected = os.path.basename(path)[:-4].split("-")[0].replace("_", " ")
+        outside += any(word not in vocabulary for word in expected.split())
+        with wave.open(path, "rb") as wav:
+            data = wav.readframes(wav.getnframes())
+            if wav.getnchannels() == 2:
+                data = audioop.tomono(data, wav.getsampwidth(), 0.5, 0.5)
+            rate, width = wav.getframerate(), wav.getsampwidth()
+
+        start = time.perf_counter()
+        try:
+            text = local.recognize(voice.Utterance(data, rate, width, 0, 0, 0), recognition.COMMAND_GRAMMAR)
+        except Exception:
+            text = ""
+        latencies.append((time.perf_counter() - start) * 1e3)
+
+        try:
+            recognizer.recognize(voice.Utterance(data, rate, width, 0, 0, 0), recognition.COMMAND_GRAMMAR)
+        except Exception:
+            pass
+
+        correct += text == expected
+        if text != expected:
+            print(f"command_corpus: {os.path.basename(path)} recognized as {text!r}")
+    server.close()
+
+    print(f"command_corpus: model loaded once in {loading:.1f} s")
+    print(f"command_corpus: {correct}/{len(paths)} commands offline, mean {sum(latencies) / len(paths):.0f} ms "
+          f"per command; hybrid: {len(server.requests)} cloud request(s) for {outside} command(s) "
+          f"outside the grammar")
+
+    return correct == len(paths) and len(server.requests) == outside
+
+
+# -----------------------------------------------------
+# ------------------- ÓRDENES DE VOZ ------------------
+# -----------------------------------------------------
+
+# Transcripciones de órdenes: (frase, contexto, intención esperada, slots esperados).
+INTENT_CORPUS = [
+    ("show my next events", None, "calendar_show", {}),
+    ("what's on my calendar", None, "calendar_show", {}),
+    ("list my meetings for today", None, "calendar_show", {}),
+    ("show", "calendar", "calendar_show", {}),
+    ("create a new event", None, "calendar_create", {}),
+    ("schedule a meeting", None, "calendar_create", {}),
+    ("create", "calendar", "calendar_create", {}),
+    ("check my email", None, "mail_show", {}),
+    ("what's in my inbox", None, "mail_show", {}),
+    ("read my unread messages", None, "mail_show", {}),
+    ("show", "mail", "mail_show", {}),
+    ("send an email", None, "mail_create", {}),
+    ("write a new mail", None, "mail_create", {}),
+    ("compose", "mail", "mail_create", {}),
+    ("i want to send an email", None, "mail_create", {}),
+    ("i would like to write an email to john", None, "mail_create", {"name": "john"}),
+    ("i want to create an event", None, "calendar_create", {}),
+    ("send an email to ana saying let's talk about lunch", None, "mail_create",
+     {"name": "ana", "message": "let's talk about lunch"}),
+    ("send an email to john about lunch saying see you at noon", None, "mail_create",
+     {"name": "john", "subject": "lunch", "message": "see you at noon"}),
+    ("open notepad", None, "open_app", {"app": "notepad"}),
+    ("please open the calculator app", None, "open_app", {"app": "calculator"}),
+    ("launch spotify", None, "open_app", {"app": "spotify"}),
+    ("open", None, "open_app", {"app": None}),
+    ("close notepad", None, "close_app", {"app": "notepad"}),
+    ("quit the browser", None, "close_app", {"app": "browser"}),
+    ("take a screenshot", None, "screenshot", {}),
+    ("capture the screen", None, "screenshot", {}),
+    ("volume up", None, "volume", {"direction": "up"}),
+    ("turn the sound down", None, "volume", {"direction": "down"}),
+    ("louder please", None, "volume", {"direction": "up"}),
+    ("mute", None, "volume", {"direction": "mute"}),
+    ("volume", None, "volume", {"direction": "mute"}),
+    ("ask what is the capital of france", None, "ai_chat", {"question": "what is the capital of france"}),
+    ("i have a question", None, "ai_chat", {"question": None}),
+    ("ask what is the best calendar app", None, "ai_chat", {"question": "what is the best calendar app"}),
+    ("start the timer", None, None, None),
+    ("stop the music", None, None, None),
+    ("tell me a joke", None, None, None),
+    ("set an alarm for 7", None, None, None),
+    ("send the report", None, None, None),
+    ("what's up", None, None, None),
+    ("lower the blinds", None, None, None),
+    ("raise the volume", None, "volume", {"direction": "up"}),
+    ("let's chat", None, None, None),
+    ("good morning", None, None, None),
+    ("showroom opening hours", None, None, None),
+]
+
+
+def substring_routing(text, context=None):
+    """ Enrutado anterior: comprobaciones de subcadenas encadenadas sobre la frase. """
+
+    if context == "calendar" or "calendar" in text or "event" in text:
+        if "show" in text:
+            return "calendar_show"
+        if "create" in text:
+            return "calendar_create"
+    if context == "mail" or "mail" in text:
+        if "show" in text:
+            return "mail_show"
+        if "create" in text:
+            return "mail_create"
+    if "open" in text:
+        return "open_app"
+    if "close" in text:
+        return "close_app"
+    if "screen" in text:
+        return "screenshot"
+    if "volume" in text or "sound" in text:
+        return "volume"
+    return None
+
+
+def bench_intents(repeat=2000):
+    """ Reconoce un corpus de transcripciones de órdenes con el reconocedor de intenciones
+    compilado: mide las frases por segundo frente al enrutado por subcadenas anterior y
+    comprueba la intención y los datos (aplicación, dirección del volumen, pregunta)
+    de cada frase. """
+
+    matcher = intents.IntentMatcher()
+
+    def run_matcher():
+        for text, context, _, _ in INTENT_CORPUS:
+            matcher.match(text, context)
+
+    def run_substrings():
+        for text, context, _, _ in INTENT_CORPUS:
+            substring_routing(text, context)
+
+    compiled = len(INTENT_CORPUS) / (timeit(run_matcher, repeat) / 1e6)
+    substrings = len(INTENT_CORPUS) / (timeit(run_substrings, repeat) / 1e6)
+
+    correct = old_correct = 0
+    for text, context, intent, slots in INTENT_CORPUS:
+        match = matcher.match(text, context)
+        result = (match.intent, match.slots) if match else (None, None)
+        correct += result == (intent, slots)
+        old_correct += substring_routing(text, context) == intent
+        if result != (intent, slots):
+            print(f"intents: {text!r} matched as {match}")
+
+    print(f"intents: {compiled:,.0f} phrases/s compiled, {substrings:,.0f} phrases/s with substrings")
+    print(f"intents: {correct}/{len(INTENT_CORPUS)} phrases with their slots, "
+          f"{old_correct}/{len(INTENT_CORPUS)} intents with substrings")
+
+    return correct == len(INTENT_CORPUS)
+
+
+# Primeras frases al crear un evento o un correo desde una orden de voz.
+CREATE_CORPUS = [
+    "create a meeting with ana tomorrow 3pm to 4pm",
+    "schedule a meeting with the team about the roadmap tomorrow at 10 to 11",
+    "create an event called dentist on 1 april 9am to 10am",
+    "add an event lunch with mum today at 1pm",
+    "schedule a meeting",
+    "create a new event",
+    "send an email to john at gmail dot com about lunch saying see you at noon",
+    "send an email to ana@example.com about the report saying it is ready",
+    "write a mail to maria at outlook dot com about holidays",
+    "send an email to peter",
+    "send an email",
+]
+
+
+def bench_slot_filling():
+    """ Cuenta los turnos de diálogo (preguntas del VA más la orden) que cuesta crear cada
+    evento o correo del corpus con el rellenado de datos, frente a los 4 del diálogo
+    anterior (una pregunta por dato), y cuánto cuesta extraer los datos de una frase. """
+    import ui_functions
+
+    questions = {"calendar_create": ui_functions.EVENT_QUESTIONS, "mail_create": ui_functions.EMAIL_QUESTIONS}
+    turns = []
+    for text in CREATE_CORPUS:
+        match = intents.matcher.match(text)
+        if match is None or match.intent not in questions:
+            print(f"slot_filling: {text!r} matched as {match}")
+            return False
+        missing = [slot for slot, _, _ in questions[match.intent] if slot not in match.slots]
+        turns.append(1 + len(missing))
+
+    extraction = timeit(lambda: intents.matcher.match(CREATE_CORPUS[0]), 200)
+
+    print(f"slot_filling: {sum(turns) / len(turns):.1f} turns per item (before: 5), "
+          f"{turns.count(1)}/{len(turns)} items created from the first sentence")
+    print(f"slot_filling: slots extracted in {extraction:.0f} us")
+
+    return turns.count(1) >= 5
+
+
+# -----------------------------------------------------
+# ------------------- FECHAS HABLADAS -----------------
+# -----------------------------------------------------
+
+DATE_NOW = datetime.datetime(2026, 10, 14, 10, 0)   # Miércoles: las frases se interpretan desde aquí.
+
+# Fechas transcritas: (frase, inicio esperado o None si no es una fecha).
+DATE_CORPUS = [
+    ("tomorrow at 9", "2026-10-15 09:00"),
+    ("tomorrow 3pm", "2026-10-15 15:00"),
+    ("next friday at 9", "2026-10-16 09:00"),
+    ("friday at 3", "2026-10-16 15:00"),
+    ("in two hours", "2026-10-14 12:00"),
+    ("in 30 minutes", "2026-10-14 10:30"),
+    ("in three days at noon", "2026-10-17 12:00"),
+    ("today at half past 4", "2026-10-14 16:30"),
+    ("monday morning", "2026-10-19 09:00"),
+    ("this evening", "2026-10-14 19:00"),
+    ("1 april 9pm", "2027-04-01 21:00"),
+    ("december 24 at 8 pm", "2026-12-24 20:00"),
+    ("the day after tomorrow at 10am", "2026-10-16 10:00"),
+    ("at noon", "2026-10-14 12:00"),
+    ("9:30 am", "2026-10-15 09:30"),
+    ("tonight at 8", "2026-10-14 20:00"),
+    ("october 20th at 11", "2026-10-20 11:00"),
+    ("next week", "2026-10-21 00:00"),
+    ("quarter to 6", "2026-10-14 17:45"),
+    ("quarter to 1", "2026-10-14 12:45"),
+    ("on the 21st at 4pm", "2026-10-21 16:00"),
+    ("the 5th", "2026-11-05 00:00"),
+    ("whenever you want", None),
+    ("as soon as possible", None),
+]
+
+# Frases de eventos: (frase, nombre esperado, inicio esperado). Un número o un mes sueltos
+# no son una fecha.
+DATE_SENTENCES = [
+    ("review chapter 5", "review chapter 5", None),
+    ("meeting in room 4", "meeting in room 4", None),
+    ("call may", "call may", None),
+    ("lunch with april", "lunch with april", None),
+    ("pay rent on the 1st", "pay rent", "2026-11-01 00:00"),
+    ("meeting with ana tomorrow 3pm to 4pm", "meeting with ana", "2026-10-15 15:00"),
+    ("party on december 24 at 8pm", "party", "2026-12-24 20:00"),
+]
+
+# Diálogos de creación de un evento: (respuesta al inicio, respuesta al fin o None si ya se
+# ha dicho, inicio esperado, fin esperado). Si el VA vuelve a preguntar, el usuario responde
+# con la fecha completa ("15 October 2026 16:00").
+DATE_DIALOGUES = [
+    ("tomorrow 3pm to 4pm", None, "2026-10-15 15:00", "2026-10-15 16:00"),
+    ("friday from 10 to 11:30", None, "2026-10-16 10:00", "2026-10-16 11:30"),
+    ("tomorrow at 3 for an hour", None, "2026-10-15 15:00", "2026-10-15 16:00"),
+    ("next friday at 9", "11am", "2026-10-16 09:00", "2026-10-16 11:00"),
+    ("in two hours", "for an hour", "2026-10-14 12:00", "2026-10-14 13:00"),
+    ("monday morning", "noon", "2026-10-19 09:00", "2026-10-19 12:00"),
+    ("1 april 9pm", "11pm", "2027-04-01 21:00", "2027-04-01 23:00"),
+    ("tomorrow 3pm to 2pm", "4pm", "2026-10-15 15:00", "2026-10-15 16:00"),
+    ("the day after tomorrow at 10am", "half past 11", "2026-10-16 10:00", "2026-10-16 11:30"),
+    ("december 24 at 8 pm", "10 pm", "2026-12-24 20:00", "2026-12-24 22:00"),
+]
+
+
+def old_date(text):
+    """ Interpretación anterior de una fecha: dateutil sobre la frase entera. """
+    from dateutil import parser
+
+    return parser.parse(text, default=DATE_NOW.replace(hour=0, minute=0))
+
+
+def spelled(moment):
+    """ Fecha completa con la que responde el usuario cuando el VA repite la pregunta. """
+    return moment.strftime("%d %B %Y %H:%M")
+
+
+def old_dialogue(start_answer, end_answer, expected_start, expected_end):
+    """ Diálogo anterior: una pregunta por fecha, repetida mientras dateutil falle o el
+    fin no sea posterior al inicio. Devuelve (reintentos, inicio, fin). """
+
+    retries = 0
+    try:
+        start = old_date(start_answer)
+    except (ValueError, OverflowError):
+        retries += 1
+        start = old_date(spelled(expected_start))
+
+    answer = end_answer or spelled(expected_end)
+    try:
+        end = old_date(answer)
+        if end <= start:
+            raise ValueError(answer)
+    except (ValueError, OverflowError):
+        retries += 1
+        end = old_date(spelled(expected_end))
+    return retries, start, end
+
+
+def new_dialogue(start_answer, end_answer, expected_start, expected_end):
+    """ Diálogo con el intérprete de fechas: el inicio puede traer el fin y cada fallo se
+    clasifica en una pasada (fecha incomprensible o fin anterior al inicio). """
+
+    retries = 0
+    try:
+        start, end = dates.parse_range(start_answer, now=DATE_NOW)
+    except dates.DateOrder as e:    # El inicio vale: solo se vuelve a pedir el fin.
+        retries += 1
+        start, end = e.start, None
+    except dates.UnparseableDate:
+        retries += 1
+        start, end = dates.parse_range(spelled(expected_start), now=DATE_NOW)
+
+    if end is None:
+        try:
+            end = dates.parse_end(end_answer or spelled(expected_end), start, now=DATE_NOW)
+        except dates.DateError:
+            retries += 1
+            end = dates.parse_end(spelled(expected_end), start, now=DATE_NOW)
+    return retries, dates.naive(start), dates.naive(end)
+
+
+def bench_dates(repeat=200):
+    """ Interpreta un corpus de fechas transcritas con el intérprete de fechas habladas y con
+    dateutil (el método anterior) y compara la tasa de aciertos, el coste por frase y los
+    reintentos de diálogo (preguntas repetidas) al crear un evento. """
+
+    def expected(value):
+        return datetime.datetime.strptime(value, "%Y-%m-%d %H:%M") if value else None
+
+    def parse_new(text):
+        try:
+            return dates.naive(dates.parse_date(text, now=DATE_NOW))
+        except dates.DateError:
+            return None
+
+    def parse_old(text):
+        try:
+            return old_date(text)
+        except (ValueError, OverflowError):
+            return None
+
+    new_correct = old_correct = 0
+    for text, value in DATE_CORPUS:
+        result = parse_new(text)
+        new_correct += result == expected(value)
+        old_correct += parse_old(text) == expected(value)
+        if result != expected(value):
+            print(f"dates: {text!r} parsed as {result}")
+
+    sentences = 0
+    for text, summary, value in DATE_SENTENCES:
+        words, start, _ = dates.find_dates(text.split(), now=DATE_NOW)
+        found = (" ".join(words), dates.naive(start))
+        sentences += found == (summary, expected(value))
+        if found != (summary, expected(value)):
+            print(f"dates: {text!r} split as {found}")
+
+    cost = timeit(lambda: [parse_new(text) for text, _ in DATE_CORPUS], repeat) / len(DATE_CORPUS)
+
+    results = {"old": [], "new": []}
+    for dialogue in DATE_DIALOGUES:
+        start_answer, end_answer, start, end = dialogue
+        for name, run_dialogue in (("old", old_dialogue), ("new", new_dialogue)):
+            retries, got_start, got_end = run_dialogue(start_answer, end_answer, expected(start), expected(end))
+            results[name].append((retries, (got_start, got_end) == (expected(start), expected(end))))
+
+    print(f"dates: parse rate {new_correct}/{len(DATE_CORPUS)} (dateutil: {old_correct}/{len(DATE_CORPUS)}), "
+          f"{cost:.0f} us per phrase")
+    print(f"dates: {sentences}/{len(DATE_SENTENCES)} event sentences split into name and date")
+    for name, label in (("old", "dateutil"), ("new", "spoken dates")):
+        retries = sum(retries for retries, _ in results[name]) / len(DATE_DIALOGUES)
+        wrong = sum(not correct for _, correct in results[name])
+        print(f"dates: {label}: {retries:.1f} retries per event, {wrong}/{len(DATE_DIALOGUES)} events with wrong dates")
+
+    # La fecha lleva la zona horaria del sistema (con su horario de verano), no un desfase fijo.
+    summer, winter = dates.parse_date("1 july 9am", now=DATE_NOW), dates.parse_date("1 january 9am", now=DATE_NOW)
+    print(f"dates: local offsets {summer.isoformat()[-6:]} (July) and {winter.isoformat()[-6:]} (January)")
+
+    return (new_correct == len(DATE_CORPUS) and sentences == len(DATE_SENTENCES)
+            and all(correct for _, correct in results["new"]))
+
+
+BENCHMARKS = {
+    "hit_test": bench_hit_test,
+    "dialogue_bus": bench_dialogue_bus,
+    "tts_queue": bench_tts_queue,
+    "discovery": bench_discovery,
+    "mail_batch": bench_mail_batch,
+    "calendar_sync": bench_calendar_sync,
+    "startup": bench_startup,
+    "browser_pool": bench_browser_pool,
+    "ai_http": bench_ai_http,
+    "audio_capture": bench_audio_capture,
+    "speech_latency": bench_speech_latency,
+    "earcons": bench_earcons,
+    "journal": bench_journal,
+    "command_corpus": bench_command_corpus,
+    "intents": bench_intents,
+    "slot_filling": bench_slot_filling,
+    "dates": bench_dates,
+}
+
+
+def run(name):
+    """ Ejecuta un benchmark. Un error (por ejemplo, una dependencia sin instalar) cuenta como fallo. """
+
+    try:
+        return BENCHMARKS[name]()
+    except Exception as e:
+        print(f"{name}: failed: {type(e).__name__}: {str(e)}")
+        return False
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    ok = all([run(name) for name in names])
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,332 @@
+import datetime
+import re
+
+# -----------------------------------------------------
+# ---------------- VOCABULARIO DE FECHAS --------------
+# -----------------------------------------------------
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20,
+    "thirty": 30, "forty": 40, "fifty": 50, "a": 1, "an": 1, "a couple of": 2, "couple of": 2,
+}
+UNITS = {"minute": 60, "hour": 3600, "day": 86400, "week": 7 * 86400}
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DAYS = {"the day after tomorrow": 2, "tomorrow": 1, "today": 0, "tonight": 0}
+
+# Hora por defecto de cada parte del día y si sus horas sueltas son de tarde ("evening at 8").
+DAY_PARTS = {"morning": (9, False), "noon": (12, None), "midday": (12, None),
+             "afternoon": (15, True), "evening": (19, True), "tonight": (20, True), "night": (20, True)}
+AFTERNOON_HOURS = range(1, 8)   # "at 3" sin am/pm es a las 15:00.
+
+_number = "|".join(sorted(map(re.escape, NUMBER_WORDS), key=len, reverse=True))
+_amount = rf"(?:\d+|{_number})"
+DURATION = re.compile(rf"\b(?:(?P<half>half an hour)|(?P<n>{_amount})\s+(?P<unit>minute|hour|day|week)s?"
+                      rf"(?P<and_half>\s+and a half)?)\b")
+IN_DURATION = re.compile(rf"\bin\s+(?={_amount}\s|half)")
+FOR_DURATION = re.compile(r"\s+for\s+")
+WEEKDAY = re.compile(rf"\b(?:(?P<next>next|this|on)\s+)?(?P<day>{'|'.join(WEEKDAYS)})\b")
+DAY_PART = re.compile(rf"\b(?:in the|this|at)?\s*(?P<part>{'|'.join(DAY_PARTS)})\b")
+PAST = re.compile(r"\b(?P<minutes>half|quarter)\s+(?P<sign>past|to)\s+(?P<hour>\d{1,2})\b")
+CLOCK = re.compile(r"\b(?P<hour>\d{1,2})(?:[:.](?P<minute>\d{2})|\s+(?P<spoken>\d{2})(?=\s*[ap]m))?"
+                   r"\s*(?P<meridiem>[ap]m)?\b")
+AT_CLOCK = re.compile(r"\bat\s+(?P<clock>" + CLOCK.pattern + r")$")
+ORDINAL = re.compile(r"\b(?P<day>\d{1,2})(?:st|nd|rd|th)\b")   # "the 21st" es un día, nunca una hora.
+
+# Dentro de una frase, un número o un mes suelto ("review chapter 5", "call May") solo es una
+# fecha si va precedido de una de estas palabras o lleva una hora con minutos, am/pm u ordinal.
+_cues = "|".join(["at", "on", "in", "next", "this", "from", "by", "half", "quarter", "the day after",
+                  *DAYS, *WEEKDAYS, *DAY_PARTS])
+CUE_WORDS = re.compile(rf"^(?:{_cues})\b")
+CUE_CLOCK = re.compile(r"\d(?:[:.]\d{2}|\s*[ap]m|st|nd|rd|th)\b|o'clock")
+RANGE = re.compile(r"\s+(?:to|until|till)\s+|\s*-\s*")
+FILLER = {"at", "on", "the", "of", "in", "from", "by", "around", "about"}
+
+
+class DateError(ValueError):
+    """ Error al interpretar una fecha hablada. """
+
+
+class UnparseableDate(DateError):
+    """ La frase no contiene una fecha reconocible. """
+
+    def __init__(self, text):
+        self.text = text
+        super().__init__(f"No date in {text!r}")
+
+
+class DateOrder(DateError):
+    """ La fecha de fin no es posterior a la de inicio. start es la fecha de inicio,
+    que sí es válida, para pedir solo la de fin. """
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        super().__init__(f"End {end.isoformat()} is not later than start {start.isoformat()}")
+
+
+# -----------------------------------------------------
+# --------------- INTERPRETACIÓN DE FECHAS ------------
+# -----------------------------------------------------
+
+def local_now():
+    """ Hora local sin segundos, sin zona horaria (las cuentas se hacen en hora local). """
+    return datetime.datetime.now().replace(second=0, microsecond=0)
+
+
+def localize(moment, tz=None):
+    """ Añade la zona horaria (por defecto, la del sistema con su horario de verano en esa fecha). """
+
+    if tz is not None:
+        return moment.replace(tzinfo=tz)
+    return moment.astimezone()
+
+
+def naive(moment):
+    """ Pasa una fecha con zona horaria a hora local sin zona (las naive se dejan igual). """
+
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def normalize(text):
+    text = text.lower().replace("a.m.", "am").replace("p.m.", "pm").replace("o'clock", "")
+    text = re.sub(r"[,;!?]|\.(?!\d)", " ", text)
+    for word, number in sorted(NUMBER_WORDS.items(), key=lambda item: -len(item[0])):
+        if number > 1 or " " in word or word == "one":      # "a" y "an" solo cuentan en duraciones.
+            text = re.sub(rf"\b{word}\b", str(number), text)
+    return " ".join(text.split())
+
+
+def duration(text):
+    """ Duración hablada ("two hours", "30 minutes", "half an hour") como timedelta, o None. """
+
+    match = DURATION.fullmatch(normalize(text).removeprefix("for ").removesuffix(" later").strip())
+    if match is None:
+        return None
+    return _duration(match)
+
+
+def _duration(match):
+    if match["half"]:
+        return datetime.timedelta(minutes=30)
+    amount = match["n"]
+    seconds = (int(amount) if amount.isdigit() else NUMBER_WORDS[amount]) * UNITS[match["unit"]]
+    if match["and_half"]:
+        seconds *= 1.5
+    return datetime.timedelta(seconds=seconds)
+
+
+def _dateutil_fields(text):
+    """ Campos (year, month, day, hour, minute) que dateutil entiende en text. """
+    from dateutil import parser
+
+    # Con dos fechas por defecto distintas, los campos que coinciden son los que se han dicho.
+    defaults = (datetime.datetime(2004, 1, 1, 1, 1), datetime.datetime(2008, 3, 3, 3, 3))
+    try:
+        first, second = (parser.parse(text, default=default) for default in defaults)
+    except (ValueError, OverflowError):
+        raise UnparseableDate(text)
+    return {field: getattr(first, field) for field in ("year", "month", "day", "hour", "minute")
+            if getattr(first, field) == getattr(second, field)}
+
+
+def _clock(match, afternoon, text):
+    """ (hora, minuto) de una hora dicha. Sin am/pm, las horas de AFTERNOON_HOURS son de
+    tarde salvo que afternoon diga otra cosa ("in the morning"). """
+
+    hour = int(match["hour"])
+    minute = int(match["minute"] or match["spoken"] or 0)
+    if match["meridiem"] == "pm" and hour < 12:
+        hour += 12
+    elif match["meridiem"] == "am" and hour == 12:
+        hour = 0
+    elif not match["meridiem"] and hour < 12:
+        if afternoon or (afternoon is None and hour in AFTERNOON_HOURS):
+            hour += 12
+    if hour > 23 or minute > 59:
+        raise UnparseableDate(text)
+    return hour, minute
+
+
+def parse_date(text, default=None, now=None, tz=None):
+    """ Fecha de una expresión hablada: "tomorrow", "next Friday at 9", "in two hours",
+    "1 April 9pm". Lo que no se dice se toma de default (la fecha de inicio al pedir la de
+    fin) o, si no hay default, es hoy y, si ya ha pasado, la próxima vez. Devuelve un
+    datetime con la zona horaria local (o tz). Lanza UnparseableDate si no es una fecha. """
+
+    now = naive(now) or local_now()
+    base = naive(default)
+    text = normalize(text)
+    original = text
+
+    date = None         # Día dicho (datetime.date).
+    time = None         # Hora dicha (hora, minuto).
+    afternoon = None    # Las horas sueltas son de tarde (True), de mañana (False) o se deduce.
+
+    # "in two hours": un instante exacto desde ahora.
+    start = IN_DURATION.search(text)
+    match = DURATION.match(text, start.end()) if start else None
+    if match:
+        moment = now + _duration(match)
+        date = moment.date()
+        if match["unit"] in ("minute", "hour") or match["half"]:
+            time = (moment.hour, moment.minute)
+        text = text[:start.start()] + text[match.end():]
+
+    for phrase, days in DAYS.items():
+        if re.search(rf"\b{phrase}\b", text):
+            date = now.date() + datetime.timedelta(days=days)
+            text = re.sub(rf"\b{phrase}\b", " tonight" if phrase == "tonight" else " ", text)
+            break
+
+    if re.search(r"\bnext week\b", text):
+        date = now.date() + datetime.timedelta(days=7)
+        text = re.sub(r"\bnext week\b", " ", text)
+
+    match = WEEKDAY.search(text)
+    if match:
+        ahead = (WEEKDAYS.index(match["day"]) - now.weekday()) % 7
+        if ahead == 0 and match["next"] == "next":
+            ahead = 7
+        date = now.date() + datetime.timedelta(days=ahead)
+        text = text[:match.start()] + text[match.end():]
+
+    match = DAY_PART.search(text)
+    if match:
+        hour, afternoon = DAY_PARTS[match["part"]]
+        time = (hour, 0)
+        text = text[:match.start()] + text[match.end():]
+
+    match = PAST.search(text)
+    if match:
+        hour, minute = int(match["hour"]), 30 if match["minutes"] == "half" else 15
+        if match["sign"] == "to":   # "quarter to 1" es 12:45.
+            hour, minute = (hour - 2) % 12 + 1, 60 - minute
+        text = text[:match.start()] + f" {hour}:{minute:02d}" + text[match.end():]
+
+    day = None
+    match = ORDINAL.search(text)
+    if match:
+        day = int(match["day"])
+        text = text[:match.start()] + text[match.end():]
+
+    # Horas sueltas ("9:30", "9 30 pm") y "at ..." al final: dateutil tomaría "at 3" por el
+    # día 3 y "October 20 at 11" por el año 2011.
+    clock = AT_CLOCK.search(text)
+    if clock:
+        time = _clock(clock, afternoon, original)
+        text = text[:clock.start()]
+
+    rest = " ".join(word for word in text.split() if word not in FILLER)
+    match = CLOCK.fullmatch(rest) if rest else None
+    if match:
+        if clock:   # Un número suelto además de "at ...": no se sabe qué hora es.
+            raise UnparseableDate(original)
+        time = _clock(match, afternoon, original)
+        rest = ""
+
+    # El resto (fechas absolutas: "1 April 9pm", "December 24") lo interpreta dateutil.
+    fields = _dateutil_fields(rest) if rest else {}
+    if day is not None:
+        fields["day"] = day
+    if "month" in fields or "day" in fields:
+        reference = date or (base.date() if base else now.date())
+        year, month = fields.get("year", reference.year), fields.get("month", reference.month)
+        try:
+            date = datetime.date(year, month, fields.get("day", reference.day))
+            if "year" not in fields and date < now.date() and base is None:
+                if "month" in fields:   # "1 April" ya pasado es el del año que viene.
+                    date = date.replace(year=year + 1)
+                else:                   # "the 5th" ya pasado es el del mes que viene.
+                    date = date.replace(year=year + month // 12, month=month % 12 + 1)
+        except ValueError:
+            raise UnparseableDate(original)
+    if "hour" in fields:
+        if clock:
+            raise UnparseableDate(original)
+        time = (fields["hour"], fields.get("minute", 0))
+
+    if date is None and time is None:
+        raise UnparseableDate(original)
+
+    if date is None:    # Solo la hora: el día de default o hoy (mañana si ya ha pasado).
+        date = base.date() if base else now.date()
+        if base is None and datetime.datetime.combine(date, datetime.time(*time)) < now:
+            date += datetime.timedelta(days=1)
+    if time is None:
+        time = (base.hour, base.minute) if base and date == base.date() else (0, 0)
+
+    return localize(datetime.datetime.combine(date, datetime.time(*time)), tz)
+
+
+def parse_end(text, start, now=None, tz=None):
+    """ Fecha de fin: una duración desde el inicio ("for an hour", "two hours later") o una
+    fecha que toma del inicio lo que no se dice ("4pm"). Lanza UnparseableDate o DateOrder. """
+
+    length = duration(text)
+    if length is not None:
+        end = naive(start) + length
+        return localize(end, tz)
+
+    end = parse_date(text, default=start, now=now, tz=tz)
+    if end <= start:
+        raise DateOrder(start, end)
+    return end
+
+
+def parse_range(text, now=None, tz=None):
+    """ Fecha de inicio y, si se dice, de fin: "tomorrow 3pm to 4pm", "Friday at 10 for
+    an hour". Devuelve (start, end o None). En una sola pasada distingue una frase sin
+    fecha (UnparseableDate) de un fin anterior al inicio (DateOrder, con el inicio). """
+
+    text = normalize(text)
+
+    for separator in reversed(list(RANGE.finditer(text))):
+        try:
+            start = parse_date(text[:separator.start()], now=now, tz=tz)
+        except UnparseableDate:
+            continue
+        return start, parse_end(text[separator.end():], start, now, tz)
+
+    for separator in reversed(list(FOR_DURATION.finditer(text))):
+        length = duration(text[separator.end():])
+        if length is None:
+            continue
+        start = parse_date(text[:separator.start()], now=now, tz=tz)
+        return start, localize(naive(start) + length, tz)
+
+    return parse_date(text, now=now, tz=tz), None
+
+
+def find_dates(words, now=None, tz=None):
+    """ Separa las palabras de una frase en (texto, inicio, fin): las fechas son el sufijo más
+    largo que se entiende como tal ("meeting with Ana | tomorrow 3pm to 4pm") y empieza por
+    una palabra de fecha o lleva una hora (has_date_cue). Sin fechas devuelve (words, None,
+    None). El orden de inicio y fin lo comprueba quien pregunta. """
+
+    for i in range(len(words)):
+        if not has_date_cue(" ".join(words[i:])):
+            continue
+        try:
+            start, end = parse_range(" ".join(words[i:]), now, tz)
+        except DateOrder as e:
+            return words[:i], e.start, e.end
+        except DateError:
+            continue
+        return words[:i], start, end
+    return words, None, None
+
+
+def has_date_cue(text):
+    """ La frase empieza como una fecha ("at", "next", "tomorrow"...) o lleva una hora o un
+    ordinal ("3pm", "9:30", "21st"): un número o un mes sueltos no bastan. """
+
+    text = text.lower()
+    return bool(CUE_WORDS.match(normalize(text)) or CUE_CLOCK.search(text))
+
+
+def spoken_date(moment):
+    """ Fecha para decirla en voz alta: "Thursday 15 October at 15:00". """
+    return moment.strftime("%A %d %B at %H:%M")
@@ -0,0 +1,324 @@
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# -----------------------------------------------------
+# -------------- SERVICIOS DE GOOGLE (API) ------------
+# -----------------------------------------------------
+
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest'
+DISCOVERY_CACHE_DIR = 'auth/discovery'     # Documentos de descubrimiento guardados en disco.
+DISCOVERY_TTL = 7 * 24 * 3600              # Validez de los documentos guardados (segundos).
+GMAIL_MAX_BATCH = 100                      # Máximo de peticiones por lote que admite Gmail.
+CALENDAR_DB_PATH = 'auth/calendar.db'      # Copia local de los eventos del calendario.
+
+
+class GoogleServices:
+    """ Registro de clientes de las APIs de Google. Cada servicio (calendar v3,
+    gmail v1...) se construye una sola vez por proceso a partir de un documento de
+    descubrimiento guardado en disco o incluido en googleapiclient, y todos comparten
+    el mismo transporte HTTP autorizado, que mantiene las conexiones abiertas. httplib2
+    no es thread-safe: un hilo que hace peticiones a la vez que los demás (la
+    sincronización del calendario en segundo plano) pide su propio transporte con http(name).
+
+        Args:
+            credentials (callable): Devuelve las credenciales del usuario.
+            cache_dir (str, optional): Directorio donde se guardan los documentos de descubrimiento.
+            ttl (int, optional): Segundos que un documento guardado se considera vigente.
+            discovery_url (str, optional): Plantilla de la URL de descubrimiento ({api}, {version}).
+    """
+
+    def __init__(self, credentials, cache_dir=DISCOVERY_CACHE_DIR, ttl=DISCOVERY_TTL,
+                 discovery_url=DISCOVERY_URL):
+        self.credentials = credentials
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.discovery_url = discovery_url
+        self.services = {}
+        self.transports = {}    # Nombre: transporte HTTP autorizado.
+        self.lock = threading.RLock()
+        self.fetches = 0    # Documentos de descubrimiento descargados de la red.
+
+    def get(self, api, version):
+        """ Devuelve el cliente del servicio, construyéndolo solo la primera vez. """
+
+        with self.lock:
+            service = self.services.get((api, version))
+            if service is None:
+                from googleapiclient.discovery import build_from_document
+
+                document = self.discovery_document(api, version)
+                service = build_from_document(document, http=self.http())
+                self.services[(api, version)] = service
+                logging.info(f"Google {api} {version} service has been built.")
+            return service
+
+    def http(self, name='shared'):
+        """ Transporte HTTP autorizado: el compartido por todos los servicios o, con otro
+        nombre, uno propio para las peticiones de un hilo concreto. """
+
+        with self.lock:
+            transport = self.transports.get(name)
+            if transport is None:
+                import httplib2
+                from google_auth_httplib2 import AuthorizedHttp
+
+                transport = AuthorizedHttp(self.credentials(), http=httplib2.Http(timeout=30))
+                self.transports[name] = transport
+            return transport
+
+    def discovery_document(self, api, version):
+        """ Devuelve el documento de descubrimiento del servicio. Usa la copia en disco
+        si está vigente; si no, la descarga y la guarda. Sin conexión, recurre a la
+        copia caducada o a la incluida en googleapiclient. """
+
+        path = os.path.join(self.cache_dir, f"{api}.{version}.json")
+        cached = None
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                cached = file.read()
+            if time.time() - os.path.getmtime(path) < self.ttl:
+                return cached
+
+        try:
+            document = self.fetch_document(api, version)
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(path, 'w', encoding='utf-8') as file:
+                    file.write(document)
+            except OSError as e:
+                logging.warning(f"Failed to save discovery document to {path}: {str(e)}")
+            return document
+
+        except Exception as e:
+            logging.warning(f"Failed to fetch {api} {version} discovery document: {str(e)}")
+
+            if cached:
+                return cached
+
+            from googleapiclient import discovery_cache
+
+            document = discovery_cache.get_static_doc(api, version)
+            if document is None:
+                raise
+            return document
+
+    def fetch_document(self, api, version):
+        """ Descarga el documento de descubrimiento del servicio. """
+
+        import httplib2
+
+        url = self.discovery_url.format(api=api, version=version)
+        response, content = httplib2.Http(timeout=10).request(url)
+        self.fetches += 1
+
+        if response.status >= 400:
+            raise RuntimeError(f"HTTP {response.status} fetching {url}")
+
+        document = content.decode('utf-8')
+        json.loads(document)    # Comprueba que sea un documento válido.
+        return document
+
+    def clear(self):
+        """ Descarta los clientes construidos (por ejemplo, tras cambiar de credenciales). """
+
+        with self.lock:
+            self.services.clear()
+            self.transports.clear()
+
+
+# -----------------------------------------------------
+# ------------------ CONSULTAS A GMAIL ----------------
+# -----------------------------------------------------
+
+def fetch_email_summaries(service, message_ids, batch_size=GMAIL_MAX_BATCH):
+    """ Obtiene remitente, fecha y asunto de cada correo en una única petición por lotes
+    (una por cada batch_size correos), descargando solo esas tres cabeceras.
+    Devuelve una lista de tuplas (remitente, fecha, asunto) en el mismo orden. """
+
+    summaries = {}
+    errors = []
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            errors.append(exception)
+            return
+
+        # Una sola pasada por las cabeceras.
+        headers = {header['name'].lower(): header['value']
+                   for header in response.get('payload', {}).get('headers', [])}
+        summaries[request_id] = (headers.get('from', ''), headers.get('date', ''), headers.get('subject', ''))
+
+    for first in range(0, len(message_ids), batch_size):
+        batch = service.new_batch_http_request(callback=callback)
+
+        for msg_id in message_ids[first:first + batch_size]:
+            batch.add(service.users().messages().get(userId='me',
+                                                     id=msg_id,
+                                                     format='metadata',
+                                                     metadataHeaders=['From', 'Date', 'Subject']),
+                      request_id=msg_id)
+        batch.execute()
+
+    if errors:
+        raise errors[0]
+
+    return [summaries[msg_id] for msg_id in message_ids]
+
+
+# -----------------------------------------------------
+# -------------- COPIA LOCAL DEL CALENDARIO -----------
+# -----------------------------------------------------
+
+def event_timestamp(when):
+    """ Convierte el campo start/end de un evento en un timestamp. Los eventos
+    de día completo ('date') empiezan a medianoche en la zona horaria local. """
+
+    if 'dateTime' in when:
+        return datetime.datetime.fromisoformat(when['dateTime'].replace('Z', '+00:00')).timestamp()
+    return datetime.datetime.fromisoformat(when['date']).timestamp()
+
+
+class CalendarStore:
+    """ Copia local (SQLite) de los eventos del calendario, mantenida al día con la
+    sincronización incremental de Google Calendar (syncToken). Solo se descarga el
+    calendario completo la primera vez o cuando el servidor invalida el token (410).
+
+        Args:
+            path (str, optional): Ruta de la base de datos.
+            calendar_id (str, optional): Calendario que se sincroniza.
+    """
+
+    def __init__(self, path=CALENDAR_DB_PATH, calendar_id='primary'):
+        self.path = path
+        self.calendar_id = calendar_id
+        self.lock = threading.Lock()
+        self.refreshing = None      # Hilo de la sincronización en segundo plano.
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS events ("
+                            "id TEXT PRIMARY KEY, start_ts REAL, end_ts REAL, data TEXT)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS events_start ON events (start_ts)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def sync_token(self):
+        """ Devuelve el token de la última sincronización (None si nunca se ha sincronizado). """
+
+        with self.lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'sync_token'").fetchone()
+        return row[0] if row else None
+
+    def synced(self):
+        """ Indica si la copia local ya se ha sincronizado alguna vez. """
+        return self.sync_token() is not None
+
+    def save(self, event):
+        """ Guarda o actualiza un evento (por ejemplo, justo después de crearlo). """
+        with self.lock, self.db:
+            self.store(event)
+
+    def store(self, event):
+        """ Aplica un evento recibido del servidor. Requiere tener el lock. """
+
+        if event.get('status') == 'cancelled':  # Eventos borrados.
+            self.db.execute("DELETE FROM events WHERE id = ?", (event['id'],))
+            return
+
+        self.db.execute("INSERT OR REPLACE INTO events (id, start_ts, end_ts, data) VALUES (?, ?, ?, ?)",
+                        (event['id'], event_timestamp(event['start']), event_timestamp(event['end']),
+                         json.dumps(event)))
+
+    def sync(self, service, http=None):
+        """ Sincroniza la copia local. Devuelve el número de cambios aplicados.
+        http es el transporte de las peticiones (por defecto, el del servicio). """
+
+        from googleapiclient.errors import HttpError
+
+        token = self.sync_token()
+        try:
+            return self.pull(service, token, http)
+        except HttpError as e:
+            if token is None or e.resp.status != 410:
+                raise
+
+            # El token ya no es válido: se descarta la copia y se sincroniza de cero.
+            logging.warning("Calendar sync token expired. Running a full sync...")
+            with self.lock, self.db:
+                self.db.execute("DELETE FROM events")
+                self.db.execute("DELETE FROM meta WHERE key = 'sync_token'")
+            return self.pull(service, None, http)
+
+    def pull(self, service, token, http=None):
+        """ Descarga los cambios desde token (o todo el calendario si es None) y los aplica. """
+
+        changes = []
+        page_token = None
+
+        while True:
+            response = service.events().list(calendarId=self.calendar_id,
+                                             singleEvents=True,
+                                             syncToken=token,
+                                             pageToken=page_token
+                                             ).execute(http=http)
+            changes.extend(response.get('items', []))
+
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        with self.lock, self.db:   # Todos los cambios se aplican en una transacción.
+            if token is None:
+                self.db.execute("DELETE FROM events")
+            for event in changes:
+                self.store(event)
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('sync_token', ?)",
+                            (response.get('nextSyncToken'),))
+
+        logging.info(f"Calendar {'incremental' if token else 'full'} sync: {len(changes)} changes.")
+        return len(changes)
+
+    def refresh(self, service, http=None):
+        """ Lanza una sincronización en segundo plano si no hay otra en curso. http es
+        un transporte propio del hilo: el del servicio lo usan a la vez otros hilos. """
+
+        def run():
+            try:
+                self.sync(service, http)
+            except Exception as e:
+                logging.warning(f"Failed to refresh calendar events: {str(e)}")
+
+        if self.refreshing is None or not self.refreshing.is_alive():
+            self.refreshing = threading.Thread(target=run, daemon=True)
+            self.refreshing.start()
+        return self.refreshing
+
+    def events(self, time_min=None, time_max=None, limit=None):
+        """ Devuelve los eventos que terminan después de time_min y empiezan antes de
+        time_max (datetimes; por defecto, desde ahora y sin límite), por orden de inicio. """
+
+        time_min = (time_min or datetime.datetime.now().astimezone()).timestamp()
+        query = "SELECT data FROM events WHERE end_ts > ?"
+        params = [time_min]
+
+        if time_max is not None:
+            query += " AND start_ts < ?"
+            params.append(time_max.timestamp())
+        query += " ORDER BY start_ts"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
@@ -1,11 +1,214 @@
+import functools
+import numpy as np
 import pygame
 import textwrap
+import threading
+from collections import OrderedDict, deque
+
+from tasks import current_token
 
 COLOR1 = (0, 0, 255)
 COLOR2 = (0, 200, 255)
 BLACK = (255, 255, 255)
 TRANSPARENT = (0, 0, 0)
 
+FONT_PATH = "assets/Atari.ttf"
+FONT_SIZE = 22
+
+# Bits de cada región en el índice de colisiones (mismo orden que las coordenadas de build_elements).
+HIT_OFF = 1 << 0
+HIT_CORNER = 1 << 1
+HIT_LOG = 1 << 2
+HIT_CAL = 1 << 3
+HIT_MAIL = 1 << 4
+HIT_AI = 1 << 5
+HIT_PC = 1 << 6
+
+
+# -----------------------------------------------------
+# ----------------- CACHÉ DE IMÁGENES -----------------
+# -----------------------------------------------------
+
+class AssetCache:
+    """ Caché de imágenes ya cargadas, convertidas y escaladas,
+    indexada por (ruta, tamaño). Cada icono se decodifica una sola vez
+    mientras la geometría del asistente no cambie. """
+
+    def __init__(self):
+        self.surfaces = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, size):
+        """ Devuelve la imagen de la ruta indicada escalada a size (ancho, alto). """
+
+        key = (path, tuple(size))
+        surface = self.surfaces.get(key)
+
+        if surface is not None:
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = pygame.image.load(path).convert_alpha()
+        surface = pygame.transform.scale(surface, key[1])
+        self.surfaces[key] = surface
+        return surface
+
+    def invalidate(self):
+        """ Vacía la caché. Se llama cuando cambia el tamaño o la posición del asistente. """
+        self.surfaces.clear()
+
+    def stats(self):
+        """ Devuelve los contadores de aciertos y fallos de la caché. """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.surfaces)}
+
+
+assets = AssetCache()   # Caché compartida por todas las figuras.
+
+
+# -----------------------------------------------------
+# ---------------- ZONAS A ACTUALIZAR -----------------
+# -----------------------------------------------------
+
+class DirtyRects:
+    """ Acumula los rectángulos de la pantalla que han cambiado desde la última
+    actualización, para que solo esas zonas se envíen a pygame.display.update.
+    Se puede usar desde cualquier hilo, de ahí el lock. """
+
+    def __init__(self):
+        self.rects = []
+        self.lock = threading.Lock()
+
+    def add(self, rect):
+        """ Registra una zona modificada de la pantalla. """
+        with self.lock:
+            self.rects.append(rect)
+
+    def pop_all(self):
+        """ Devuelve y vacía las zonas modificadas pendientes. """
+        with self.lock:
+            rects, self.rects = self.rects, []
+        return rects
+
+
+dirty = DirtyRects()    # Zonas pendientes de actualizar en la pantalla.
+
+
+# -----------------------------------------------------
+# ------------ MENSAJES A LA BARRA DE DIÁLOGO ---------
+# -----------------------------------------------------
+
+DIALOGUE_EVENT = pygame.USEREVENT + 1   # Despierta al bucle principal cuando hay un mensaje.
+
+
+class DialogueBus:
+    """ Mensajes de las funcionalidades a la barra de diálogo. Los hilos de trabajo nunca
+    dibujan: publican "show" (texto o lista de textos) o "clear", con la misma interfaz
+    que Bar, y el bucle principal dibuja una vez por frame solo el último estado (la cola
+    tiene longitud 1, así que cada mensaje sustituye al anterior sin locks). Los mensajes
+    de una tarea cancelada se descartan. """
+
+    def __init__(self):
+        self.messages = deque(maxlen=1)
+
+    def post(self, kind, content=None):
+        if current_token().cancelled():
+            return
+        self.messages.append((kind, content))
+        if pygame.display.get_init():
+            pygame.event.post(pygame.event.Event(DIALOGUE_EVENT))
+
+    def add_text(self, text):
+        """ Muestra un texto o una lista de textos en la barra de diálogo. """
+        self.post("show", text)
+
+    def undo(self):
+        """ Vacía la barra de diálogo. """
+        self.post("clear")
+
+    def drain(self):
+        """ Devuelve el último mensaje pendiente (o None). Solo desde el bucle principal. """
+        try:
+            return self.messages.popleft()
+        except IndexError:
+            return None
+
+
+dialogue = DialogueBus()    # Barra de diálogo compartida por todas las funcionalidades.
+
+
+# -----------------------------------------------------
+# ----------------- CACHÉ DE TEXTOS -------------------
+# -----------------------------------------------------
+
+class FontRegistry:
+    """ Registro de fuentes. Cada par (fuente, tamaño) se carga una sola vez. """
+
+    def __init__(self):
+        self.fonts = {}
+        self.lock = threading.Lock()
+
+    def get(self, path, size):
+        """ Devuelve la fuente de la ruta indicada con el tamaño indicado. """
+
+        with self.lock:
+            font = self.fonts.get((path, size))
+            if font is None:
+                font = pygame.font.Font(path, size)
+                self.fonts[(path, size)] = font
+            return font
+
+
+class TextCache:
+    """ Caché LRU de líneas de texto ya renderizadas, indexada por
+    (fuente, tamaño, texto, colores). Al repintar la barra de diálogo
+    las líneas que no han cambiado no se vuelven a rasterizar.
+
+        Args:
+            maxsize (int, optional): Número máximo de líneas guardadas.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, path, size, text, text_color, bg_color):
+        """ Devuelve la superficie con la línea de texto renderizada. """
+
+        key = (path, size, text, text_color, bg_color)
+
+        with self.lock:
+            surface = self.surfaces.get(key)
+            if surface is not None:
+                self.hits += 1
+                self.surfaces.move_to_end(key)
+                return surface
+
+            self.misses += 1
+            surface = fonts.get(path, size).render(text, True, text_color, bg_color)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.maxsize:
+                self.surfaces.popitem(last=False)   # Descarta la línea menos usada.
+            return surface
+
+    def stats(self):
+        """ Devuelve los contadores de aciertos y fallos de la caché. """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.surfaces)}
+
+
+@functools.lru_cache(maxsize=256)
+def wrap_text(text, width=50):
+    """ Divide el texto en líneas de como máximo width caracteres. """
+    return tuple(textwrap.wrap(text, width=width))
+
+
+fonts = FontRegistry()      # Fuentes compartidas por toda la interfaz.
+texts = TextCache()         # Líneas renderizadas compartidas por todas las barras.
+
 
 # -----------------------------------------------------
 # ----------------- CLASES GEOMÉTRICAS ----------------
@@ -33,9 +236,12 @@ class GeometricShape:
         self.color = color
         self.alpha = alpha
         self.image = image
+        self.surface = None         # Superficie prerenderizada de la figura.
+        self.surface_color = None
+        self.rect = pygame.Rect(x, y, size, size)   # Zona de la pantalla que ocupa.
 
-    def draw(self):
-        """Método que dibuja e inserta la figura en la pantalla."""
+    def render(self):
+        """Método que prerenderiza la figura (polígono e imagen) en su propia superficie."""
 
         surface = None
         if self.alpha > 0:
@@ -46,13 +252,24 @@ class GeometricShape:
         pygame.draw.polygon(surface, self.color, self.points)
         
         if self.image:      # Inserta una imagen en el centro de la figura si la hubiera.
-            image = pygame.image.load(self.image)
-            image = pygame.transform.scale(image, (self.size, self.size))
+            image = assets.get(self.image, (self.size, self.size))
             image_x = (self.size - image.get_width()) // 2
             image_y = (self.size - image.get_height()) // 2
             surface.blit(image, (image_x, image_y))
+
+        self.surface = surface
+        self.surface_color = self.color
+        return surface
+
+    def draw(self):
+        """Método que dibuja e inserta la figura en la pantalla."""
+
+        # Solo se vuelve a renderizar si la figura no existía o ha cambiado de color.
+        if self.surface is None or self.surface_color != self.color:
+            self.render()
         
-        self.screen.blit(surface, (self.x, self.y))
+        self.screen.blit(self.surface, (self.x, self.y))
+        dirty.add(self.rect)
     
     def get_screen_coordinates(self):
         """ Método que devuelve las coordenadas de la figura en la pantalla. """
@@ -124,29 +341,22 @@ class Bar(GeometricShape):
         bg_color = COLOR1
         text_color = BLACK
 
-        font = pygame.font.Font("assets/Atari.ttf", 22)
+        font = fonts.get(FONT_PATH, FONT_SIZE)
         rect_x, rect_y = self.x, self.y
         y = rect_y + 20
 
         self.draw()
 
         if isinstance(text, str):
-            lines = textwrap.wrap(text, width=50)
+            text = [text]
 
-            for line in lines:
-                text_rendered = font.render(line, True, text_color, bg_color)
+        for text_item in text:
+            for line in wrap_text(text_item):
+                text_rendered = texts.render(FONT_PATH, FONT_SIZE, line, text_color, bg_color)
                 self.screen.blit(text_rendered, (rect_x + 20, y))
                 y += font.get_height() + 5
 
-        elif isinstance(text, list):
-            for text_item in text:
-                lines = textwrap.wrap(text_item, width=50)
-
-                for line in lines:
-                    text_rendered = font.render(
-                        line, True, text_color, bg_color)
-                    self.screen.blit(text_rendered, (rect_x + 20, y))
-                    y += font.get_height() + 5
+        dirty.add(self.rect)    # El texto también forma parte de la zona modificada.
 
 
 # -----------------------------------------------------
@@ -154,10 +364,8 @@ class Bar(GeometricShape):
 # -----------------------------------------------------
 
 # GUI
-# Dibuja todos elementos del tamaño seleccionado en la pantalla.
-def draw_elements(screen, size_options, selected_size, main_menu):
-
-    size = size_options[selected_size]
+# Construye todos los elementos del tamaño seleccionado (sin dibujarlos).
+def build_elements(screen, size, main_menu):
 
     if main_menu:
         decoration = Half_Diamond(screen, *size["bg_dec"], COLOR2)
@@ -173,12 +381,10 @@ def draw_elements(screen, size_options, selected_size, main_menu):
 
     off = Diamond(screen, *size["off"], COLOR1, image='assets/off.png')
 
-    # Dibuja los elementos en la pantalla 
-    menu.draw()
-    decoration.draw()
-    off.draw()
-    corner.draw()
-    log.draw()
+    # Orden en el que se dibujan los elementos en la pantalla.
+    shapes = [menu, decoration, off, corner, log]
+    for shape in shapes:
+        shape.render()
 
     coor_off = off.get_screen_coordinates()
     coor_corner = corner.get_screen_coordinates()
@@ -186,8 +392,76 @@ def draw_elements(screen, size_options, selected_size, main_menu):
 
     coor_cal, coor_mail, coor_ai, coor_pc = coor_submenu(size["menu"])
 
-    # Devuelve las coordenadas de cada elemento necesarias para el hover.
-    return coor_off, coor_corner, coor_log, coor_cal, coor_mail, coor_ai, coor_pc
+    # Coordenadas de cada elemento necesarias para el hover.
+    coordinates = (coor_off, coor_corner, coor_log, coor_cal, coor_mail, coor_ai, coor_pc)
+
+    # Índice de colisiones precalculado para esta disposición.
+    index = HitTestIndex(coordinates)
+
+    return shapes, coordinates, index
+
+
+class Scene:
+    """ Escena persistente del asistente. Guarda, por cada estado (tamaño, menú),
+    las figuras ya prerenderizadas y sus coordenadas en pantalla, de modo que
+    solo se reconstruyen cuando cambia el estado o la geometría. """
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.layouts = {}
+        self.size_options = None
+        self.selected_size = None
+        self.main_menu = None
+        self.current = None
+
+    def invalidate(self):
+        """ Descarta la escena (y las imágenes) tras cambiar la geometría del asistente. """
+        self.layouts.clear()
+        self.current = None
+        assets.invalidate()
+
+    def stale(self, size_options, selected_size, main_menu):
+        """ Indica si la escena dibujada no corresponde ya al estado del asistente. """
+
+        return (self.current is None or size_options is not self.size_options
+                or selected_size != self.selected_size or main_menu != self.main_menu)
+
+    def update(self, size_options, selected_size, main_menu):
+        """ Actualiza el estado de la escena. Devuelve las coordenadas de los elementos
+        y si la escena ha cambiado (y por tanto hay que volver a dibujarla). """
+
+        changed = self.stale(size_options, selected_size, main_menu)
+
+        if changed:
+            if size_options is not self.size_options:
+                self.layouts.clear()
+
+            key = (selected_size, main_menu)
+            if key not in self.layouts:
+                self.layouts[key] = build_elements(self.screen, size_options[selected_size], main_menu)
+
+            self.current = self.layouts[key]
+            self.size_options = size_options
+            self.selected_size = selected_size
+            self.main_menu = main_menu
+
+        return self.current[1], changed
+
+    def hit_test(self, point):
+        """ Devuelve los bits HIT_* de las regiones que contienen el punto. """
+        return self.current[2].lookup(point)
+
+    def draw(self, erase=()):
+        """ Dibuja los elementos del estado actual en la pantalla. Antes borra sus zonas
+        (y las de erase, p. ej. los bordes del hover anterior): las figuras con alpha se
+        mezclan con lo que hay debajo y, sin borrar, acumularían los dibujos anteriores. """
+
+        for rect in [shape.rect for shape in self.current[0]] + list(erase):
+            self.screen.fill(TRANSPARENT, rect)
+            dirty.add(rect)
+
+        for shape in self.current[0]:
+            shape.draw()
 
 # Coordenadas de los triangulos que conforman el diamante del menu principal.
 def coor_submenu(menu):
@@ -223,27 +497,43 @@ def coor_submenu(menu):
     return coor_cal, coor_mail, coor_ai, coor_pc
 
 # HOVER
-# El elemento queda bordeado si el ratón se situa sobre él.
-def hover(screen, main_menu, mouse_pos, coor_off, coor_corner, coor_log, coor_cal, coor_mail, coor_ai, coor_pc):
+# Devuelve los elementos sobre los que se sitúa el ratón (color del borde y polígono).
+# hit contiene los bits HIT_* de las regiones bajo el ratón (ver Scene.hit_test).
+def hover(main_menu, hit, coor_off, coor_corner, coor_log, coor_cal, coor_mail, coor_ai, coor_pc):
+
+    outlines = []
 
     if main_menu:
 
-        if is_inside_polygon(mouse_pos, coor_cal):
-            pygame.draw.lines(screen, (255, 0, 255), True, coor_cal, 3)
-        if is_inside_polygon(mouse_pos, coor_mail):
-            pygame.draw.lines(screen, (255, 255, 0), True, coor_mail, 3)
-        if is_inside_polygon(mouse_pos, coor_ai):
-            pygame.draw.lines(screen, (0, 255, 0), True, coor_ai, 3)
-        if is_inside_polygon(mouse_pos, coor_pc):
-            pygame.draw.lines(screen, (0, 255, 255), True, coor_pc, 3)
+        if hit & HIT_CAL:
+            outlines.append(((255, 0, 255), coor_cal))
+        if hit & HIT_MAIL:
+            outlines.append(((255, 255, 0), coor_mail))
+        if hit & HIT_AI:
+            outlines.append(((0, 255, 0), coor_ai))
+        if hit & HIT_PC:
+            outlines.append(((0, 255, 255), coor_pc))
     else:
-        if is_inside_polygon(mouse_pos, coor_log):
-            pygame.draw.lines(screen, (255, 255, 255), True, coor_log, 3)
+        if hit & HIT_LOG:
+            outlines.append(((255, 255, 255), coor_log))
 
-    if is_inside_polygon(mouse_pos, coor_corner):
-        pygame.draw.lines(screen, (255, 255, 255), True, coor_corner, 3)
-    if is_inside_polygon(mouse_pos, coor_off):
-        pygame.draw.lines(screen, (255, 255, 255), True, coor_off, 3)
+    if hit & HIT_CORNER:
+        outlines.append(((255, 255, 255), coor_corner))
+    if hit & HIT_OFF:
+        outlines.append(((255, 255, 255), coor_off))
+
+    return outlines
+
+# El elemento queda bordeado si el ratón se situa sobre él.
+# Devuelve las zonas dibujadas, que hay que borrar al quitar el borde.
+def draw_hover(screen, outlines):
+
+    rects = []
+    for color, polygon in outlines:
+        rect = pygame.draw.lines(screen, color, True, polygon, 3)
+        dirty.add(rect)
+        rects.append(rect)
+    return rects
 
 
 # -----------------------------------------------------
@@ -283,3 +573,67 @@ def get_polygon_area(vertices):
         v2 = vertices[(i+1) % num_vertices]
         area += v1[0]*v2[1] - v1[1]*v2[0]
     return abs(area) / 2.0
+
+
+class HitTestIndex:
+    """ Índice de colisiones precalculado para una disposición de elementos.
+
+        Guarda, para cada píxel del área que ocupa el asistente, un entero cuyos bits
+        indican las regiones que lo contienen. Se calcula una sola vez con NumPy
+        aplicando el mismo método de áreas que is_inside_polygon, así que las
+        respuestas son idénticas y cada consulta es un único acceso al array.
+
+        Args:
+            polygons (list): Polígonos de cada región. El bit i corresponde al polígono i.
+    """
+
+    def __init__(self, polygons):
+        self.polygons = polygons
+
+        xs = [point[0] for polygon in polygons for point in polygon]
+        ys = [point[1] for polygon in polygons for point in polygon]
+        self.x0, self.y0 = int(np.floor(min(xs))), int(np.floor(min(ys)))
+        x1, y1 = int(np.ceil(max(xs))), int(np.ceil(max(ys)))
+        self.width, self.height = x1 - self.x0 + 1, y1 - self.y0 + 1
+
+        grid_x, grid_y = np.meshgrid(np.arange(self.x0, x1 + 1, dtype=np.float64),
+                                     np.arange(self.y0, y1 + 1, dtype=np.float64))
+
+        self.mask = np.zeros((self.height, self.width), dtype=np.uint8)
+        for bit, polygon in enumerate(polygons):
+            inside = inside_polygon_grid(grid_x, grid_y, polygon)
+            self.mask |= inside.astype(np.uint8) << bit
+
+    def lookup(self, point):
+        """ Devuelve los bits de las regiones que contienen el punto (0 si ninguna). """
+
+        x, y = point
+        col, row = x - self.x0, y - self.y0
+
+        if isinstance(x, int) and isinstance(y, int):
+            if 0 <= col < self.width and 0 <= row < self.height:
+                return int(self.mask[row, col])
+            return 0
+
+        # Coordenadas no enteras: se resuelve con el método de áreas.
+        hit = 0
+        for bit, polygon in enumerate(self.polygons):
+            if is_inside_polygon(point, polygon):
+                hit |= 1 << bit
+        return hit
+
+
+def inside_polygon_grid(grid_x, grid_y, polygon):
+    """ Versión vectorizada de is_inside_polygon sobre una rejilla de puntos.
+    Repite las mismas operaciones en el mismo orden para obtener el mismo resultado. """
+
+    num_vertices = len(polygon)
+    total_area = get_polygon_area(polygon)
+
+    sum_areas = np.zeros(grid_x.shape, dtype=np.float64)
+    for i in range(num_vertices):
+        x2, y2 = polygon[i]
+        x3, y3 = polygon[(i+1) % num_vertices]
+        sum_areas += np.abs((grid_x*(y2-y3) + x2*(y3-grid_y) + x3*(grid_y-y2))/2.0)
+
+    return np.abs(total_area - sum_areas) < 1e-6
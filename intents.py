@@ -0,0 +1,269 @@
+import re
+
+from dates import find_dates
+
+# -----------------------------------------------------
+# ------------------ VOCABULARIO ----------------------
+# -----------------------------------------------------
+
+# Sinónimos de cada palabra clave (la palabra clave es su propio sinónimo). Solo palabras
+# que en una orden no signifiquen otra cosa: "start the timer" no es abrir una aplicación.
+SYNONYMS = {
+    "show": ["show", "display", "list", "see", "check", "read", "view", "whats"],
+    "create": ["create", "new", "add", "make", "schedule", "book", "write", "compose"],
+    "send": ["send"],   # Solo crea correos ("send" y un evento no es una orden).
+    "calendar": ["calendar", "event", "events", "agenda", "meeting", "meetings", "appointment",
+                 "appointments", "plans"],
+    "mail": ["mail", "mails", "email", "emails", "gmail", "inbox", "message", "messages"],
+    "open": ["open", "launch", "run"],
+    "close": ["close", "quit", "exit", "kill"],
+    "screen": ["screen", "screenshot", "printscreen", "capture", "snapshot"],
+    "volume": ["volume", "sound", "audio"],
+    "up": ["up", "raise", "increase", "higher"],           # Solo junto a "volume".
+    "down": ["down", "lower", "decrease", "reduce"],
+    "louder": ["louder"],
+    "quieter": ["quieter", "softer"],
+    "mute": ["mute", "unmute"],
+    "ask": ["ask", "question"],
+}
+
+# Palabras que no pueden ser el nombre de una aplicación.
+FILLER = {"the", "a", "an", "my", "app", "application", "program", "please", "for", "me", "up", "to"}
+
+
+# -----------------------------------------------------
+# -------------------- INTENCIONES --------------------
+# -----------------------------------------------------
+
+# Cada intención exige todas sus palabras clave (o un sinónimo). Dentro de una funcionalidad,
+# su palabra clave de contexto (p. ej. "calendar") se da por dicha.
+INTENTS = [
+    ("calendar_show", ["show", "calendar"]),
+    ("calendar_create", ["create", "calendar"]),
+    ("mail_show", ["show", "mail"]),
+    ("mail_create", ["create", "mail"]),
+    ("mail_create", ["send", "mail"]),
+    ("open_app", ["open"]),
+    ("close_app", ["close"]),
+    ("screenshot", ["screen"]),
+    ("volume", ["volume", "up"]),
+    ("volume", ["volume", "down"]),
+    ("volume", ["volume"]),
+    ("volume", ["louder"]),
+    ("volume", ["quieter"]),
+    ("volume", ["mute"]),
+    ("ai_chat", ["ask"]),
+]
+
+
+class Match:
+    """ Intención reconocida en una frase y sus datos (slots). """
+
+    def __init__(self, intent, slots):
+        self.intent = intent
+        self.slots = slots
+
+    def __repr__(self):
+        return f"Match({self.intent!r}, {self.slots!r})"
+
+
+class IntentMatcher:
+    """ Reconoce la intención de una frase completa comparando palabras (no subcadenas)
+    con el vocabulario. El vocabulario se compila una vez: cada palabra se traduce a la
+    máscara de bits de su palabra clave y cada intención es la máscara de las palabras
+    clave que exige, así que reconocer una frase es un recorrido por sus palabras y
+    unas pocas operaciones de bits.
+
+        Args:
+            synonyms (dict, optional): Palabra clave: lista de sinónimos.
+            intents (list, optional): (nombre, palabras clave exigidas), de más a menos prioritaria.
+    """
+
+    WORD = re.compile(r"[a-z0-9]+(?:['’][a-z0-9]+)*")
+
+    def __init__(self, synonyms=SYNONYMS, intents=INTENTS):
+        self.bits = {keyword: 1 << i for i, keyword in enumerate(synonyms)}
+        self.words = {}     # Palabra: (palabra clave, bit).
+        for keyword, words in synonyms.items():
+            for word in words:
+                self.words[word] = (keyword, self.bits[keyword])
+
+        # Las intenciones con más palabras clave son más específicas y se comprueban antes.
+        compiled = [(name, sum(self.bits[keyword] for keyword in keywords), keywords)
+                    for name, keywords in intents]
+        self.intents = sorted(compiled, key=lambda intent: -len(intent[2]))
+
+    def tokens(self, text):
+        """ Palabras de la frase sin apóstrofos (what's -> whats) y dónde acaba cada una. """
+        return [(word[0].replace("'", "").replace("’", ""), word.end())
+                for word in self.WORD.finditer(text.lower())]
+
+    def match(self, text, context=None, allowed=None):
+        """ Devuelve el Match de la frase o None. context es la palabra clave de la
+        funcionalidad en curso ("calendar", "mail"...), que no hace falta repetir, y
+        allowed limita las intenciones posibles (por defecto, todas). """
+
+        tokens = self.tokens(text)
+        words = [word for word, _ in tokens]
+        found = self.bits.get(context, 0)
+        positions = {}      # Palabra clave: posición de su primera aparición.
+        for position, word in enumerate(words):
+            keyword, bit = self.words.get(word, (None, 0))
+            if bit and not found & bit:
+                positions[keyword] = position
+            found |= bit
+
+        # Entre intenciones igual de específicas gana la que se dice antes: en "send an email
+        # saying what time is it" manda "send", no "what".
+        best = None
+        for name, mask, keywords in self.intents:
+            if found & mask != mask or (allowed is not None and name not in allowed):
+                continue
+            if best is not None and len(keywords) < len(best[2]):
+                break
+            said = max(positions.get(keyword, -1) for keyword in keywords)
+            if best is None or said < best[0]:
+                best = (said, name, keywords)
+
+        # Lo que sigue a "ask" es la pregunta, aunque nombre otras palabras clave
+        # ("ask what is the best calendar app").
+        if ("ask" in positions and positions["ask"] == min(positions.values())
+                and (allowed is None or "ai_chat" in allowed)):
+            best = (positions["ask"], "ai_chat", ["ask"])
+
+        if best is None:
+            return None
+        ends = [end for _, end in tokens]
+        return Match(best[1], self.slots(best[1], words, positions, text, ends))
+
+    def slots(self, intent, words, positions, text, ends):
+        """ Extrae los datos de la intención a partir de las palabras de la frase
+        (y de la frase original para los datos de eventos y correos). ends es dónde
+        acaba cada palabra en la frase original. """
+
+        if intent in ("open_app", "close_app"):
+            verb = positions.get("open" if intent == "open_app" else "close", -1)
+            app = next((word for word in words[verb + 1:] if word not in FILLER), None)
+            return {"app": app}
+
+        if intent == "volume":
+            for direction, keywords in (("up", ("up", "louder")), ("down", ("down", "quieter")),
+                                        ("mute", ("mute",))):
+                if any(keyword in positions for keyword in keywords):
+                    return {"direction": direction}
+            return {"direction": "mute"}
+
+        if intent == "ai_chat":
+            question = words[positions["ask"] + 1:] if "ask" in positions else []
+            return {"question": " ".join(question) or None}
+
+        # Los datos de eventos y correos van tras la orden: en "i would like to write an email
+        # to john" solo cuenta " to john". El objeto de un correo nunca es un dato; el de un
+        # evento puede serlo ("meeting with Ana") y lo decide extract_event.
+        if intent == "calendar_create":
+            verb = positions.get("create")
+            return extract_event(text if verb is None else text[ends[verb]:], command=True)
+
+        if intent == "mail_create":
+            verb = max(positions.get("create", -1), positions.get("send", -1), positions.get("mail", -1))
+            return extract_email(text if verb < 0 else text[ends[verb]:])
+
+        return {}
+
+
+# -----------------------------------------------------
+# ------------- EXTRACCIÓN DE DATOS (SLOTS) -----------
+# -----------------------------------------------------
+
+# Palabras entre el verbo de la orden y los datos ("create a new event called ...").
+COMMAND_WORDS = FILLER | {"new"}
+NAMED = re.compile(r"\b(?:called|named|titled)\s+")
+ABOUT = re.compile(r"\s+(?:about|regarding)\s+")
+DATE_JOINERS = {"at", "on", "from", "for"}  # Palabras entre el evento y su fecha.
+PLACEHOLDERS = {"event", "calendar"}        # Tras la orden nunca forman parte del nombre.
+
+
+def strip_command(text, keywords=()):
+    """ Quita de lo que sigue al verbo de la orden el resto de ella ("a new event called")
+    y devuelve sus palabras. keywords son palabras que solas no son un dato ("event"). """
+
+    named = NAMED.search(text)
+    if named:
+        return text[named.end():].split()
+
+    words = text.split()
+    while words and words[0] in COMMAND_WORDS:
+        words = words[1:]
+    if words and words[0] in keywords and (
+            len(words) == 1 or words[1] in DATE_JOINERS or words[0] in PLACEHOLDERS):
+        words = words[1:]
+    return words
+
+
+def extract_event(text, command=False):
+    """ Datos de un evento en una frase: "meeting with Ana about the budget tomorrow 3pm
+    to 4pm" da summary, description, start y end (datetime con zona horaria). Solo incluye
+    los que encuentra; que el fin sea posterior al inicio lo comprueba quien pregunta.
+    command indica que la frase es lo que sigue al verbo de una orden ("a new event ..."). """
+
+    slots = {}
+    text = text.lower().strip(" .")
+    words = strip_command(text, SYNONYMS["calendar"]) if command else text.split()
+    words, start, end = find_dates(words)
+    while words and words[-1] in DATE_JOINERS:
+        words = words[:-1]
+
+    if start is not None:
+        slots["start"] = start
+    if end is not None:
+        slots["end"] = end
+
+    summary = " ".join(words)
+    about = ABOUT.search(summary)
+    if about:
+        summary, slots["description"] = summary[:about.start()], summary[about.end():]
+    if summary:
+        slots["summary"] = summary
+    return slots
+
+
+EMAIL_ADDRESS = re.compile(r"^(?:to\s+)?(?P<name>[\w.+-]+)@(?P<domain>[\w.-]+\w)")
+EMAIL_TO = re.compile(r"^to\s+(?P<name>.+?)(?:\s+at\s+(?P<domain>.+?))?"
+                      r"(?=\s+(?:about|subject|saying|that says)\b|$)")
+EMAIL_SUBJECT = re.compile(r"\b(?:about|subject)\s+(?P<subject>.+?)(?=\s+(?:saying|that says)\b|$)")
+EMAIL_MESSAGE = re.compile(r"\b(?:saying|that says)\s+(?P<message>.+)$")
+
+
+def email_domain(text):
+    """ Dominio dictado: "gmail dot com" -> "gmail.com". """
+    return re.sub(r"\s*\bdot\b\s*", ".", text.strip(" .")).replace(" ", "")
+
+
+def extract_email(text):
+    """ Datos de un correo en lo que sigue a la orden: " to John at gmail dot com about
+    lunch saying see you at noon" da name, domain, subject y message. Solo incluye los
+    que encuentra; el destinatario solo cuenta justo tras la orden. """
+
+    slots = {}
+    text = text.strip(" .")
+
+    address = EMAIL_ADDRESS.search(text)
+    recipient = EMAIL_TO.search(text)
+    if address:
+        slots["name"], slots["domain"] = address["name"].lower(), address["domain"].lower()
+    elif recipient:
+        slots["name"] = recipient["name"].replace(" ", "").lower()
+        if recipient["domain"]:
+            slots["domain"] = email_domain(recipient["domain"]).lower()
+
+    # El asunto va antes del mensaje: en "saying let's talk about lunch" no hay asunto.
+    message = EMAIL_MESSAGE.search(text)
+    if message:
+        slots["message"] = message["message"]
+    subject = EMAIL_SUBJECT.search(text[:message.start()].rstrip() if message else text)
+    if subject:
+        slots["subject"] = subject["subject"].strip()
+    return slots
+
+
+matcher = IntentMatcher()   # Vocabulario compilado compartido por todas las funcionalidades.
@@ -0,0 +1,183 @@
+import datetime
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+# -----------------------------------------------------
+# ------------ CONFIGURACIÓN DEL HISTORIAL ------------
+# -----------------------------------------------------
+
+JOURNAL_PATH = 'auth/transcripts.db'
+JOURNAL_FLUSH_SECONDS = 1.0     # Los registros se escriben en lotes como mucho cada segundo.
+JOURNAL_BATCH = 500             # Registros por lote.
+JOURNAL_RETENTION_DAYS = 90     # Las sesiones más antiguas se borran al arrancar.
+
+# -----------------------------------------------------
+# -------------- HISTORIAL PERSISTENTE ----------------
+# -----------------------------------------------------
+
+class TranscriptJournal:
+    """ Historial persistente (SQLite) de todas las conversaciones. Cada ejecución de
+    una funcionalidad es una sesión. Los registros solo se añaden: se encolan sin
+    bloquear y un hilo propio los escribe en lotes. Al arrancar se borran las sesiones
+    de más de retention_days días para que el fichero no crezca sin límite. Si la base
+    de datos no se puede abrir, el historial queda desactivado (failed) y no guarda nada.
+
+        Args:
+            path (str, optional): Ruta de la base de datos.
+            retention_days (int, optional): Días que se conservan las sesiones.
+            flush_seconds (float, optional): Tiempo máximo que un registro espera en la cola.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, retention_days=JOURNAL_RETENTION_DAYS,
+                 flush_seconds=JOURNAL_FLUSH_SECONDS):
+        self.path = path
+        self.retention_days = retention_days
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.ready = threading.Event()  # Tablas creadas y sesiones antiguas borradas (o fallo).
+        self.failed = False             # No se pudo preparar la base de datos.
+        self.thread = None
+
+    def start(self):
+        """ Arranca el hilo de escritura si aún no está en marcha. """
+
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="TranscriptJournal", daemon=True)
+                self.thread.start()
+
+    def connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA auto_vacuum=INCREMENTAL")    # Solo afecta a bases de datos nuevas.
+        db.execute("PRAGMA journal_mode=WAL")           # Se puede exportar mientras se escribe.
+        return db
+
+    def begin_session(self, feature, started=None):
+        """ Empieza una sesión (por defecto, ahora) y devuelve su identificador. """
+
+        session = uuid.uuid4().hex
+        if not self.failed:
+            self.queue.put(("session", (session, feature, time.time() if started is None else started)))
+            self.start()
+        return session
+
+    def append(self, session, timestamp, speaker, text):
+        """ Añade un registro a la sesión (timestamp en segundos desde epoch). """
+
+        if not self.failed:
+            self.queue.put(("record", (session, timestamp, speaker, text)))
+            self.start()
+
+    def flush(self):
+        """ Espera a que todos los registros encolados estén escritos. """
+
+        self.start()
+        self.ready.wait()
+        if not self.failed:
+            self.queue.join()
+
+    def run(self):
+        """ Bucle del hilo: escribe los registros encolados en lotes. """
+
+        try:
+            db = self.connect()
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                           "id TEXT PRIMARY KEY, feature TEXT, started REAL)")
+                db.execute("CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started)")
+                db.execute("CREATE TABLE IF NOT EXISTS records ("
+                           "session TEXT, timestamp REAL, speaker TEXT, text TEXT)")
+                db.execute("CREATE INDEX IF NOT EXISTS records_session ON records (session, timestamp)")
+                db.execute("CREATE INDEX IF NOT EXISTS records_timestamp ON records (timestamp)")
+            self.rotate(db)
+        except Exception as e:
+            # Sin base de datos no hay historial: se descartan los registros encolados
+            # y flush/append/export pasan a no hacer nada en lugar de bloquearse.
+            logging.error(f"Failed to open the chat history at {self.path}: {str(e)}")
+            self.failed = True
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            self.ready.set()
+            return
+        self.ready.set()
+
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < JOURNAL_BATCH:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            try:
+                with db:
+                    db.executemany("INSERT OR IGNORE INTO sessions VALUES (?, ?, ?)",
+                                   [row for kind, row in batch if kind == "session"])
+                    db.executemany("INSERT INTO records VALUES (?, ?, ?, ?)",
+                                   [row for kind, row in batch if kind == "record"])
+            except sqlite3.Error as e:
+                logging.error(f"Failed to write the chat history: {str(e)}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def rotate(self, db):
+        """ Borra las sesiones de más de retention_days días y libera su espacio. """
+
+        limit = time.time() - self.retention_days * 86400
+        with db:
+            old = "SELECT id FROM sessions WHERE started < ?"
+            deleted = db.execute(f"DELETE FROM records WHERE session IN ({old})", (limit,)).rowcount
+            db.execute("DELETE FROM sessions WHERE started < ?", (limit,))
+        if deleted:
+            db.executescript("PRAGMA incremental_vacuum;")  # executescript la ejecuta hasta el final.
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")   # El fichero encoge al volcar el WAL.
+            logging.info(f"Chat history: {deleted} records older than {self.retention_days} days deleted.")
+
+    def export(self, since=None, until=None, last_sessions=None):
+        """ Recorre los registros (timestamp, speaker, feature, text) en orden, sin cargarlos
+        todos en memoria: los de las últimas last_sessions sesiones o, si no se indica, los
+        de las sesiones con registros en el intervalo de fechas [since, until) (datetime).
+        Cada sesión empieza con un registro de título (text None). """
+
+        self.flush()
+        if self.failed:
+            return
+        since = since.timestamp() if since else 0
+        until = until.timestamp() if until else float("inf")
+
+        db = self.connect()
+        try:
+            if last_sessions is not None:
+                sessions = db.execute("SELECT id, feature, started FROM sessions "
+                                      "ORDER BY started DESC LIMIT ?", (last_sessions,)).fetchall()
+                sessions.reverse()
+            else:
+                sessions = db.execute("SELECT id, feature, started FROM sessions WHERE id IN ("
+                                      "SELECT DISTINCT session FROM records WHERE timestamp >= ? AND timestamp < ?) "
+                                      "ORDER BY started", (since, until)).fetchall()
+
+            for session, feature, started in sessions:
+                yield datetime.datetime.fromtimestamp(started), None, feature, None
+
+                rows = db.execute("SELECT timestamp, speaker, text FROM records "
+                                  "WHERE session = ? AND timestamp >= ? AND timestamp < ? "
+                                  "ORDER BY timestamp, rowid", (session, since, until))
+                for timestamp, speaker, text in rows:
+                    yield datetime.datetime.fromtimestamp(timestamp), speaker, feature, text
+        finally:
+            db.close()
+
+
+journal = TranscriptJournal()   # Historial persistente compartido por todas las funcionalidades.
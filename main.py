@@ -3,11 +3,11 @@ import pygame
 import win32api
 import win32con
 import win32gui
-import threading
 import logging
 
 from gui import *
-from ui_functions import my_data, cal_func, mail_func, ai_func, control_func, chat_history_func
+from ui_functions import features, cal_func, mail_func, ai_func, control_func, chat_history_func, command_func, warm_up
+from voice import EARCON_BUFFER
 
 # -----------------------------------------------------
 # --------------- CONFIGURACIÓN LOGGING ---------------
@@ -23,7 +23,8 @@ logging.getLogger().setLevel(logging.INFO)
 # ---------- CONFIGURACION VENTANA ASISTENTE ----------
 # -----------------------------------------------------
 
-# Inicializa pygame
+# Inicializa pygame (con un buffer de audio pequeño para que los avisos suenen al instante).
+pygame.mixer.pre_init(buffer=EARCON_BUFFER)
 pygame.init()
 
 # Ventana Asistente
@@ -62,25 +63,47 @@ size_options = {
 # Tamaños del asistente
 size, nosize = "small", "large"
 
+# Escena persistente con los elementos del asistente.
+scene = Scene(screen)
+
 # FPS
 clock = pygame.time.Clock()
 
+# Tiempo máximo de espera de eventos (ms) en reposo y con una funcionalidad activa.
+IDLE_TIMEOUT = 1000
+BUSY_TIMEOUT = 50
+
 # Estado inicial menu
 main_menu = True
 
-# Hilo secundario donde actuará la funcionalidad para no bloquear el main loop.
-thread = None
+# Las funcionalidades se ejecutan en el hilo de features para no bloquear el main loop.
 
 
 # -----------------------------------------------------
 # ---------------- FUNCION PRINCIPAL ------------------
 # -----------------------------------------------------
 
+def clear_screen():
+    """ Limpia la pantalla tras cambiar la geometría del asistente. """
+
+    screen.fill((0, 0, 0))
+    dirty.add(screen.get_rect())
+    scene.invalidate()
+
+
+# -----------------------------------------------------
+# ----------------- BUCLE PRINCIPAL -------------------
+# -----------------------------------------------------
+
 def main():
 
     global size, nosize
     global main_menu
-    global thread
+
+    hovered = None  # Elementos bordeados en el último frame.
+    hover_rects = []    # Zonas de sus bordes.
+    events = []     # Eventos pendientes de procesar.
+    warmed_up = False
 
     # BUCLE PRINCIPAL
     while True:
@@ -89,14 +112,32 @@ def main():
         mouse_pos = pygame.mouse.get_pos()
 
         # Display
-        coordinates = draw_elements(screen, size_options, size, main_menu)
-        coor_off, coor_corner, coor_log, coor_cal, coor_mail, coor_ai, coor_pc = coordinates
-
-        # Hover
-        hover(screen, main_menu, mouse_pos, *coordinates)
+        coordinates, changed = scene.update(size_options, size, main_menu)
+
+        # Hover: solo se redibuja si cambia la escena o el elemento bajo el ratón.
+        hit = scene.hit_test(mouse_pos)
+        outlines = hover(main_menu, hit, *coordinates)
+        if changed or outlines != hovered:
+            scene.draw(erase=hover_rects)
+            hover_rects = draw_hover(screen, outlines)
+            hovered = outlines
+
+        # Dibuja el último estado de la barra de diálogo que hayan publicado las funcionalidades.
+        message = dialogue.drain()
+        if message is not None:
+            kind, content = message
+            bar = Bar(screen, *size_options[size]["bar"])
+            if kind == "show":
+                bar.add_text(content)
+            else:
+                bar.undo()
 
         # REGISTRO DE EVENTOS
-        for event in pygame.event.get():
+        for event in events:
+
+            # Aviso de un mensaje nuevo para la barra de diálogo (ya dibujado).
+            if event.type == DIALOGUE_EVENT:
+                continue
 
             # Creación instancia caja dialogo
             box_size = size_options[size]["bar"]
@@ -105,7 +146,8 @@ def main():
             # Evento Alt + F4
             if event.type == pygame.QUIT:
                 logging.info('You closed the app!')
-                my_data["running"] = False
+                logging.info(f"Asset cache: {assets.stats()}, text cache: {texts.stats()}")
+                features.cancel_all()
                 
                 pygame.quit()
                 sys.exit()
@@ -117,73 +159,70 @@ def main():
                 if main_menu:
 
                     # Calendario.
-                    if is_inside_polygon(mouse_pos, coor_cal):
+                    if hit & HIT_CAL:
 
                         main_menu = False
                         logging.info('You clicked Calendar!')
                         
-                        thread = threading.Thread(target=cal_func, args=(bar,))
-                        thread.start()
+                        features.submit("Calendar", cal_func, dialogue)
 
                     # Email.
-                    if is_inside_polygon(mouse_pos, coor_mail):
+                    if hit & HIT_MAIL:
 
                         main_menu = False
                         logging.info('You clicked Email!')
 
-                        thread = threading.Thread(target=mail_func, args=(bar,))
-                        thread.start()
+                        features.submit("Email", mail_func, dialogue)
 
                     # AI Chat.
-                    if is_inside_polygon(mouse_pos, coor_ai):
+                    if hit & HIT_AI:
 
                         main_menu = False
                         logging.info('You clicked AI Chat!')
                         
-                        thread = threading.Thread(target=ai_func, args=(bar,))
-                        thread.start()
+                        features.submit("AI Chat", ai_func, dialogue)
 
                     # Control PC.
-                    if is_inside_polygon(mouse_pos, coor_pc):
+                    if hit & HIT_PC:
 
                         main_menu = False
                         logging.info('You clicked Control PC!')
 
-                        thread = threading.Thread(target=control_func, args=(bar,))
-                        thread.start()
+                        features.submit("Control PC", control_func, dialogue)
 
                     # Cambiar tamaño asistente.
-                    if is_inside_polygon(mouse_pos, coor_corner):
+                    if hit & HIT_CORNER:
 
                         logging.info('You clicked Resize!')
 
-                        screen.fill((0, 0, 0))
                         size, nosize = nosize, size
+                        clear_screen()
 
                 # Dentro de una funcionalidad.
                 else:
 
                     # Chat History
-                    if is_inside_polygon(mouse_pos, coor_log):
+                    if hit & HIT_LOG:
 
                         main_menu = True
                         logging.info('You clicked Chat History!')
 
-                        if not thread or not thread.is_alive():
-                            thread = threading.Thread(target=chat_history_func, args=(bar,))
-                            thread.start()
+                        if not features.busy():
+                            features.submit("Chat History", chat_history_func, dialogue)
 
-                    # Go Back to Main Menu.
-                    if is_inside_polygon(mouse_pos, coor_corner):
+                    # Go Back to Main Menu (cancela la funcionalidad en curso).
+                    if hit & HIT_CORNER:
 
                         main_menu = True
                         logging.info('You clicked Back!')
+                        features.cancel_all()
 
                 # Botón de apagado.
-                if is_inside_polygon(mouse_pos, coor_off):
+                if hit & HIT_OFF:
 
                     logging.info('You clicked Off!')
-                    my_data["running"] = False
+                    logging.info(f"Asset cache: {assets.stats()}, text cache: {texts.stats()}")
+                    features.cancel_all()
 
                     pygame.quit()
                     sys.exit()
@@ -192,30 +231,57 @@ def main():
             elif event.type == pygame.KEYDOWN:
 
                 if event.key == pygame.K_UP:
-                    screen.fill((0, 0, 0))
-
                     for elem in size_options[size]:
                         size_options[size][elem][1] -= 4
+                    clear_screen()
 
                 elif event.key == pygame.K_DOWN:
-                    screen.fill((0, 0, 0))
-
                     for elem in size_options[size]:
                         size_options[size][elem][1] += 4
+                    clear_screen()
+
+                # Orden de voz directa desde el menú principal.
+                elif event.key == pygame.K_SPACE and main_menu and not features.busy():
+
+                    main_menu = False
+                    logging.info('You pressed Voice Command!')
+
+                    features.submit("Voice Command", command_func, dialogue)
 
 
             # Limpia el cuadro de dialogo si no hay funcionalidades activas. 
-            if not thread or not thread.is_alive():
+            if not features.busy():
                 bar.undo()
 
             # Evita volver al menú principal mientras las funcionalidad este activa.
             else:
                 main_menu = False
 
-        # Actualiza la pantalla.
-        pygame.display.update()
+        # Actualiza solo las zonas de la pantalla que han cambiado.
+        rects = dirty.pop_all()
+        if rects:
+            pygame.display.update(rects)
         clock.tick(20)
 
+        # Con el asistente ya visible, carga en segundo plano las credenciales de Google.
+        if not warmed_up:
+            warm_up()
+            warmed_up = True
+
+        # Espera al siguiente evento. Cada mensaje para la barra de diálogo llega como un
+        # evento (DIALOGUE_EVENT); con una funcionalidad activa se despierta además periódicamente.
+        # Si los eventos han cambiado el estado (menú, tamaño, posición), no se espera: la
+        # escena nueva se dibuja en la siguiente vuelta (wait(0) esperaría indefinidamente).
+        if scene.stale(size_options, size, main_menu) or dirty.rects:
+            events = pygame.event.get()
+            continue
+
+        timeout = BUSY_TIMEOUT if features.active() else IDLE_TIMEOUT
+        event = pygame.event.wait(timeout)
+        events = pygame.event.get()
+        if event.type != pygame.NOEVENT:
+            events.insert(0, event)
+
 
 if __name__ == '__main__':
     try:
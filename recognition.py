@@ -0,0 +1,339 @@
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+# -----------------------------------------------------
+# ------------- CONFIGURACIÓN DEL RECONOCIMIENTO ------
+# -----------------------------------------------------
+
+# Reconocedor: "google" (en la nube), "vosk" (local, sin red) o "hybrid" (órdenes en local
+# con la gramática de órdenes y dictado o frases no reconocidas en la nube).
+RECOGNIZER = os.environ.get("VA_RECOGNIZER", "google")
+VOSK_MODEL_PATH = os.environ.get("VA_VOSK_MODEL", "assets/vosk-model")
+
+# Vocabulario de las órdenes de los menús, con los sinónimos que reconoce intents.py.
+# [unk] recoge cualquier otra palabra.
+COMMAND_GRAMMAR = [
+    "show", "display", "list", "see", "check", "read", "view", "what's",
+    "create", "new", "add", "make", "schedule", "book", "write", "compose", "send",
+    "open", "launch", "run", "close", "quit", "exit", "kill",
+    "screen", "screenshot", "print screen", "capture", "snapshot",
+    "volume", "volume up", "volume down", "sound", "sound up", "sound down", "audio",
+    "louder", "quieter", "softer", "raise", "lower", "increase", "decrease", "reduce", "higher",
+    "mute", "unmute",
+    "yes", "no", "cancel operation", "bye", "[unk]"
+]
+
+# API de voz de Google. Por defecto se usan la dirección y la clave de speech_recognition
+# (recognize_google); VA_GOOGLE_SPEECH_URL envía el audio a otra dirección compatible.
+GOOGLE_SPEECH_URL = os.environ.get("VA_GOOGLE_SPEECH_URL")
+GOOGLE_SPEECH_KEY = os.environ.get("VA_GOOGLE_SPEECH_KEY")
+RECOGNITION_TIMEOUT = 10    # Tiempo máximo de espera de la respuesta (segundos).
+
+# -----------------------------------------------------
+# ---------------- CODIFICACIÓN EN FLAC ---------------
+# -----------------------------------------------------
+
+class FlacEncoder:
+    """ Codifica audio PCM a FLAC en un proceso aparte (el conversor que incluye
+    speech_recognition) a medida que se graba. Al terminar la intervención solo
+    queda por codificar el último bloque.
+
+        Args:
+            sample_rate (int): Frecuencia de muestreo del audio.
+            sample_width (int): Bytes por muestra (1, 2 o 3).
+    """
+
+    def __init__(self, sample_rate, sample_width):
+        from speech_recognition import get_flac_converter
+
+        self.process = subprocess.Popen(
+            [get_flac_converter(), "--stdout", "--totally-silent",
+             "--force-raw-format", "--endian=little", "--channels=1",
+             "--sign=signed" if sample_width > 1 else "--sign=unsigned",
+             f"--bps={sample_width * 8}", f"--sample-rate={sample_rate}", "-"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        # La salida se lee en otro hilo para que el conversor nunca se bloquee escribiendo.
+        self.chunks = []
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    def read(self):
+        for chunk in iter(lambda: self.process.stdout.read(4096), b""):
+            self.chunks.append(chunk)
+
+    def write(self, data):
+        self.process.stdin.write(data)
+
+    def finish(self):
+        """ Termina la codificación y devuelve el fichero FLAC. """
+
+        self.process.stdin.close()
+        self.reader.join()
+        self.process.wait()
+        return b"".join(self.chunks)
+
+    def abort(self):
+        """ Descarta el audio (la intervención no era voz). """
+
+        self.process.kill()
+        self.process.wait()
+
+
+def encoded_audio(utterance, flac):
+    """ AudioData de speech_recognition que entrega el FLAC ya codificado en lugar de
+    volver a codificar el audio (salvo que haga falta otro formato). """
+    from speech_recognition import AudioData
+
+    class EncodedAudio(AudioData):
+        def get_flac_data(self, convert_rate=None, convert_width=None):
+            if convert_rate in (None, self.sample_rate) and convert_width in (None, self.sample_width):
+                return flac
+            return super().get_flac_data(convert_rate, convert_width)
+
+    return EncodedAudio(utterance.data, utterance.sample_rate, utterance.sample_width)
+
+
+# -----------------------------------------------------
+# ------------------ RECONOCEDORES --------------------
+# -----------------------------------------------------
+
+class GoogleRecognizer:
+    """ Reconocimiento en la nube con la API de voz de Google a través de recognize_google
+    de speech_recognition, pero enviando el FLAC que se ha ido codificando durante la
+    grabación en lugar de codificar el audio al final.
+
+        Args:
+            language (str, optional): Idioma del audio.
+            url (str, optional): Otra dirección compatible con la API (por ejemplo, en pruebas).
+            key (str, optional): Clave de la API (por defecto, la de speech_recognition).
+    """
+
+    def __init__(self, language="en-US", url=GOOGLE_SPEECH_URL, key=GOOGLE_SPEECH_KEY):
+        self.language = language
+        self.url = url
+        self.key = key
+        self.recognizer = None
+
+    def start(self):
+        pass
+
+    def encoder(self, sample_rate, sample_width, grammar=None):
+        """ Codificador para AudioCapture.listen. La API no admite gramáticas. """
+        return FlacEncoder(sample_rate, sample_width)
+
+    def recognize(self, utterance, grammar=None):
+        """ Devuelve el texto de la intervención. Lanza UnknownValueError si no se
+        entiende y RequestError si no se puede contactar con el servicio. """
+        import speech_recognition as sr
+
+        if utterance.encoded is None:   # Grabado sin codificador: se codifica ahora.
+            utterance.encoded = self.encoder(utterance.sample_rate, utterance.sample_width)
+            utterance.encoded.write(utterance.data)
+        flac = utterance.encoded.finish()
+
+        if self.url is None:
+            if self.recognizer is None:
+                self.recognizer = sr.Recognizer()
+                self.recognizer.operation_timeout = RECOGNITION_TIMEOUT
+            return self.recognizer.recognize_google(encoded_audio(utterance, flac),
+                                                    key=self.key, language=self.language)
+        return self.post(flac, utterance.sample_rate)
+
+    def post(self, flac, sample_rate):
+        """ Envía el FLAC a la dirección configurada, con el mismo formato de petición
+        y respuesta que recognize_google. """
+        from speech_recognition import RequestError, UnknownValueError
+
+        params = {"client": "chromium", "lang": self.language, "pFilter": 0}
+        if self.key:
+            params["key"] = self.key
+        url = f"{self.url}?" + urlencode(params)
+        request = Request(url, data=flac,
+                          headers={"Content-Type": f"audio/x-flac; rate={sample_rate}"})
+        try:
+            response = urlopen(request, timeout=RECOGNITION_TIMEOUT).read().decode("utf-8")
+        except HTTPError as e:
+            raise RequestError(f"recognition request failed: {e.reason}")
+        except URLError as e:
+            raise RequestError(f"recognition connection failed: {e.reason}")
+
+        # La respuesta son varias líneas JSON; la primera con resultados es la buena.
+        result = {}
+        for line in response.split("\n"):
+            if line and json.loads(line)["result"]:
+                result = json.loads(line)["result"][0]
+                break
+
+        alternatives = result.get("alternative", [])
+        if not alternatives or "transcript" not in alternatives[0]:
+            raise UnknownValueError()
+        return alternatives[0]["transcript"]
+
+
+class VoskStream:
+    """ Decodifica el audio con Vosk a medida que se graba, opcionalmente
+    limitado a las frases de una gramática. """
+
+    def __init__(self, model, sample_rate, grammar=None):
+        from vosk import KaldiRecognizer
+
+        if grammar:
+            self.recognizer = KaldiRecognizer(model, sample_rate, json.dumps(grammar))
+        else:
+            self.recognizer = KaldiRecognizer(model, sample_rate)
+
+    def write(self, data):
+        self.recognizer.AcceptWaveform(data)
+
+    def finish(self):
+        """ Devuelve el texto reconocido. """
+        return json.loads(self.recognizer.FinalResult()).get("text", "")
+
+    def abort(self):
+        pass
+
+
+class VoskRecognizer:
+    """ Reconocimiento local (sin red) con un modelo de Vosk. El modelo se carga una
+    sola vez, en segundo plano desde start() o la primera vez que se usa.
+
+        Args:
+            model_path (str, optional): Carpeta del modelo descomprimido.
+    """
+
+    def __init__(self, model_path=VOSK_MODEL_PATH):
+        self.model_path = model_path
+        self.model = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.load, name="VoskModel", daemon=True).start()
+
+    def load(self):
+        """ Carga el modelo si aún no está cargado y lo devuelve. """
+
+        with self.lock:
+            if self.model is None:
+                from vosk import Model, SetLogLevel
+
+                SetLogLevel(-1)
+                start = time.perf_counter()
+                self.model = Model(self.model_path)
+                logging.info(f"Vosk model loaded in {time.perf_counter() - start:.1f} s.")
+            return self.model
+
+    def encoder(self, sample_rate, sample_width, grammar=None):
+        """ Decodificador para AudioCapture.listen (audio de 16 bits). """
+        return VoskStream(self.load(), sample_rate, grammar)
+
+    def recognize(self, utterance, grammar=None, dictation=True):
+        """ Devuelve el texto de la intervención. Lanza UnknownValueError si no se entiende.
+        Si con gramática contiene palabras fuera de ella ("open [unk]"), con dictation la
+        vuelve a reconocer sin gramática ("open notepad"); si no, lanza UnknownValueError. """
+        from speech_recognition import UnknownValueError
+
+        if utterance.encoded is None:
+            utterance.encoded = self.encoder(utterance.sample_rate, utterance.sample_width, grammar)
+            utterance.encoded.write(utterance.data)
+
+        text = utterance.encoded.finish()
+        if grammar and dictation and "[unk]" in text:
+            stream = self.encoder(utterance.sample_rate, utterance.sample_width)
+            stream.write(utterance.data)
+            text = stream.finish()
+
+        if not text or "[unk]" in text:
+            raise UnknownValueError()
+        return text
+
+
+class HybridStream:
+    """ Entrega el audio a la vez al reconocedor local y al de la nube. """
+
+    def __init__(self, local, cloud):
+        self.local = local
+        self.cloud = cloud
+
+    def write(self, data):
+        if self.local:
+            self.local.write(data)
+        self.cloud.write(data)
+
+    def abort(self):
+        if self.local:
+            self.local.abort()
+        self.cloud.abort()
+
+
+class HybridRecognizer:
+    """ Reconoce las órdenes de los menús en local, con la gramática de órdenes, y
+    recurre a la nube para el dictado libre o si el resultado local no es una orden.
+    El audio se codifica para la nube en paralelo, así que recurrir a ella no añade
+    tiempo de codificación.
+
+        Args:
+            local (VoskRecognizer): Reconocedor local.
+            cloud (GoogleRecognizer): Reconocedor en la nube.
+    """
+
+    def __init__(self, local, cloud):
+        self.local = local
+        self.cloud = cloud
+
+    def start(self):
+        self.local.start()
+
+    def encoder(self, sample_rate, sample_width, grammar=None):
+        if grammar is None:
+            return self.cloud.encoder(sample_rate, sample_width)
+
+        try:
+            local = self.local.encoder(sample_rate, sample_width, grammar)
+        except Exception as e:  # Sin Vosk o sin modelo: solo queda la nube.
+            logging.warning(f"Local speech recognizer is not available: {str(e)}")
+            local = None
+        return HybridStream(local, self.cloud.encoder(sample_rate, sample_width))
+
+    def recognize(self, utterance, grammar=None):
+        from speech_recognition import UnknownValueError
+
+        if grammar is None:
+            return self.cloud.recognize(utterance)
+
+        stream = utterance.encoded
+        if stream is None:
+            stream = self.encoder(utterance.sample_rate, utterance.sample_width, grammar)
+            stream.write(utterance.data)
+
+        if stream.local:
+            utterance.encoded = stream.local
+            try:
+                text = self.local.recognize(utterance, grammar, dictation=False)     # El dictado, en la nube.
+                stream.cloud.abort()
+                return text
+            except UnknownValueError:
+                logging.info("Local speech recognizer did not match a command. Using the cloud recognizer.")
+
+        utterance.encoded = stream.cloud
+        return self.cloud.recognize(utterance)
+
+
+def get_recognizer(name=RECOGNIZER):
+    """ Devuelve el reconocedor de voz configurado. """
+
+    if name == "vosk":
+        return VoskRecognizer()
+    if name == "hybrid":
+        return HybridRecognizer(VoskRecognizer(), GoogleRecognizer())
+    return GoogleRecognizer()
+
+
+recognizer = get_recognizer()   # Reconocedor usado por speech_to_text.
@@ -0,0 +1,180 @@
+import logging
+import queue
+import threading
+
+# -----------------------------------------------------
+# -------------- TOKENS DE CANCELACIÓN ----------------
+# -----------------------------------------------------
+
+class CancelToken:
+    """ Señal de cancelación de una tarea. La tarea la consulta en sus puntos de
+    bloqueo (escuchar, hablar, esperar) y termina en cuanto la ve activada. """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        """ Activa la señal y ejecuta los callbacks registrados (una sola vez). """
+
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.warning(f"Failed to run cancel callback: {str(e)}")
+
+    def cancelled(self):
+        return self.event.is_set()
+
+    def on_cancel(self, callback):
+        """ Registra una función que interrumpe un bloqueo (por ejemplo, la voz). """
+
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def wait(self, seconds):
+        """ Espera seconds segundos o hasta la cancelación. Devuelve True si se ha cancelado. """
+        return self.event.wait(seconds)
+
+
+NEVER_CANCELLED = CancelToken()     # Token de lo que no se ejecuta como tarea.
+
+_local = threading.local()
+
+
+def current_token():
+    """ Token de la tarea que se ejecuta en el hilo actual. """
+    return getattr(_local, "token", NEVER_CANCELLED)
+
+
+# -----------------------------------------------------
+# ------------- EJECUTOR DE FUNCIONALIDADES -----------
+# -----------------------------------------------------
+
+PENDING = "pending"
+RUNNING = "running"
+FINISHED = "finished"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+
+class Task:
+    """ Funcionalidad enviada al ejecutor, con su token de cancelación y su estado. """
+
+    def __init__(self, name, func, args):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.token = CancelToken()
+        self.state = PENDING
+        self.done = threading.Event()
+
+    def cancel(self):
+        self.token.cancel()
+
+    def active(self):
+        """ Pendiente o en ejecución (aunque se haya pedido cancelarla). """
+        return self.state in (PENDING, RUNNING)
+
+    def busy(self):
+        """ Activa y sin cancelar: la interfaz debe quedarse en la funcionalidad. """
+        return self.active() and not self.token.cancelled()
+
+
+class FeatureExecutor:
+    """ Ejecuta las funcionalidades en un número fijo de hilos de larga duración en lugar
+    de crear un hilo por clic. Cada tarea lleva su propio token de cancelación y su
+    estado, que el bucle principal consulta sin tocar los hilos.
+
+        Args:
+            workers (int, optional): Hilos de trabajo.
+            on_cancel (callable, optional): Se ejecuta al cancelar cualquier tarea.
+    """
+
+    def __init__(self, workers=1, on_cancel=None):
+        self.workers = workers
+        self.on_cancel = on_cancel
+        self.queue = queue.Queue()
+        self.tasks = []     # Tareas activas, en orden de envío.
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def start(self):
+        """ Arranca los hilos de trabajo si aún no están en marcha. """
+
+        with self.lock:
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.run, name=f"Feature-{len(self.threads)}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, name, func, *args):
+        """ Encola func(*args) y devuelve su Task. """
+
+        task = Task(name, func, args)
+        if self.on_cancel is not None:
+            task.token.on_cancel(self.on_cancel)
+
+        with self.lock:
+            self.tasks.append(task)
+        self.start()
+        self.queue.put(task)
+        return task
+
+    def current(self):
+        """ Última tarea activa (o None). """
+
+        with self.lock:
+            self.tasks = [task for task in self.tasks if task.active()]
+            return self.tasks[-1] if self.tasks else None
+
+    def busy(self):
+        """ Hay una tarea activa que no se ha pedido cancelar. """
+
+        task = self.current()
+        return task is not None and task.busy()
+
+    def active(self):
+        """ Hay alguna tarea pendiente o en ejecución (también las que se están cancelando). """
+        return self.current() is not None
+
+    def cancel_all(self):
+        """ Cancela todas las tareas activas; terminarán en su siguiente punto de bloqueo. """
+
+        with self.lock:
+            tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+
+    def run(self):
+        """ Bucle de cada hilo de trabajo. """
+
+        while True:
+            task = self.queue.get()
+
+            if task.token.cancelled():  # Cancelada antes de empezar.
+                task.state = CANCELLED
+                task.done.set()
+                continue
+
+            _local.token = task.token
+            task.state = RUNNING
+            try:
+                task.func(*task.args)
+                task.state = CANCELLED if task.token.cancelled() else FINISHED
+            except Exception as e:
+                logging.error(f"{task.name} task failed: {str(e)}")
+                task.state = FAILED
+            finally:
+                _local.token = NEVER_CANCELLED
+                task.done.set()
@@ -4,22 +4,21 @@ import logging
 import os
 import threading
 import time
+from concurrent.futures import Future
 
-import pyttsx3
-import pyautogui
-import speech_recognition as sr
-from dateutil import parser
 from email.mime.text import MIMEText
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from playwright.sync_api import sync_playwright
-from pydub import AudioSegment
-from pydub.playback import play
 
-my_data = {"running": True} # Indicador de si la app esta activa.
+from ai_chat import BrowserCallCancelled, SentenceSplitter, ai_backend
+from google_services import CalendarStore, GoogleServices, fetch_email_summaries
+from dates import DateOrder, UnparseableDate, parse_end, parse_range, spoken_date
+from intents import email_domain, extract_email, extract_event, matcher
+from journal import journal
+from recognition import COMMAND_GRAMMAR, recognizer
+from tasks import FeatureExecutor, current_token
+from voice import (audio_capture, earcons, speech, ListenCancelled, ListenTimeout, SpeechInterrupted,
+                   PRIORITY_HIGH, PRIORITY_NORMAL)
+
 
 # -----------------------------------------------------
 # --------------- CONFIGURACIÓN LOGGING ---------------
@@ -44,41 +43,96 @@ SCOPES = [
     'https://www.googleapis.com/auth/gmail.send'
 ]
 
-creds = None
+credentials_future = Future()   # Resultado de la carga de credenciales.
+credentials_lock = threading.Lock()
+credentials_thread = None
 
-if os.path.exists(TOKEN_PATH):  # Comprueba la existencia del token del usuario.
-    try:
-        creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-        logging.info("User authentication completed.")
-    except Exception as e:
-        logging.warning(f"Failed to load credentials from file {TOKEN_PATH}: {str(e)}")
 
-else:
-    creds = None
+def load_credentials():
+    """ Carga el token del usuario, lo refresca o solicita el inicio de sesión
+    si hace falta, y lo guarda de nuevo en disco. """
 
-if not creds or not creds.valid:    # Si no existe token o el existente no es válido...
-    if creds and creds.expired and creds.refresh_token:
-        try:
-            creds.refresh(Request())
-            logging.info("User token has been refreshed.")
-        except Exception as e:
-            logging.error(f"Failed to refresh credentials: {str(e)}")
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.oauth2.credentials import Credentials
+    from google.auth.transport.requests import Request
 
-    else:
+    creds = None
+
+    if os.path.exists(TOKEN_PATH):  # Comprueba la existencia del token del usuario.
         try:
-            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
-            creds = flow.run_local_server(port=0)   # El usuario debe logarse con su cuenta de Google.
+            creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
             logging.info("User authentication completed.")
         except Exception as e:
-            logging.error(f"Failed user authentication: {str(e)}")
+            logging.warning(f"Failed to load credentials from file {TOKEN_PATH}: {str(e)}")
+
+    if not creds or not creds.valid:    # Si no existe token o el existente no es válido...
+        if creds and creds.expired and creds.refresh_token:
+            try:
+                creds.refresh(Request())
+                logging.info("User token has been refreshed.")
+            except Exception as e:
+                logging.error(f"Failed to refresh credentials: {str(e)}")
 
-    if creds: # Actualiza el token del usuario.
+        else:
+            try:
+                flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
+                creds = flow.run_local_server(port=0)   # El usuario debe logarse con su cuenta de Google.
+                logging.info("User authentication completed.")
+            except Exception as e:
+                logging.error(f"Failed user authentication: {str(e)}")
+
+        if creds: # Actualiza el token del usuario.
+            try:
+                with open(TOKEN_PATH, 'w') as token_file:
+                    token_file.write(creds.to_json())
+                logging.info(f"Token has been saved to the file {TOKEN_PATH}.")
+            except Exception as e:
+                logging.error(f"Failed to save token to the file {TOKEN_PATH}: {str(e)}")
+
+    return creds
+
+
+def start_credentials():
+    """ Lanza la carga de credenciales en segundo plano (solo la primera vez). """
+
+    global credentials_thread
+
+    def run():
         try:
-            with open(TOKEN_PATH, 'w') as token_file:
-                token_file.write(creds.to_json())
-            logging.info(f"Token has been saved to the file {TOKEN_PATH}.")
+            credentials_future.set_result(load_credentials())
         except Exception as e:
-            logging.error(f"Failed to save token to the file {TOKEN_PATH}: {str(e)}")
+            logging.error(f"Failed to load credentials: {str(e)}")
+            credentials_future.set_exception(e)
+
+    with credentials_lock:
+        if credentials_thread is None:
+            credentials_thread = threading.Thread(target=run, name="Credentials", daemon=True)
+            credentials_thread.start()
+
+
+def get_credentials():
+    """ Espera a que terminen de cargarse las credenciales y las devuelve. """
+
+    start_credentials()
+    return credentials_future.result()
+
+
+def warm_up():
+    """ Inicia en segundo plano lo que no hace falta para mostrar el asistente.
+    Se llama desde main.py una vez dibujado el primer frame. """
+
+    start_credentials()
+    ai_backend.start()      # Backend del AI Chat (navegador con el chat ya cargado o sesión HTTP).
+    audio_capture.start()   # Abre y calibra el micrófono una sola vez.
+    earcons.start()         # Decodifica los avisos sonoros una sola vez.
+    journal.start()         # Historial persistente (borra las sesiones antiguas).
+    recognizer.start()      # Carga el modelo del reconocedor local, si lo hay.
+
+
+# Clientes de Calendar y Gmail, construidos una sola vez y compartidos.
+services = GoogleServices(get_credentials)
+
+calendar_store = None   # Copia local del calendario (se abre la primera vez que se usa).
 
 
 # -----------------------------------------------------
@@ -94,179 +148,273 @@ class CancelException(Exception):
         super().__init__(self.msg)
     
     def display_cancel(self, bar, func):    # Muestra un mensaje de cancelación.
+        speech.cancel()     # Descarta lo que quedara pendiente de decir.
         bar.add_text(self.msg)
-        text_to_speech(self.msg)
+        text_to_speech(self.msg, priority=PRIORITY_HIGH)
         logging.warning(f"{func} functionality execution has been canceled.")
 
     @staticmethod   # Método encargado de comprobar y levantar la excepción.
     def check_cancel(str):
         if "cancel" in str and "operation" in str:
             raise CancelException
+
+
+class StopException(CancelException):
+    """ La funcionalidad se ha cancelado desde la interfaz (Back u Off). """
+
+    def __init__(self):
+        super().__init__()
+        self.msg = "Functionality has been stopped."
+
+    def display_cancel(self, bar, func):    # El usuario ya ha salido: no se anuncia.
+        logging.info(f"{func} functionality has been stopped.")
+
+
+def check_stopped():
+    """ Punto de cancelación: lanza StopException si la tarea actual se ha cancelado. """
+
+    if current_token().cancelled():
+        raise StopException
+
+
+def pause(seconds):
+    """ time.sleep que termina en cuanto se cancela la tarea actual. """
+
+    if current_token().wait(seconds):
+        raise StopException
+
+
+# Ejecutor de las funcionalidades (un solo hilo). Al cancelar una tarea se calla la voz.
+features = FeatureExecutor(workers=1, on_cancel=speech.cancel)
         
         
 # -----------------------------------------------------
 # -------- MANEJO DEL HISTORIAL DE CONVERSACIÓN -------
 # -----------------------------------------------------
 
+CHAT_EXPORT_SESSIONS = 10   # Sesiones (ejecuciones de funcionalidades) que se exportan.
+
+
 class ChatHistory:
-    """ Clase que maneja y almacena el historial del chat
-    entre el usuario y el asistente virtual. """
+    """ Clase que registra el historial del chat entre el usuario y el asistente
+    virtual en el historial persistente (journal), donde cada funcionalidad abre una
+    sesión nueva. Los registros (timestamp, speaker, feature, text) solo se convierten
+    en texto al exportarlos. """
 
-    chat_txt = ''
-    
-    @staticmethod   # Limpia el historial del chat.
+    session = None      # Sesión de la funcionalidad en curso en el historial persistente.
+    lock = threading.Lock()
+
+    @staticmethod   # Cierra la sesión en curso: lo que se añada sin título no se guarda.
     def clear_log():
-        ChatHistory.chat_txt = ''
+        with ChatHistory.lock:
+            ChatHistory.session = None
 
-    @staticmethod   # Añade texto + timestamp.
-    def add_text(text):
-        timestamp = datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S] ")
-        ChatHistory.chat_txt += timestamp + text + "\n"
+    @staticmethod   # Añade texto + timestamp (speaker: "User", "VA" o None).
+    def add_text(text, speaker=None):
+        with ChatHistory.lock:
+            session = ChatHistory.session
+        if session:
+            journal.append(session, time.time(), speaker, text)
 
-    @staticmethod   # Añade un título.
+    @staticmethod   # Añade un título: empieza la sesión de una funcionalidad.
     def add_title(title):
-        ChatHistory.chat_txt += "*** " + title + " ***\n"
-    
-    @staticmethod   # Obtiene el contenido del historial del chat.
-    def get_log_txt():
-        return ChatHistory.chat_txt
+        with ChatHistory.lock:
+            ChatHistory.session = journal.begin_session(title)
+
+    @staticmethod   # Genera las líneas del historial del chat una a una (registros de journal.export).
+    def render(records):
+        for timestamp, speaker, feature, text in records:
+            if text is None:
+                yield "*** " + feature + " ***\n"
+            elif speaker:
+                yield timestamp.strftime("[%Y-%m-%d %H:%M:%S] ") + speaker + ": " + text + "\n"
+            else:
+                yield timestamp.strftime("[%Y-%m-%d %H:%M:%S] ") + text + "\n"
     
 
 # -----------------------------------------------------
 # ------------- FUNCIONES DE TEXTO Y HABLA ------------
 # -----------------------------------------------------
 
-def play_sound():
-    """ Reproduce el sonido que indica la activación del micrófono. """
-    sound = AudioSegment.from_wav("assets/bleep.wav")
-    play(sound)
-
-
-def speech_to_text(bar):
-    """ Convierte el audio grabado por el micrófono del PC a texto. """
+def speech_to_text(bar, grammar=None):
+    """ Convierte el audio grabado por el micrófono del PC a texto. El micrófono
+    permanece abierto y calibrado en audio_capture, así que escuchar no añade esperas,
+    y el audio se codifica mientras se graba para reconocerlo en cuanto termina la voz.
+    grammar (las órdenes de un menú) permite al reconocedor local resolverlo sin red. """
+    import speech_recognition as sr
 
     times = 0   # Intentos de capturar audio.
-    r = sr.Recognizer()
-    with sr.Microphone() as source_mic: # Instancia del micrófono del PC.
 
-        while True:
-            if not my_data["running"]:  # Comprueba que la app esté activa.
-                logging.warning("Failed to convert speech to text: App is not running.")
-                break
+    while True:
+        check_stopped()     # Comprueba que la funcionalidad siga activa.
 
-            sound_thread = threading.Thread(target=play_sound)
-            sound_thread.start()    # Alerta al usuario de que puede hablar.
-            
-            r.adjust_for_ambient_noise(source_mic, duration=0.5)    # Ajuste de ruido.
+        start_at = earcons.play("bleep")    # Alerta al usuario de que puede hablar (y no graba el aviso).
+
+        try:
+            encoder = lambda rate, width: recognizer.encoder(rate, width, grammar)
+            utterance = audio_capture.listen(timeout=5, start_at=start_at, encoder=encoder,
+                                             cancelled=current_token().cancelled)   # Recoge la entrada de audio.
 
             try:
-                audio = r.listen(source_mic, timeout=5) # Recoge la entrada de audio.
+                text = recognizer.recognize(utterance, grammar).lower()    # Convierte audio a texto.
+                check_stopped()
+                logging.info(f"Speech recognized {(time.monotonic() - utterance.speech_ended_at) * 1e3:.0f} ms "
+                             f"after the end of speech.")
+                ChatHistory.add_text(f"{text.capitalize()}.", "User")  # Registro del user en el History Chat.
 
-                try:
-                    text = r.recognize_google(audio, language="en-US").lower()  # Convierte audio a texto.
-                    ChatHistory.add_text(f"User: {text.capitalize()}.") # Registro del user en el History Chat.
-
-                    CancelException.check_cancel(text)  # Comprueba si hay que cancelar la acción.
-                    return text
-
-                except sr.UnknownValueError:    # La entrada de audio es ininteligible.
-                    logging.warning("Failed to convert speech to text: Speech is unintelligible.")
-
-                    times += 1
-                    if times >= 3:
-                        text = "Sorry, I can't understand what you're trying to say. Try later in a quieter environment."
-                        bar.add_text(text)
-                        text_to_speech(text)
-                        raise CancelException
-                    
-                    text = "Sorry, I couldn't hear you. Can you repeat it?"
-                    #bar.add_text(text)
-                    text_to_speech(text)
-                    continue
-                
-                except sr.RequestError: # Sin conexión a internet.
-                    logging.error("Failed to convert speech to text: No internet connection.")
-                    
-                    text = "No internet connection. Please check your device's internet connection."
-                    bar.add_text(text)
-                    text_to_speech(text)
-                    raise CancelException
+                CancelException.check_cancel(text)  # Comprueba si hay que cancelar la acción.
+                return text
 
-            except sr.WaitTimeoutError: # El micrófono no escucha nada.
-                logging.warning("Failed to convert speech to text: No audio input has been detected.")
+            except sr.UnknownValueError:    # La entrada de audio es ininteligible.
+                logging.warning("Failed to convert speech to text: Speech is unintelligible.")
 
                 times += 1
                 if times >= 3:
-                    text = "Sorry, I can't hear anything. No audio input has been detected."
+                    text = "Sorry, I can't understand what you're trying to say. Try later in a quieter environment."
                     bar.add_text(text)
                     text_to_speech(text)
                     raise CancelException
-
-                text = "No audio input has been detected. Try again."
+                
+                text = "Sorry, I couldn't hear you. Can you repeat it?"
                 #bar.add_text(text)
                 text_to_speech(text)
                 continue
+            
+            except sr.RequestError: # Sin conexión a internet.
+                logging.error("Failed to convert speech to text: No internet connection.")
+                
+                text = "No internet connection. Please check your device's internet connection."
+                bar.add_text(text)
+                text_to_speech(text)
+                raise CancelException
 
-            except CancelException as e:    # En caso de cancelación, lo maneja la funcionalidad.
-                raise
+        except ListenCancelled:     # Se ha pulsado Back u Off mientras escuchaba.
+            raise StopException
 
-            except Exception as e:
-                error_message = f"Failed to convert speech to text: {str(e)}."
-                
-                logging.error(error_message)
-                bar.add_text(error_message)
-                text_to_speech(error_message)
-                break
+        except ListenTimeout:   # El micrófono no escucha nada.
+            logging.warning("Failed to convert speech to text: No audio input has been detected.")
+
+            times += 1
+            if times >= 3:
+                text = "Sorry, I can't hear anything. No audio input has been detected."
+                bar.add_text(text)
+                text_to_speech(text)
+                raise CancelException
 
+            text = "No audio input has been detected. Try again."
+            #bar.add_text(text)
+            text_to_speech(text)
+            continue
 
-def text_to_speech(text):
-    """ Convierte texto a audio. """
-    
-    engine = pyttsx3.init() # Inicializamos el engine.
+        except CancelException as e:    # En caso de cancelación, lo maneja la funcionalidad.
+            raise
+
+        except Exception as e:
+            error_message = f"Failed to convert speech to text: {str(e)}."
+            
+            logging.error(error_message)
+            bar.add_text(error_message)
+            text_to_speech(error_message)
+            break
+
+
+def text_to_speech(text, wait=True, priority=PRIORITY_NORMAL):
+    """ Convierte texto a audio a través del hilo de voz compartido.
+    Devuelve un Future que se resuelve cuando la locución termina. """
     
-    voices = engine.getProperty('voices')
-    engine.setProperty('voice', voices[1].id)   # Voz inglesa.
-    rate = engine.getProperty('rate')
-    engine.setProperty('rate', rate-50)     # Velocidad de la voz.
+    future = speech.speak(text, priority)
 
-    try:
-        engine.say(text)    # Convierte el texto en audio.
-        engine.runAndWait()
-        ChatHistory.add_text(f"VA: {text}.")    # Registro del VA en el History Chat.
+    def log_speech(future):
+        if future.cancelled():
+            return
+        try:
+            future.result()
+            ChatHistory.add_text(f"{text}.", "VA")  # Registro del VA en el History Chat.
+        except SpeechInterrupted:   # Cortada por una cancelación: no se ha dicho.
+            pass
+        except Exception as e:
+            logging.error(f"Failed to convert text to speech: {str(e)}")
 
-    except Exception as e:
-        logging.error(f"Failed to convert text to speech: {str(e)}")
+    future.add_done_callback(log_speech)
+
+    if wait:    # Por defecto, bloquea hasta que el VA termina de hablar.
+        try:
+            future.result()
+        except Exception:
+            pass
+        check_stopped()
+
+    return future
 
 
-def virtual_assistant_dialogue(virtual_ask, bar):
+def virtual_assistant_dialogue(virtual_ask, bar, grammar=None):
     """ El VA inicia o continúa la comunicación con el usuario
     y posteriormente escucha la respuesta del usuario. Finalmente devuelve 
     la respuesta del usuario para que pueda volver a ser analizada. """
     
-    text_to_speech(virtual_ask) # Convierte el texto del VA en audio
-    return speech_to_text(bar)  # Devuelve el audio del usuario en texto.
+    text_to_speech(virtual_ask) # Convierte el texto del VA en audio y espera a que termine.
+    return speech_to_text(bar, grammar) # En cuanto termina, devuelve el audio del usuario en texto.
+
+
+def fill_slots(bar, slots, questions, render, check=None):
+    """ Rellena los datos (slots) de un formulario hablado preguntando solo por los que
+    faltan. slots son los ya extraídos de la orden; questions es la lista ordenada de los
+    obligatorios (slot, pregunta, parse), donde parse(respuesta, slots) devuelve todos los
+    datos que contiene la respuesta o lanza ValueError con lo que hay que decir al usuario.
+    check(slots), si se indica, quita los datos incoherentes entre sí y devuelve qué decir.
+    render(slots) genera el cuadro de diálogo, que se actualiza con cada respuesta. """
+
+    turns = 0   # Preguntas hechas al usuario.
+
+    while True:
+        problem = check(slots) if check else None
+        bar.add_text(render(slots))
+        if problem:
+            text_to_speech(problem)
+
+        missing = [question for question in questions if question[0] not in slots]
+        if not missing:
+            logging.info(f"Slots filled after {turns} question(s): {', '.join(slots)}.")
+            return slots
+
+        slot, question, parse = missing[0]
+        answer = virtual_assistant_dialogue(question, bar)
+        turns += 1
+        try:
+            for name, value in parse(answer, slots).items():
+                slots.setdefault(name, value)   # Lo ya dicho no se sobrescribe.
+        except ValueError as e:
+            text_to_speech(str(e))
 
 
 # -----------------------------------------------------
 # ----------- FUNCIONALIDAD: GOOGLE CALENDAR ----------
 # -----------------------------------------------------
 
+def get_calendar_store():
+    """ Abre la copia local del calendario la primera vez que se necesita. """
+
+    global calendar_store
+    if calendar_store is None:
+        calendar_store = CalendarStore()
+    return calendar_store
+
+
 def google_calendar_show(bar):
     """ Muestra los siguientes 5 futuros eventos en el calendario. """
 
     logging.info("Calendar Functionality: Displaying next events...")
 
-    now = datetime.datetime.utcnow().isoformat() + 'Z'   # Fecha y hora actual.
-   
     try:
-        service = build('calendar', 'v3', credentials=creds, static_discovery=False) # Servicio de Google Calendar.
+        service = services.get('calendar', 'v3')     # Servicio de Google Calendar.
+        store = get_calendar_store()
+
+        if store.synced():      # Responde desde la copia local y la actualiza en segundo plano.
+            store.refresh(service, services.http('calendar_refresh'))
+        else:                   # La primera vez hay que descargar el calendario.
+            store.sync(service)
 
-        events = service.events().list(calendarId='primary', 
-                                       timeMin=now, 
-                                       maxResults=5,
-                                       singleEvents=True, 
-                                       orderBy='startTime'
-                                       ).execute().get('items', []) # Lista con los próximos 5 eventos.
+        events = store.events(limit=5)  # Lista con los próximos 5 eventos.
 
         if not events:  # Si no hay eventos próximos...
             bar.add_text('No upcoming events found.')
@@ -296,6 +444,9 @@ def google_calendar_show(bar):
             bar.add_text(events_list)
             text_to_speech(virtual_text)
 
+    except CancelException as e:
+        raise
+
     except HttpError as e:
         logging.error(f"Failed to retrieve calendar events. No internet connection: {str(e)}")
 
@@ -311,74 +462,95 @@ def google_calendar_show(bar):
         text_to_speech(error_message)
 
 
-def google_calendar_create(bar):
-    """ Crea un nuevo evento en el calendario. """
+# Preguntas del evento. La primera admite el evento entero en una sola frase.
+EVENT_PROMPTS = {
+    "summary": "Specify the event... Example: meeting with Ana tomorrow 3pm to 4pm",
+    "start": "Specify the start time... Example: next Friday at 9",
+    "end": "Specify the end time... Example: 11am or for two hours",
+}
+EVENT_DATE_FORMAT = '%d of %B %Y at %H:%M'     # Las fechas son de la zona horaria local.
+
+
+def event_info(slots):
+    """ Cuadro de diálogo del evento: cada dato o, si aún falta, su pregunta. """
+
+    return ["--- EVENT INFORMATION ---",
+            f"Event: {slots['summary'].capitalize()}" if "summary" in slots else EVENT_PROMPTS["summary"],
+            f"Description: {slots.get('description', '-').capitalize()}",
+            f"Start Time: {slots['start'].strftime(EVENT_DATE_FORMAT)}" if "start" in slots else EVENT_PROMPTS["start"],
+            f"End Time: {slots['end'].strftime(EVENT_DATE_FORMAT)}" if "end" in slots else EVENT_PROMPTS["end"]]
 
-    logging.info("Calendar Functionality: Creating a new event...")
+
+def event_dates(answer, slots):
+    """ Respuesta a la hora de inicio (puede traer también la de fin: "3pm to 4pm"). Una
+    fecha incomprensible se vuelve a pedir; un fin anterior al inicio lo resuelve check_event. """
 
     try:
-        service = build('calendar', 'v3', credentials=creds, static_discovery=False) # Servicio de Google Calendar.
-
-        # Esto se muestra en el código de dialogo inicial.
-        event_info = ["--- EVENT INFORMATION ---",
-                      "Specify the event...",
-                      "Specify the description of the event...",
-                      "Specify the start time... Example: 1 April 9pm",
-                      "Specify the end time... Example: 2 April 10am"]
-        bar.add_text(event_info)
-        
-        summary = virtual_assistant_dialogue(event_info[1], bar)    # Solicita campo del evento.
-        event_info[1] = f"Event: {summary.capitalize()}"            # Actualiza el cuadro de diálogo.
-        bar.add_text(event_info)                                    # Muestra el nuevo cuadro de diálogo.
+        start, end = parse_range(answer)
+    except DateOrder as e:
+        start, end = e.start, e.end
+    except UnparseableDate:
+        raise ValueError("Sorry, I couldn't understand that date. Try something like tomorrow at 9.")
+    return {"start": start, "end": end} if end else {"start": start}
 
-        description = virtual_assistant_dialogue(event_info[2], bar)
-        event_info[2] = f"Description: {description.capitalize()}"
-        bar.add_text(event_info)
-        
-        start = None
-        end = None
 
-        while not start:
-            date_input = virtual_assistant_dialogue(event_info[3], bar)
-            try:
-                start = parser.parse(date_input).isoformat()
-            except ValueError:
-                text_to_speech("Invalid date format. Please try again.")
+def event_end(answer, slots):
+    """ Respuesta a la hora de fin: una duración o una fecha que toma del inicio lo que no se dice. """
 
-        event_info[3] = f"Start Time: {start}"
-        bar.add_text(event_info)
-        
-        while not end:
-            date_input = virtual_assistant_dialogue(event_info[4], bar)
-            try:
-                check_end = parser.parse(date_input).isoformat()
-                if start >= check_end:
-                    text_to_speech("End date should be later than the start date. Please try again.")
-                else:
-                    end = check_end
-            except ValueError:
-                text_to_speech("Invalid date format. Please try again.")
+    try:
+        return {"end": parse_end(answer, slots["start"])}
+    except DateOrder as e:
+        return {"end": e.end}
+    except UnparseableDate:
+        raise ValueError("Sorry, I couldn't understand that time. Try something like 5pm or for an hour.")
+
+
+def check_event(slots):
+    """ Un fin que no es posterior al inicio se descarta para pedir solo el fin. """
 
-        event_info[4] = f"End Time: {end}"
-        bar.add_text(event_info)
+    if "start" in slots and "end" in slots and slots["end"] <= slots["start"]:
+        del slots["end"]
+        return f"The end time must be later than the start time, {spoken_date(slots['start'])}."
+    return None
+
+
+EVENT_QUESTIONS = [
+    ("summary", EVENT_PROMPTS["summary"], lambda answer, slots: extract_event(answer)),
+    ("start", EVENT_PROMPTS["start"], event_dates),
+    ("end", EVENT_PROMPTS["end"], event_end),
+]
+
+
+def google_calendar_create(bar, slots=None):
+    """ Crea un nuevo evento en el calendario. slots son los datos que ya traía la orden
+    ("create a meeting with Ana tomorrow at 3pm"); solo se pregunta por los que faltan. """
+
+    logging.info("Calendar Functionality: Creating a new event...")
+
+    try:
+        service = services.get('calendar', 'v3')     # Servicio de Google Calendar.
+
+        slots = fill_slots(bar, dict(slots or {}), EVENT_QUESTIONS, event_info, check_event)
+        info = event_info(slots)
 
         # Creación del objecto evento.
         event = {
-            'summary': summary.capitalize(),
-            'description': description.capitalize(),
+            'summary': slots['summary'].capitalize(),
+            'description': slots.get('description', '').capitalize(),
             'start': {
-                'dateTime': start + '+02:00',
+                'dateTime': slots['start'].isoformat(),     # Hora local con su zona horaria.
             },
             'end': {
-                'dateTime': end + '+02:00'
+                'dateTime': slots['end'].isoformat()
             }
         }
         event = service.events().insert(calendarId='primary', body=event).execute()     # Inserción.
-        [ChatHistory.add_text(elem) for elem in event_info]     # Registro del evento en el Chat History.
+        get_calendar_store().save(event)    # El nuevo evento se ve al momento en "show".
+        [ChatHistory.add_text(elem) for elem in info]     # Registro del evento en el Chat History.
         ChatHistory.add_text('Event created: %s' % (event.get('htmlLink')))
 
         text_to_speech("The new event has been succesfully added.")
-        time.sleep(5)
+        pause(5)
     
     except CancelException as e:
         raise
@@ -409,12 +581,11 @@ def cal_func(bar):
 
         va_text = "You are in Calendar. What would you like to do?"
         bar.add_text(va_text)                
-        user_text = virtual_assistant_dialogue(va_text, bar)
+        user_text = virtual_assistant_dialogue(va_text, bar, COMMAND_GRAMMAR)
+        match = matcher.match(user_text, "calendar", allowed=("calendar_show", "calendar_create"))
 
-        if "show" in user_text:
-            google_calendar_show(bar)
-        elif "create" in user_text:
-            google_calendar_create(bar)
+        if match:
+            run_intent(match, bar)
         else:
             logging.warning("Calendar Functionality: Invalid user request.")  # Petición invalida
             error_message = [
@@ -441,61 +612,46 @@ def cal_func(bar):
 # ------------ FUNCIONALIDAD: GOOGLE GMAIL ------------
 # -----------------------------------------------------
 
-def get_email_content(service, msg_id):
-    """ Obtiene información de cada email a partir de su ID. """
-
-    try:
-        message = service.users().messages().get(userId='me', id=msg_id).execute()
-
-        # Obtenemos los datos que mostraremos al usuario a través de las cabeceras.
-        headers = message['payload']['headers']
-        src = [header['value']
-               for header in headers if header['name'].lower() == 'from'][0]
-        date = [header['value']
-                for header in headers if header['name'].lower() == 'date'][0]
-        subject = [header['value']
-                   for header in headers if header['name'].lower() == 'subject'][0]
-        return src, date, subject
-
-    except HttpError as e:
-        raise
-    except Exception as e:
-        raise
+MAIL_PAGE_SIZE = 5  # Número de correos sin leer que se muestran.
 
 
 def google_mail_show(bar):
-    """ Muestra los últimos 10 emails sin leer. """
+    """ Muestra los últimos MAIL_PAGE_SIZE emails sin leer. """
 
     logging.info('Email Functionality: Displaying unread emails...')
 
     try:
-        service = build('gmail', 'v1', credentials=creds, static_discovery=False)   # Servicio de Gmail.
+        service = services.get('gmail', 'v1')    # Servicio de Gmail.
 
         messages = service.users().messages().list(userId='me',
                                                    labelIds=['INBOX'],
                                                    q='category:primary is:unread',
-                                                   maxResults=5
-                                                   ).execute().get('messages', [])  # Últimos 5 correos no leídos.
+                                                   maxResults=MAIL_PAGE_SIZE
+                                                   ).execute().get('messages', [])  # Últimos correos no leídos.
 
         if not messages:    # Si no hay correos sin leer...
             bar.add_text('You have no unread messages.')
             text_to_speech('You have no unread messages.')
 
         else:    # Si hay correos sin leer...
+            # Cabeceras de todos los correos en una sola petición por lotes.
+            summaries = fetch_email_summaries(service, [message['id'] for message in messages])
+
             bar.add_text('These are your last unread emails...')
             text_to_speech('These are your last unread emails...')
 
-            for message in messages:
+            for src, date, subject in summaries:
                 msg_list = ["LAST UNREAD EMAILS: "]
-
-                src, date, subject = get_email_content(service, message['id'])
                 msg_list.append(f'From: {src}')
                 msg_list.append(f'Date: {date}')
                 msg_list.append(f'Subject: {subject}')
 
                 [ChatHistory.add_text(elem) for elem in msg_list]   # Resgistro en Chat History.
                 bar.add_text(msg_list)
-                time.sleep(3) # Muestra un correo cada 3 segundos.
+                pause(3)   # Muestra un correo cada 3 segundos.
+
+    except CancelException as e:
+        raise
 
     except HttpError as e:
         logging.error(f"Failed to retrieve unread emails. No internet connection: {str(e)}")
@@ -512,42 +668,53 @@ def google_mail_show(bar):
         text_to_speech(error_message)
 
 
-def google_mail_create(bar):
-    """ Crea y envía un nuevo correo. """
+# Preguntas del correo. La primera admite el correo entero en una sola frase.
+EMAIL_PROMPTS = {
+    "name": "Specify the receiver name... Example: John at gmail dot com about lunch saying see you at noon",
+    "domain": "Specify the receiver domain...",
+    "subject": "Specify the subject...",
+    "message": "Specify the message...",
+}
 
-    logging.info('Email Functionality: Creating a new mail...')
 
-    try:
-        service = build('gmail', 'v1', credentials=creds, static_discovery=False)   # Servicio de Gmail.
+def email_info(slots):
+    """ Cuadro de diálogo del correo: cada dato o, si aún falta, su pregunta. """
+
+    info = ["EMAIL INFORMATION: "]
+    if "name" not in slots:
+        info += [EMAIL_PROMPTS["name"], EMAIL_PROMPTS["domain"]]
+    elif "domain" not in slots:
+        info += [f"To: {slots['name']}", EMAIL_PROMPTS["domain"]]
+    else:
+        info.append(f"To: {slots['name']}@{slots['domain']}")
+    info.append(f"Subject: {slots['subject'].capitalize()}" if "subject" in slots else EMAIL_PROMPTS["subject"])
+    info.append(f"Message: {slots['message'].capitalize()}" if "message" in slots else EMAIL_PROMPTS["message"])
+    return info
 
-        # Esto se muestra en el código de dialogo inicial.
-        email_info = ["EMAIL INFORMATION: ",
-                    "Specify the receiver name...",
-                    "Specify the receiver domain...",
-                    "Specify the subject...",
-                    "Specify the message..."]
-        bar.add_text(email_info)
 
-        to_name = virtual_assistant_dialogue(email_info[1], bar).replace(" ", "").lower()
-        email_info[1] = f"To: {to_name}"
-        bar.add_text(email_info)
+EMAIL_QUESTIONS = [
+    ("name", EMAIL_PROMPTS["name"], lambda answer, slots: extract_email("to " + answer)),    # "John at ..."
+    ("domain", EMAIL_PROMPTS["domain"], lambda answer, slots: {"domain": email_domain(answer).lower()}),
+    ("subject", EMAIL_PROMPTS["subject"], lambda answer, slots: {"subject": answer}),
+    ("message", EMAIL_PROMPTS["message"], lambda answer, slots: {"message": answer}),
+]
+
+
+def google_mail_create(bar, slots=None):
+    """ Crea y envía un nuevo correo. slots son los datos que ya traía la orden
+    ("send an email to John about lunch"); solo se pregunta por los que faltan. """
 
-        to_domain = virtual_assistant_dialogue(email_info[2], bar)
-        email_info[1] = f"To: {to_name}@{to_domain}"
-        del email_info[2]
-        bar.add_text(email_info)
+    logging.info('Email Functionality: Creating a new mail...')
 
-        subject = virtual_assistant_dialogue(email_info[2], bar)
-        email_info[2] = f"Subject: {subject.capitalize()}"
-        bar.add_text(email_info)
+    try:
+        service = services.get('gmail', 'v1')    # Servicio de Gmail.
 
-        msg_text = virtual_assistant_dialogue(email_info[3], bar)
-        email_info[3] = f"Message: {msg_text.capitalize()}"
-        bar.add_text(email_info)
+        slots = fill_slots(bar, dict(slots or {}), EMAIL_QUESTIONS, email_info)
+        info = email_info(slots)
 
-        message = MIMEText(msg_text.capitalize())    # Crea un objeto mensaje a través del contenido del mismo.
-        message['to'] = f"{to_name}@{to_domain}"    # Modifica los campos.
-        message['subject'] = subject.capitalize()
+        message = MIMEText(slots['message'].capitalize())   # Crea un objeto mensaje a través del contenido del mismo.
+        message['to'] = f"{slots['name']}@{slots['domain']}"   # Modifica los campos.
+        message['subject'] = slots['subject'].capitalize()
 
         # El mensaje y su contenido se codifican para que puedan ser enviados de forma segura.
         email = {'raw': base64.urlsafe_b64encode(message.as_string().encode()).decode()}
@@ -557,9 +724,9 @@ def google_mail_create(bar):
         ).execute()
         logging.info('Message Id: %s' % message_result['id'])
 
-        [ChatHistory.add_text(elem) for elem in email_info]    # Registro nuevo correo en Chat History.
+        [ChatHistory.add_text(elem) for elem in info]    # Registro nuevo correo en Chat History.
         text_to_speech("The new email has been succesfully send.")
-        time.sleep(5)
+        pause(5)
 
     except CancelException as e:
         raise
@@ -589,12 +756,11 @@ def mail_func(bar):
 
         virtual_text = "You are in Email. What would you like to do?"
         bar.add_text(virtual_text)
-        user_text = virtual_assistant_dialogue(virtual_text, bar)
+        user_text = virtual_assistant_dialogue(virtual_text, bar, COMMAND_GRAMMAR)
+        match = matcher.match(user_text, "mail", allowed=("mail_show", "mail_create"))
 
-        if "show" in user_text:
-            google_mail_show(bar)                     
-        elif "create" in user_text:
-            google_mail_create(bar)
+        if match:
+            run_intent(match, bar)
         else:
             
             logging.warning("Email Functionality: Invalid user request.") # Petición invalida
@@ -622,56 +788,62 @@ def mail_func(bar):
 # --------------- FUNCIONALIDAD: AI CHAT --------------
 # -----------------------------------------------------
 
-def ai_func(bar):
-    """ A través de una herramienta de automatización diseñada para navegadores,
-    hace uso de las AI disponibles en internet para obtener una respuesta de caracter
-    general a partir de la entrada de voz generada por el usuario. """
+def ai_func(bar, question=None):
+    """ A través del backend configurado (un chat web automatizado con un navegador
+    o una API compatible con OpenAI), hace uso de las AI disponibles para obtener una
+    respuesta de caracter general a partir de la entrada de voz generada por el usuario.
+    Si la pregunta ya viene en una orden de voz ("ask ..."), no se vuelve a pedir. """
 
     logging.info('Initializing AI Chat...')
 
     ChatHistory.clear_log()  # Prepara el log del dialogo.
     ChatHistory.add_title("AI CHAT FUNCTIONALITY")
 
+    conversation = None
+    failed = False
+
     try:
-        with sync_playwright() as playwright:
-            browser = playwright.chromium.launch(headless=True)  # Navegador no visible para el usuario.
-            context = browser.new_context()
-            page = context.new_page()
-            page.goto("https://www.aichatting.net/")
+        conversation = ai_backend.new_conversation()    # Mantiene el contexto entre preguntas.
 
+        if question:
+            user_input = question
+        else:
             virtual_text = "What would you like to ask?"
             bar.add_text(virtual_text)
             user_input = virtual_assistant_dialogue(virtual_text, bar)
 
-            number = 3  # Parametro de configuración de la pag web usada.
-
-            while True:     
-                # Se busca y rellena el elemento donde el usuario introduce la informacion.
-                page.get_by_placeholder("Enter text here...").fill(user_input + '. Answer in less than 50 words.', timeout=10000)
-                page.get_by_placeholder("Enter text here...").press("Enter")
-
-                # Espera cierta condición que implica que la IA ya ha terminado de escribir su respuesta.
-                page.get_by_placeholder("Enter text here...").fill(' ', timeout=10000)
-
-                # Extrae e imprime el contenido del elemento con la respuesta de la IA.
-                output = page.query_selector(f"li:nth-child({number}) span").inner_text()
+        while True:     
+            # Muestra la respuesta mientras la IA la escribe y lee cada frase en cuanto termina.
+            splitter = SentenceSplitter()
+            speaking = []
 
+            for output in conversation.stream(user_input):
+                check_stopped()
                 bar.add_text(output)
-                text_to_speech(output)
+                for sentence in splitter.feed(output):
+                    speaking.append(text_to_speech(sentence, wait=False))
+
+            for sentence in splitter.flush(output):
+                speaking.append(text_to_speech(sentence, wait=False))
 
-                if "bye" in user_input:     # El bucle se rompe cuando el usuario se despide.
-                    break
+            for future in speaking:     # Espera a terminar de hablar antes de escuchar.
+                try:
+                    future.result()
+                except Exception:
+                    pass
 
-                user_input = speech_to_text(bar)
-                number += 2
+            if "bye" in user_input:     # El bucle se rompe cuando el usuario se despide.
+                break
 
-            context.close()
-            browser.close()
+            user_input = speech_to_text(bar)
     
     except CancelException as e:
         e.display_cancel(bar, "AI Chat")
 
-    except HttpError as e:
+    except BrowserCallCancelled:    # Se ha pulsado Back u Off mientras esperaba a la IA.
+        StopException().display_cancel(bar, "AI Chat")
+
+    except (HttpError, ConnectionError) as e:
         logging.error(f"Failed to connect to AI Chat. No internet connection: {str(e)}")
 
         error_message = "Failed to connect to AI Chat. Please check your device's internet connection."
@@ -680,25 +852,28 @@ def ai_func(bar):
 
     except Exception as e:
         logging.error(f"Failed to connect to AI Chat: {str(e)}")
+        failed = True
 
         error_message = "Failed to connect to AI Chat."
         bar.add_text(error_message)
         text_to_speech(error_message)
 
+    finally:    # Libera la conversación (la página del chat web se recrea si ha fallado).
+        if conversation is not None:
+            conversation.close(failed)
+
 
 # -----------------------------------------------------
 # ------------- FUNCIONALIDAD: PC CONTROL -------------
 # -----------------------------------------------------
 
-def open_app(user_text, bar):
+def open_app(app, bar):
     """ Abre la barra de búsqueda y escribe el nombre de la app. """
+    import pyautogui
     
     logging.info("Control PC Functionality: Opening the app...")
-    
-    words = user_text.split()
-    index = words.index("open")
 
-    if words[-1] == "open":
+    if not app:
         error_message = f"I'm sorry. You haven't specify an app to open."
 
         bar.add_text(error_message)
@@ -708,12 +883,10 @@ def open_app(user_text, bar):
         raise CancelException
     
     else:
-        app = words[index + 1]  # La palabra que sigue a open es la aplicacion que abriremos.
-        
         pyautogui.press('win')  # Utiliza la barra de busqueda para buscar
-        time.sleep(1)
+        pause(1)
         pyautogui.typewrite(app)
-        time.sleep(1)
+        pause(1)
         pyautogui.press('enter')
 
         text = f"Opening the app {app}..."
@@ -721,7 +894,7 @@ def open_app(user_text, bar):
         text_to_speech(text)
 
         # Tras 3 segundos, comprueba si se ha abierto.
-        time.sleep(3)
+        pause(3)
         def get_title(arr, app):
             for title in arr:
                 title_lower = title.lower()
@@ -746,15 +919,13 @@ def open_app(user_text, bar):
             logging.warning(error_message)
 
 
-def close_app(user_text, bar):
+def close_app(app, bar):
     """Cierra la aplicación, sin importar si se encuentra en primer plano o no."""
+    import pyautogui
 
     logging.info("Control PC Functionality: Closing the app...")
 
-    words = user_text.split()
-    index = words.index("close")
-
-    if words[-1] == "close":
+    if not app:
         error_message = f"I'm sorry. You haven't specify an app to close."
 
         bar.add_text(error_message)
@@ -764,8 +935,6 @@ def close_app(user_text, bar):
         raise CancelException
     
     else:    
-        app = words[index + 1]      # La palabra que sigue a close es la aplicacion que cerraremos.
-
         # Obtiene el nombre de la pestaña y busca su PID.
         def get_title(arr, app):
             for title in arr:
@@ -807,13 +976,14 @@ def close_app(user_text, bar):
 
 def screenshot(bar):
     """Realiza una captura de pantalla."""
+    import pyautogui
 
     logging.info("Control PC Functionality: Taking a screenshot...")
 
     try:
         virtual_text = "Do you want to save the printscreen afterwards?"
         bar.add_text(virtual_text)
-        user_input = virtual_assistant_dialogue(virtual_text, bar)
+        user_input = virtual_assistant_dialogue(virtual_text, bar, COMMAND_GRAMMAR)
 
         text = ""
 
@@ -832,17 +1002,18 @@ def screenshot(bar):
         raise
 
 
-def volume_level(user_text, bar):
-    """Ajusta el nivel de volumen."""
+def volume_level(direction, bar):
+    """Ajusta el nivel de volumen (direction: "up", "down" o "mute")."""
+    import pyautogui
 
     logging.info("Control PC Functionality: Changing volume level...")
 
     text = ""
 
-    if "up" in user_text:
+    if direction == "up":
         pyautogui.press('volumeup', presses=15, interval=0.1)
         text = "The volume has been successfully raised."
-    elif "down" in user_text:
+    elif direction == "down":
         pyautogui.press('volumedown', presses=15, interval=0.1)
         text = "The volume has been successfully lowered."
     else:
@@ -865,16 +1036,11 @@ def control_func(bar):
 
         virtual_text = "You are in Controls. What do you want to do?"
         bar.add_text(virtual_text)
-        user_text = virtual_assistant_dialogue(virtual_text, bar)
-
-        if "open" in user_text:
-            open_app(user_text, bar)
-        elif "close" in user_text:
-            close_app(user_text, bar)
-        elif "screen" in user_text:
-            screenshot(bar)
-        elif "volume" in user_text or "sound" in user_text:
-            volume_level(user_text, bar)
+        user_text = virtual_assistant_dialogue(virtual_text, bar, COMMAND_GRAMMAR)
+        match = matcher.match(user_text, allowed=("open_app", "close_app", "screenshot", "volume"))
+
+        if match:
+            run_intent(match, bar)
         else:
             logging.warning("PC Control Functionality: Invalid user request.") # Petición invalida
             error_message = [
@@ -898,21 +1064,92 @@ def control_func(bar):
         text_to_speech(error_message)
 
 
+# -----------------------------------------------------
+# ------------ FUNCIONALIDAD: ÓRDENES DE VOZ ----------
+# -----------------------------------------------------
+
+def run_intent(match, bar):
+    """ Ejecuta la acción de una intención reconocida con sus datos. """
+
+    logging.info(f"Running intent {match.intent} {match.slots}.")
+
+    if match.intent == "calendar_show":
+        google_calendar_show(bar)
+    elif match.intent == "calendar_create":
+        google_calendar_create(bar, match.slots)
+    elif match.intent == "mail_show":
+        google_mail_show(bar)
+    elif match.intent == "mail_create":
+        google_mail_create(bar, match.slots)
+    elif match.intent == "open_app":
+        open_app(match.slots["app"], bar)
+    elif match.intent == "close_app":
+        close_app(match.slots["app"], bar)
+    elif match.intent == "screenshot":
+        screenshot(bar)
+    elif match.intent == "volume":
+        volume_level(match.slots["direction"], bar)
+    elif match.intent == "ai_chat":
+        ai_func(bar, match.slots["question"])
+
+
+def command_func(bar):
+    """ Orden de voz desde el menú principal: una sola frase ("show my next events",
+    "open notepad") se reconoce y se ejecuta directamente, sin elegir antes la
+    funcionalidad ni pasar por su pregunta inicial. """
+
+    logging.info('Initializing Voice Command...')
+
+    try:
+        ChatHistory.clear_log() # Prepara el log del dialogo.
+        ChatHistory.add_title("VOICE COMMAND")
+
+        bar.add_text("What would you like to do?")
+        user_text = speech_to_text(bar)     # El aviso sonoro basta para saber que escucha.
+        match = matcher.match(user_text)
+
+        if match:
+            run_intent(match, bar)
+        else:
+            logging.warning("Voice Command: Invalid user request.") # Petición invalida
+            error_message = [
+                "I'm sorry, I can't understand your request.",
+                "Try for example:",
+                "- SHOW MY NEXT EVENTS / CREATE AN EVENT.",
+                "- CHECK MY EMAIL / SEND AN EMAIL.",
+                "- OPEN NOTEPAD / CLOSE NOTEPAD / VOLUME UP.",
+                "- ASK followed by your question."
+            ]
+            bar.add_text(error_message)
+            text_to_speech(' '.join(error_message[:2]))
+
+    except CancelException as e:
+        e.display_cancel(bar, "Voice Command")
+
+    except Exception as e:
+        error_message = f"Failed to run the voice command: {str(e)}."
+
+        logging.error(error_message)
+        bar.add_text(error_message)
+        text_to_speech(error_message)
+
+
 # -----------------------------------------------------
 # ------------ FUNCIONALIDAD: CHAT HISTORY ------------
 # -----------------------------------------------------
 
 def chat_history_func(bar):
-    """Devuelve una salida con la conversación del asistente y el
-    usuario de la funcionalidad anterior."""
+    """Devuelve una salida con las conversaciones del asistente y el
+    usuario de las últimas funcionalidades, leídas del historial persistente."""
 
     logging.info("Initializing Chat History Functionality...")
 
     try:
         desktop = os.path.join(os.path.expanduser('~'), 'Desktop')  # Ruta del directorio del usuario.
         file_path = os.path.join(desktop, 'chat_history.txt')
-        file = open(file_path, 'w')             # Crea el fichero.
-        file.write(ChatHistory.get_log_txt())   # Rellena el fichero.
+        records = journal.export(last_sessions=CHAT_EXPORT_SESSIONS)
+        with open(file_path, 'w') as file:                  # Crea el fichero.
+            file.writelines(ChatHistory.render(records))    # Lo rellena registro a registro.
 
         text = "The Chat history output has been saved to your desktop."
 
@@ -920,6 +1157,9 @@ def chat_history_func(bar):
         text_to_speech(text)
         logging.info(text)
     
+    except CancelException as e:
+        e.display_cancel(bar, "Chat History")
+
     except Exception as e:
         error_message = f"Failed to create Chat History output: {str(e)}."
 
@@ -0,0 +1,586 @@
+import audioop
+import collections
+import itertools
+import logging
+import queue
+import threading
+import os
+import time
+import wave
+from concurrent.futures import Future
+
+# -----------------------------------------------------
+# ------------- MOTORES DE TEXTO A VOZ (TTS) ----------
+# -----------------------------------------------------
+
+class Pyttsx3Backend:
+    """ Motor de voz real basado en pyttsx3. Se inicializa una sola vez
+    y debe usarse siempre desde el hilo que lo ha creado. """
+
+    def __init__(self):
+        import pyttsx3
+
+        self.engine = pyttsx3.init()    # Inicializamos el engine.
+
+        voices = self.engine.getProperty('voices')
+        self.engine.setProperty('voice', voices[1].id)  # Voz inglesa.
+        rate = self.engine.getProperty('rate')
+        self.engine.setProperty('rate', rate-50)        # Velocidad de la voz.
+
+    def say(self, text, interrupted=lambda: False):
+        """ Convierte el texto en audio y espera a que termine. Antes de cada palabra
+        consulta interrupted() y, si es cierto, corta la locución desde este mismo hilo.
+        Devuelve si la locución ha sonado entera. """
+
+        stopped = []
+
+        def on_word(name, location, length):
+            if interrupted():
+                stopped.append(True)
+                self.engine.stop()
+
+        token = self.engine.connect('started-word', on_word)
+        try:
+            self.engine.say(text)
+            self.engine.runAndWait()
+        finally:
+            self.engine.disconnect(token)
+        return not stopped
+
+
+class SilentBackend:
+    """ Motor de voz silencioso para pruebas. Simula la duración de cada
+    locución a partir del número de palabras, sin reproducir audio.
+
+        Args:
+            seconds_per_word (float, optional): Duración simulada de cada palabra.
+    """
+
+    def __init__(self, seconds_per_word=0.0):
+        self.seconds_per_word = seconds_per_word
+        self.spoken = []
+
+    def say(self, text, interrupted=lambda: False):
+        deadline = time.perf_counter() + self.seconds_per_word * len(text.split())
+        while time.perf_counter() < deadline:
+            if interrupted():
+                return False
+            time.sleep(min(0.005, max(0, deadline - time.perf_counter())))
+        self.spoken.append(text)
+        return True
+
+
+# -----------------------------------------------------
+# ----------------- HILO DE LOCUCIÓN ------------------
+# -----------------------------------------------------
+
+PRIORITY_HIGH = 0       # Avisos urgentes (errores, cancelaciones).
+PRIORITY_NORMAL = 1     # Diálogo habitual del asistente.
+
+
+class SpeechInterrupted(Exception):
+    """ La locución se ha cortado antes de terminar (SpeechWorker.cancel). """
+
+
+class SpeechWorker:
+    """ Hilo de larga duración que posee un único motor de voz ya inicializado
+    y atiende una cola de locuciones por orden de prioridad.
+
+    Cada locución devuelve un Future que se resuelve cuando termina de sonar,
+    de modo que quien la pidió puede abrir el micrófono en ese mismo instante.
+    El motor solo se usa desde este hilo: cancel no lo toca, sino que marca las
+    locuciones encoladas hasta ese momento como interrumpidas y el hilo corta la
+    que está sonando (su Future termina con SpeechInterrupted).
+
+        Args:
+            backend (callable, optional): Crea el motor de voz. Se invoca dentro del hilo.
+    """
+
+    def __init__(self, backend=Pyttsx3Backend):
+        self.backend_factory = backend
+        self.backend = None
+        self.queue = queue.PriorityQueue()
+        self.counter = itertools.count()    # Mantiene el orden de llegada entre iguales.
+        self.cutoff = -1    # Las locuciones encoladas antes de este número se interrumpen.
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """ Arranca el hilo si aún no está en marcha. """
+
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="SpeechWorker", daemon=True)
+                self.thread.start()
+
+    def speak(self, text, priority=PRIORITY_NORMAL):
+        """ Encola una locución y devuelve un Future que se resuelve al terminar. """
+
+        self.start()
+        future = Future()
+        future.queued_at = time.perf_counter()
+        self.queue.put((priority, next(self.counter), text, future))
+        return future
+
+    def cancel(self):
+        """ Descarta las locuciones pendientes e interrumpe la que está sonando. """
+
+        self.cutoff = next(self.counter)
+
+        stops = []      # Señales de parada, que no se descartan.
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item[3] is None:
+                stops.append(item)
+            else:
+                item[3].cancel()
+        for item in stops:
+            self.queue.put(item)
+
+    def stop(self):
+        """ Cancela lo pendiente y detiene el hilo. """
+
+        self.cancel()
+        self.queue.put((-1, next(self.counter), None, None))
+
+    def run(self):
+        """ Bucle del hilo: toma locuciones de la cola y las reproduce. """
+
+        try:
+            self.backend = self.backend_factory()
+        except Exception as e:
+            logging.error(f"Failed to initialize text to speech engine: {str(e)}")
+
+        while True:
+            _, order, text, future = self.queue.get()
+
+            if future is None:      # Señal de parada.
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            future.started_at = time.perf_counter()
+            try:
+                if self.backend is None:
+                    raise RuntimeError("Text to speech engine is not available.")
+                if self.backend.say(text, lambda: order < self.cutoff):
+                    future.set_result(text)
+                else:
+                    future.set_exception(SpeechInterrupted(text))
+            except Exception as e:
+                future.set_exception(e)
+
+
+speech = SpeechWorker()     # Hilo de voz compartido por todas las funcionalidades.
+
+
+# -----------------------------------------------------
+# ------------------ AVISOS SONOROS -------------------
+# -----------------------------------------------------
+
+EARCONS = {"bleep": "assets/bleep.wav"}    # Avisos sonoros (nombre: fichero WAV).
+EARCON_BUFFER = 256     # Muestras del buffer de salida (~6 ms a 44100 Hz).
+EARCON_SILENCE = 0.01   # Por debajo de esta fracción del pico, el aviso ya no se oye.
+
+
+class Earcon:
+    """ Aviso sonoro decodificado a PCM en el formato del mezclador. """
+
+    def __init__(self, sound, audible):
+        self.sound = sound
+        self.audible = audible  # Segundos hasta que el aviso deja de oírse.
+
+
+class Earcons:
+    """ Avisos sonoros precargados. Cada WAV se decodifica una sola vez y se reproduce
+    por la salida de audio de pygame, que permanece abierta, así que empezar un aviso
+    solo cuesta encolarlo en el mezclador.
+
+        Args:
+            cues (dict, optional): Avisos a cargar (nombre: fichero WAV).
+    """
+
+    def __init__(self, cues=EARCONS):
+        self.cues = cues
+        self.loaded = {}
+        self.latency = 0    # Segundos que tarda el buffer de salida en reproducir el audio.
+        self.lock = threading.Lock()
+
+    def start(self):
+        """ Abre la salida de audio y decodifica los avisos si aún no se ha hecho. """
+
+        with self.lock:
+            if self.loaded:
+                return
+            import pygame
+
+            if not pygame.mixer.get_init():
+                pygame.mixer.init(buffer=EARCON_BUFFER)
+            rate, size, channels = pygame.mixer.get_init()
+            self.latency = EARCON_BUFFER / rate
+
+            for name, path in self.cues.items():
+                with wave.open(path, 'rb') as wav:
+                    data = wav.readframes(wav.getnframes())
+                    width, source_channels, source_rate = wav.getsampwidth(), wav.getnchannels(), wav.getframerate()
+
+                # Convierte al formato del mezclador (16 bits con signo).
+                if width != 2:
+                    data = audioop.lin2lin(data, width, 2)
+                if source_channels != channels:
+                    data = (audioop.tomono(data, 2, 0.5, 0.5) if channels == 1
+                            else audioop.tostereo(data, 2, 1, 1))
+                if source_rate != rate:
+                    data, _ = audioop.ratecv(data, 2, channels, source_rate, rate, None)
+
+                self.loaded[name] = Earcon(pygame.mixer.Sound(buffer=data), self.audible(data, rate, channels))
+
+    def audible(self, data, rate, channels):
+        """ Segundos desde el inicio hasta el último bloque de 10 ms que se oye. """
+
+        block = rate // 100 * channels * 2
+        energies = [audioop.rms(data[i:i + block], 2) for i in range(0, len(data), block)]
+        loud = [i for i, energy in enumerate(energies) if energy > max(energies) * EARCON_SILENCE]
+        return (loud[-1] + 1) / 100 if loud else 0
+
+    def play(self, name):
+        """ Reproduce el aviso y devuelve el instante (time.monotonic) en que deja de oírse,
+        a partir del cual se puede escuchar al usuario. """
+
+        try:
+            self.start()
+            earcon = self.loaded[name]
+            played_at = time.monotonic()
+            earcon.sound.play()
+            return played_at + self.latency + earcon.audible
+        except Exception as e:
+            logging.warning(f"Failed to play the {name} sound: {str(e)}")
+            return time.monotonic()
+
+
+earcons = Earcons()     # Avisos sonoros compartidos por todas las funcionalidades.
+
+
+# -----------------------------------------------------
+# ----------------- FUENTES DE AUDIO ------------------
+# -----------------------------------------------------
+
+class MicrophoneSource:
+    """ Micrófono del PC (a través de speech_recognition / PyAudio). Se abre una
+    sola vez y se lee en bloques de chunk muestras.
+
+        Args:
+            device_index (int, optional): Micrófono a usar (por defecto, el del sistema).
+    """
+
+    def __init__(self, device_index=None):
+        import speech_recognition as sr
+
+        self.microphone = sr.Microphone(device_index=device_index)
+        self.microphone.__enter__()     # Abre el stream de PyAudio.
+        self.sample_rate = self.microphone.SAMPLE_RATE
+        self.sample_width = self.microphone.SAMPLE_WIDTH
+        self.chunk = self.microphone.CHUNK
+
+    def read(self):
+        return self.microphone.stream.read(self.chunk)
+
+    def close(self):
+        self.microphone.__exit__(None, None, None)
+
+
+class WavSource:
+    """ Fuente de audio a partir de ficheros WAV, para probar la captura sin micrófono.
+    Al terminar los ficheros sigue entregando silencio.
+
+        Args:
+            paths (list): Ficheros WAV que se reproducen uno detrás de otro.
+            speed (float, optional): 1.0 entrega el audio en tiempo real; 0 lo más rápido posible.
+            chunk (int, optional): Muestras por bloque.
+    """
+
+    def __init__(self, paths, speed=1.0, chunk=1024):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.speed = speed
+        self.chunk = chunk
+        self.finished = threading.Event()   # Se activa al terminar el último fichero.
+        self.current = None
+
+        with wave.open(self.paths[0], 'rb') as wav:
+            self.sample_rate = wav.getframerate()
+            self.sample_width = wav.getsampwidth()
+
+    def read(self):
+        data = b""
+        while self.paths or self.current:
+            if self.current is None:
+                self.current = wave.open(self.paths.pop(0), 'rb')
+
+            data = self.current.readframes(self.chunk)
+            if data:
+                if self.current.getnchannels() == 2:
+                    data = audioop.tomono(data, self.sample_width, 0.5, 0.5)
+                break
+            self.current.close()
+            self.current = None
+
+        if not data:    # Sin más ficheros: silencio en tiempo real.
+            self.finished.set()
+            data = b"\0" * self.chunk * self.sample_width
+            time.sleep(self.chunk / self.sample_rate)
+        elif self.speed:
+            time.sleep(self.chunk / self.sample_rate / self.speed)
+
+        return data
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+
+
+# -----------------------------------------------------
+# ----------------- CAPTURA DE AUDIO ------------------
+# -----------------------------------------------------
+
+# Segundos de silencio tras la voz que dan por terminada una intervención.
+END_SILENCE = float(os.environ.get("VA_END_SILENCE", 0.6))
+
+class ListenTimeout(Exception):
+    """ No se ha detectado voz en el tiempo de espera. """
+
+
+class ListenCancelled(Exception):
+    """ Se ha dejado de escuchar porque la tarea se ha cancelado. """
+
+
+class Utterance:
+    """ Fragmento de audio con una intervención del usuario (PCM mono). Si se ha
+    capturado con un codificador, encoded ya contiene el audio codificado durante la grabación. """
+
+    def __init__(self, data, sample_rate, sample_width, started_at, speech_ended_at, ended_at, encoded=None):
+        self.data = data
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.started_at = started_at            # Hora de lectura del primer bloque con voz.
+        self.speech_ended_at = speech_ended_at  # Hora de lectura del último bloque con voz.
+        self.ended_at = ended_at                # Hora de lectura del último bloque (fin del silencio).
+        self.encoded = encoded
+
+    def duration(self):
+        return len(self.data) / (self.sample_rate * self.sample_width)
+
+
+class AudioCapture:
+    """ Servicio de captura de audio de larga duración. Mantiene la fuente (micrófono)
+    abierta y la lee en un hilo propio hacia un buffer circular de bloques. El umbral de
+    energía se calibra una sola vez al arrancar y después se ajusta poco a poco con los
+    bloques de silencio, de modo que escuchar no añade tiempo muerto.
+
+        Args:
+            source (callable, optional): Crea la fuente de audio. Se invoca dentro del hilo.
+            buffer_seconds (float, optional): Segundos de audio que guarda el buffer circular.
+            calibration (float, optional): Segundos de audio usados para la calibración inicial.
+            pause_threshold (float, optional): Segundos de silencio que terminan una intervención.
+    """
+
+    energy_ratio = 1.5          # La voz debe superar el ruido de fondo en esta proporción.
+    damping = 0.15              # Amortiguación del ajuste del umbral (por segundo).
+    phrase_threshold = 0.3      # Duración mínima de voz para considerarla una intervención.
+    non_speaking_duration = 0.5 # Silencio que se conserva antes del inicio de la voz.
+    tail_duration = 0.2         # Silencio que se conserva tras el final de la voz.
+
+    def __init__(self, source=MicrophoneSource, buffer_seconds=30, calibration=0.5, pause_threshold=END_SILENCE):
+        self.source_factory = source
+        self.buffer_seconds = buffer_seconds
+        self.calibration = calibration
+        self.pause_threshold = pause_threshold
+        self.source = None
+        self.frames = None              # Buffer circular de bloques (hora de lectura, energía, datos).
+        self.total = 0                  # Bloques leídos desde el arranque.
+        self.energy_threshold = 300
+        self.condition = threading.Condition()
+        self.ready = threading.Event()  # Fuente abierta y umbral calibrado.
+        self.error = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """ Arranca el hilo de captura si aún no está en marcha. """
+
+        with self.condition:
+            if self.thread is None or not self.thread.is_alive():
+                self.running = True
+                self.ready.clear()
+                self.thread = threading.Thread(target=self.run, name="AudioCapture", daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        """ Detiene la captura y cierra la fuente. """
+
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+    def run(self):
+        """ Bucle del hilo: lee bloques de la fuente y los guarda en el buffer. """
+
+        try:
+            self.source = self.source_factory()
+        except Exception as e:
+            logging.error(f"Failed to open audio source: {str(e)}")
+            self.error = e
+            self.ready.set()
+            with self.condition:
+                self.condition.notify_all()
+            return
+
+        seconds_per_buffer = self.source.chunk / self.source.sample_rate
+        self.frames = collections.deque(maxlen=int(self.buffer_seconds / seconds_per_buffer))
+        calibration_frames = int(self.calibration / seconds_per_buffer)
+        damping = self.damping ** seconds_per_buffer
+
+        try:
+            while self.running:
+                data = self.source.read()
+                energy = audioop.rms(data, self.source.sample_width)
+
+                # Calibración inicial y ajuste continuo con los bloques de silencio.
+                if self.total < calibration_frames or energy <= self.energy_threshold:
+                    target = energy * self.energy_ratio
+                    self.energy_threshold = self.energy_threshold * damping + target * (1 - damping)
+
+                with self.condition:
+                    self.frames.append((time.monotonic(), energy, data))
+                    self.total += 1
+                    if self.total == calibration_frames:
+                        logging.info(f"Microphone calibrated. Energy threshold: {self.energy_threshold:.0f}.")
+                        self.ready.set()
+                    self.condition.notify_all()
+
+        except Exception as e:
+            logging.error(f"Failed to capture audio: {str(e)}")
+            self.error = e
+
+        finally:
+            self.source.close()
+            self.ready.set()
+            with self.condition:
+                self.condition.notify_all()
+
+    def frame(self, index):
+        """ Espera y devuelve el bloque número index del buffer. """
+
+        with self.condition:
+            while index >= self.total:
+                if self.error is not None or not self.running:
+                    raise RuntimeError(f"Audio capture is not available: {self.error}")
+                self.condition.wait(timeout=0.5)
+            first = self.total - len(self.frames)
+            return self.frames[max(index, first) - first]
+
+    def first_frame_after(self, moment):
+        """ Índice del primer bloque leído después del instante moment (time.monotonic). """
+
+        with self.condition:
+            first = self.total - len(self.frames)
+            for offset, (read_at, _, _) in enumerate(self.frames):
+                if read_at > moment:
+                    return first + offset
+            return self.total
+
+    def listen(self, timeout=5, phrase_time_limit=None, start_at=None, encoder=None, cancelled=None):
+        """ Devuelve la siguiente intervención del usuario que empiece después de start_at
+        (por defecto, ahora). Lanza ListenTimeout si en timeout segundos de audio no hay voz.
+
+        La voz se segmenta bloque a bloque. Si se indica encoder(sample_rate, sample_width),
+        cada bloque se le entrega en cuanto se acepta, de modo que la codificación avanza
+        mientras se sigue grabando; el silencio final solo se entrega si la voz continúa.
+        Si cancelled() se cumple, deja de escuchar en el siguiente bloque (ListenCancelled). """
+
+        self.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise RuntimeError(f"Audio capture is not available: {self.error}")
+
+        start_at = time.monotonic() if start_at is None else start_at
+        sample_rate, sample_width = self.source.sample_rate, self.source.sample_width
+        seconds_per_buffer = self.source.chunk / sample_rate
+        pre_roll = collections.deque(maxlen=int(self.non_speaking_duration / seconds_per_buffer))
+
+        index = self.first_frame_after(start_at)
+        waited = 0      # Segundos de audio sin voz.
+
+        while True:
+            # Espera a que empiece la voz, conservando un poco del silencio anterior.
+            while True:
+                started_at, energy, data = self.frame(index)
+                index += 1
+                if cancelled and cancelled():
+                    raise ListenCancelled("Listening has been cancelled.")
+                if started_at <= start_at:  # Leído antes de start_at (p. ej., el aviso sonoro).
+                    continue
+                pre_roll.append(data)
+                waited += seconds_per_buffer
+                if energy > self.energy_threshold:
+                    break
+                if timeout and waited > timeout:
+                    raise ListenTimeout("No audio input has been detected.")
+
+            # Graba hasta que haya pause_threshold segundos de silencio.
+            frames = list(pre_roll)
+            sink = encoder(sample_rate, sample_width) if encoder else None
+            if sink:
+                sink.write(b"".join(frames))
+
+            held = []   # Silencio tras la voz que aún no se sabe si forma parte de la frase.
+            speaking = seconds_per_buffer
+            silence = 0
+            speech_ended_at = started_at
+
+            try:
+                while True:
+                    ended_at, energy, data = self.frame(index)
+                    index += 1
+                    if cancelled and cancelled():
+                        raise ListenCancelled("Listening has been cancelled.")
+
+                    if energy > self.energy_threshold:
+                        accepted = held + [data]
+                        held = []
+                        speaking += seconds_per_buffer
+                        silence = 0
+                        speech_ended_at = ended_at
+                    else:
+                        silence += seconds_per_buffer
+                        accepted = [data] if silence <= self.tail_duration else []
+                        if not accepted:
+                            held.append(data)
+
+                    if accepted:
+                        frames += accepted
+                        if sink:
+                            sink.write(b"".join(accepted))
+
+                    if silence >= self.pause_threshold:
+                        break
+                    if phrase_time_limit and speaking + silence >= phrase_time_limit:
+                        break
+
+            except BaseException:
+                if sink:
+                    sink.abort()
+                raise
+
+            if speaking >= self.phrase_threshold:   # Descarta ruidos demasiado cortos.
+                return Utterance(b"".join(frames), sample_rate, sample_width,
+                                 started_at, speech_ended_at, ended_at, sink)
+            if sink:
+                sink.abort()
+            pre_roll.clear()
+
+
+audio_capture = AudioCapture()  # Micrófono compartido por todas las funcionalidades.
+